@@ -0,0 +1,621 @@
+# Funções de análise independentes do Streamlit.
+# Filtros, gráficos e mapas usados pelo aplicativo e pelo relatório em lote
+# (report.py). Os avisos (ex.: "não há dados para exibir") não chamam o
+# Streamlit diretamente: passam pelos manipuladores configurados com
+# set_message_handlers; por padrão são registrados com o módulo logging.
+# O plotly e o folium são importados dentro das funções que os usam, apenas
+# quando o primeiro gráfico ou mapa é gerado.
+import logging
+
+from comparison import BASELINE_WINDOW, METRICS as COMPARISON_METRICS, PeriodComparison, period_label, period_matrix
+from filter_engine import (
+    combine_masks, crime_mask, date_mask, keyword_mask, location_mask, sector_mask, unit_mask
+)
+from geocache import resolve_address
+from hotspots import grid_dbscan, top_hotspots
+from schema import MESES, count_values
+from spatial import MAX_HEAT_POINTS, aggregate_points, extract_points, heat_data, zoom_for_points
+from temporal import FREQUENCIES, SHIFTS
+
+logger = logging.getLogger(__name__)
+
+# Manipuladores das mensagens exibidas ao usuário (nível -> função)
+_handlers = {
+    'warning': logger.warning,
+    'error': logger.error,
+}
+
+
+# Função para configurar os manipuladores de avisos e erros (None mantém o atual)
+def set_message_handlers(warning=None, error=None):
+    if warning is not None:
+        _handlers['warning'] = warning
+    if error is not None:
+        _handlers['error'] = error
+
+
+# Função para emitir um aviso pelo manipulador configurado
+def warn(message):
+    _handlers['warning'](message)
+
+
+# Função para emitir um erro pelo manipulador configurado
+def report_error(message):
+    _handlers['error'](message)
+
+
+# Função para filtrar os dados
+# Os índices de unidades e de texto, quando informados, devem corresponder às linhas de df
+def filter_data(df, start_date, end_date, crime_type, location, unit, keywords,
+                unit_index=None, text_index=None, sector=None):
+    mask = combine_masks([
+        date_mask(df, start_date, end_date),
+        crime_mask(df, crime_type),
+        location_mask(df, location),
+        sector_mask(df, sector),
+        unit_mask(df, unit, unit_index),
+        keyword_mask(df, keywords, text_index),
+    ])
+
+    if mask is None:
+        return df.copy()
+
+    return df[mask]
+
+
+# Função para contar as ocorrências por categoria de uma coluna (agregação
+# usada pelos gráficos de barras e de pizza); None se não houver dados
+def category_counts(df, column):
+    if df.empty:
+        return None
+
+    count_df = count_values(df[column]).reset_index()
+    count_df.columns = [column, 'Contagem']
+    return count_df
+
+
+# Função para desenhar o gráfico de barras a partir das contagens por categoria
+def draw_bar_chart(count_df, column, title, color='#1E3A8A'):
+    import plotly.express as px
+
+    if count_df is None:
+        warn("Não há dados para exibir no gráfico.")
+        return None
+
+    fig = px.bar(
+        count_df,
+        x=column,
+        y='Contagem',
+        title=title,
+        color_discrete_sequence=[color],
+        height=600  # Aumentar altura do gráfico
+    )
+
+    fig.update_layout(
+        xaxis_title=column,
+        yaxis_title="Número de Ocorrências",
+        template="plotly_white",
+        title_font_size=24,  # Aumentar tamanho do título
+        font=dict(size=16),  # Aumentar tamanho da fonte geral
+        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
+    )
+
+    return fig
+
+
+# Função para criar gráfico de barras
+def create_bar_chart(df, column, title, color='#1E3A8A'):
+    return draw_bar_chart(category_counts(df, column), column, title, color)
+
+
+# Função para contar as ocorrências por mês de referência e categoria de uma
+# coluna a partir do cubo de contagens dos dados filtrados; None se não houver dados
+def month_category_counts(cube, column):
+    if cube.total() == 0 or 'MES_REFERENCIA' not in cube.dimensions:
+        return None
+
+    # Somar as células do cubo por mês de referência e coluna selecionada
+    return cube.counts(['MES_REFERENCIA', column]).reset_index(name='Contagem')
+
+
+# Função para desenhar o gráfico de barras comparativo a partir das contagens por mês
+def draw_comparative_bar_chart(grouped, column):
+    import plotly.express as px
+
+    if grouped is None:
+        warn("Não há dados para comparação entre meses.")
+        return None
+
+    fig = px.bar(
+        grouped,
+        x=column,
+        y='Contagem',
+        color='MES_REFERENCIA',
+        title=f"Comparação de {column} por Mês",
+        barmode='group',
+        height=600  # Aumentar altura do gráfico
+    )
+
+    fig.update_layout(
+        xaxis_title=column,
+        yaxis_title="Número de Ocorrências",
+        legend_title="Mês",
+        template="plotly_white",
+        title_font_size=24,  # Aumentar tamanho do título
+        font=dict(size=16),  # Aumentar tamanho da fonte geral
+        legend=dict(font=dict(size=14)),  # Aumentar tamanho da fonte da legenda
+        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
+    )
+
+    return fig
+
+
+# Função para criar gráfico de barras comparativo por mês
+# (respondido pelo cubo de contagens dos dados filtrados)
+def create_comparative_bar_chart(cube, column):
+    return draw_comparative_bar_chart(month_category_counts(cube, column), column)
+
+
+# Função para calcular a variação percentual entre dois meses a partir do cubo;
+# retorna None se algum dos meses não tiver dados
+def compute_variation(cube, column, month1, month2):
+    pivot = cube.pivot(column, 'MES_REFERENCIA')
+
+    if month1 not in pivot.columns or month2 not in pivot.columns:
+        return None
+
+    # Calcular variação percentual
+    pivot['Variação'] = ((pivot[month2] - pivot[month1]) / pivot[month1] * 100).fillna(0)
+
+    # Filtrar apenas os tipos de crime com dados em ambos os meses
+    valid_rows = (pivot[month1] > 0) & (pivot[month2] > 0)
+    return pivot[valid_rows]
+
+
+# Função para criar gráfico de variação percentual
+# (respondido pelo cubo de contagens dos dados filtrados)
+def create_percentage_change_chart(cube, column, months):
+    import plotly.express as px
+
+    if cube.total() == 0 or 'MES_REFERENCIA' not in cube.dimensions or len(months) < 2:
+        warn("São necessários pelo menos dois meses para análise de variação.")
+        return None
+
+    # Calcular a variação percentual entre os meses selecionados
+    month1, month2 = months[0], months[1]
+    variation_data = compute_variation(cube, column, month1, month2)
+
+    if variation_data is None:
+        warn(f"Dados insuficientes para os meses {month1} e {month2}.")
+        return None
+
+    variation_data = variation_data.rename_axis(column).reset_index()
+
+    if variation_data.empty:
+        warn("Não há dados suficientes para calcular a variação percentual.")
+        return None
+
+    # Criar gráfico de barras para variação percentual
+    fig = px.bar(
+        variation_data,
+        x=column,
+        y='Variação',
+        title=f"Variação Percentual de {column} entre {month1} e {month2}",
+        color='Variação',
+        color_continuous_scale=['green', 'yellow', 'red'],
+        range_color=[-50, 50],
+        height=600  # Aumentar altura do gráfico
+    )
+
+    fig.update_layout(
+        xaxis_title=column,
+        yaxis_title="Variação Percentual (%)",
+        template="plotly_white",
+        title_font_size=24,  # Aumentar tamanho do título
+        font=dict(size=16),  # Aumentar tamanho da fonte geral
+        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
+    )
+
+    return fig
+
+
+# Função para criar o mapa de calor de uma métrica de comparação entre vários
+# períodos (categorias x períodos), calculada sobre uma única matriz do cubo
+def create_period_comparison_chart(cube, column, period_dimension, periods, metric, window=BASELINE_WINDOW):
+    import plotly.express as px
+
+    matrix = period_matrix(cube, column, period_dimension, periods)
+    matrix = matrix.loc[:, [period != -1 for period in matrix.columns]]
+
+    if matrix.empty or matrix.shape[1] < 2:
+        warn("São necessários pelo menos dois períodos com dados para a comparação.")
+        return None
+
+    values = PeriodComparison(matrix).metric(metric, window)
+    if period_dimension == 'PERIODO':
+        values.columns = [period_label(period) for period in values.columns]
+    else:
+        values.columns = values.columns.astype(str)
+
+    fig = px.imshow(
+        values,
+        text_auto='.1f',
+        aspect='auto',
+        color_continuous_scale=['green', 'yellow', 'red'],
+        color_continuous_midpoint=0,
+        title=COMPARISON_METRICS[metric],
+        height=600  # Aumentar altura do gráfico
+    )
+
+    fig.update_layout(
+        xaxis_title="Período",
+        yaxis_title=column,
+        template="plotly_white",
+        title_font_size=24,  # Aumentar tamanho do título
+        font=dict(size=16),  # Aumentar tamanho da fonte geral
+        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
+    )
+
+    return fig
+
+
+# Função para desenhar o gráfico de pizza a partir das contagens por categoria
+def draw_pie_chart(count_df, column, title):
+    import plotly.express as px
+
+    if count_df is None:
+        warn("Não há dados para exibir no gráfico.")
+        return None
+
+    fig = px.pie(
+        count_df,
+        names=column,
+        values='Contagem',
+        title=title,
+        color_discrete_sequence=px.colors.qualitative.Set3,
+        height=600  # Aumentar altura do gráfico
+    )
+
+    fig.update_layout(
+        template="plotly_white",
+        title_font_size=24,  # Aumentar tamanho do título
+        font=dict(size=16),  # Aumentar tamanho da fonte geral
+        legend=dict(font=dict(size=14)),  # Aumentar tamanho da fonte da legenda
+        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
+    )
+
+    return fig
+
+
+# Função para criar gráfico de pizza
+def create_pie_chart(df, column, title):
+    return draw_pie_chart(category_counts(df, column), column, title)
+
+
+# Função para contar as ocorrências por mês e tipo de crime (crimes
+# selecionados ou, sem seleção, os 5 mais comuns), na ordem dos meses; None
+# se não houver dados
+def crime_month_counts(df, selected_crimes=None):
+    if df.empty:
+        return None
+
+    # Se não houver mês de referência, usar o mês da data
+    if 'MES_REFERENCIA' not in df.columns:
+        df['MES_REFERENCIA'] = df['DATA_HORA'].dt.month.map({
+            1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril',
+            5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
+            9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
+        })
+
+    # Filtrar por crimes selecionados, se houver
+    if selected_crimes and len(selected_crimes) > 0:
+        df = df[df['EVENTO'].isin(selected_crimes)]
+    else:
+        # Se não houver crimes selecionados, usar os 5 mais comuns
+        top_crimes = count_values(df['EVENTO']).nlargest(5).index.tolist()
+        df = df[df['EVENTO'].isin(top_crimes)]
+
+    # Agrupar por mês e tipo de crime
+    grouped = df.groupby(['MES_REFERENCIA', 'EVENTO'], observed=True).size().reset_index(name='Contagem')
+
+    # Ordenar os meses corretamente
+    month_order = {month: i for i, month in enumerate(MESES)}
+    grouped['month_order'] = grouped['MES_REFERENCIA'].map(month_order)
+    return grouped.sort_values('month_order')
+
+
+# Função para desenhar a análise por tipo de crime a partir das contagens por mês
+def draw_crime_analysis(grouped):
+    import plotly.express as px
+
+    if grouped is None:
+        warn("Não há dados para exibir no gráfico.")
+        return None
+
+    # Criar gráfico de linhas
+    fig = px.line(
+        grouped,
+        x='MES_REFERENCIA',
+        y='Contagem',
+        color='EVENTO',
+        title="Análise de Crimes por Mês",
+        markers=True,
+        height=600,  # Aumentar altura do gráfico
+        category_orders={"MES_REFERENCIA": MESES}  # Garantir ordem correta dos meses
+    )
+
+    fig.update_layout(
+        xaxis_title="Mês",
+        yaxis_title="Número de Ocorrências",
+        legend_title="Tipo de Crime",
+        template="plotly_white",
+        title_font_size=24,  # Aumentar tamanho do título
+        font=dict(size=16),  # Aumentar tamanho da fonte geral
+        legend=dict(font=dict(size=14)),  # Aumentar tamanho da fonte da legenda
+        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
+    )
+
+    # Aumentar tamanho dos marcadores e linhas
+    fig.update_traces(
+        marker=dict(size=12),
+        line=dict(width=3)
+    )
+
+    return fig
+
+
+# Função para criar análise por tipo de crime ao longo dos meses
+def create_crime_analysis(df, selected_crimes=None):
+    return draw_crime_analysis(crime_month_counts(df, selected_crimes))
+
+
+# Função para criar a matriz de calor de ocorrências por dia da semana e hora
+def create_hour_weekday_heatmap(matrix, title="Ocorrências por Dia da Semana e Hora"):
+    import plotly.express as px
+
+    if matrix.to_numpy().sum() == 0:
+        warn("Não há ocorrências com data/hora para exibir no gráfico.")
+        return None
+
+    fig = px.imshow(
+        matrix,
+        labels=dict(x="Hora do dia", y="Dia da semana", color="Ocorrências"),
+        x=[f"{hour:02d}h" for hour in matrix.columns],
+        y=list(matrix.index),
+        color_continuous_scale="YlOrRd",
+        aspect="auto",
+        title=title,
+        height=500
+    )
+
+    fig.update_layout(
+        template="plotly_white",
+        title_font_size=24,
+        font=dict(size=16),
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+
+    return fig
+
+
+# Função para criar o gráfico de série temporal (diária ou semanal)
+def create_time_series_chart(series, freq='D'):
+    import plotly.express as px
+
+    if series.empty:
+        warn("Não há ocorrências com data/hora para exibir no gráfico.")
+        return None
+
+    long_df = series.reset_index().melt(id_vars='Data', var_name='Categoria', value_name='Contagem')
+
+    fig = px.line(
+        long_df,
+        x='Data',
+        y='Contagem',
+        color='Categoria' if len(series.columns) > 1 else None,
+        title=f"Série {FREQUENCIES[freq].lower()} de ocorrências",
+        markers=freq == 'W',
+        height=500
+    )
+
+    fig.update_layout(
+        xaxis_title="Semana" if freq == 'W' else "Dia",
+        yaxis_title="Número de Ocorrências",
+        legend_title="Tipo de Crime",
+        template="plotly_white",
+        title_font_size=24,
+        font=dict(size=16),
+        legend=dict(font=dict(size=14)),
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+
+    return fig
+
+
+# Função para criar o gráfico de ocorrências por turno (barras empilhadas)
+def create_shift_chart(table, column, top_n=15):
+    import plotly.express as px
+
+    if table.empty:
+        warn("Não há ocorrências com data/hora para exibir no gráfico.")
+        return None
+
+    long_df = table.head(top_n).reset_index().melt(id_vars=column, var_name='Turno', value_name='Contagem')
+
+    fig = px.bar(
+        long_df,
+        x=column,
+        y='Contagem',
+        color='Turno',
+        title=f"Ocorrências por Turno ({column.title()})",
+        category_orders={'Turno': [name for name, _, _ in SHIFTS]},
+        color_discrete_sequence=px.colors.sequential.Blues_r,
+        height=600
+    )
+
+    fig.update_layout(
+        xaxis_title=column.title(),
+        yaxis_title="Número de Ocorrências",
+        template="plotly_white",
+        title_font_size=24,
+        font=dict(size=16),
+        legend=dict(font=dict(size=14)),
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+
+    return fig
+
+
+# Função para criar o gráfico das etapas de uma execução em estilo flame graph:
+# cada barra vai do início ao fim da etapa, com um nível de aninhamento por linha
+def create_profile_chart(records):
+    import plotly.express as px
+
+    records = [record for record in records if record['duration_ms'] is not None]
+    if not records:
+        warn("Nenhuma etapa medida nesta execução.")
+        return None
+
+    levels = [f"Nível {record['depth']}" for record in records]
+    fig = px.bar(
+        {
+            'Etapa': [record['stage'] for record in records],
+            'Nível': levels,
+            'Início (ms)': [record['start_ms'] for record in records],
+            'Duração (ms)': [record['duration_ms'] for record in records],
+            'Linhas': [record['rows'] for record in records],
+        },
+        x='Duração (ms)',
+        y='Nível',
+        base='Início (ms)',
+        orientation='h',
+        color='Etapa',
+        text='Etapa',
+        hover_data=['Início (ms)', 'Linhas'],
+        title="Etapas da Execução",
+        category_orders={'Nível': sorted(set(levels), reverse=True)},
+        height=max(300, 120 + 60 * len(set(levels)))
+    )
+
+    fig.update_traces(textposition='inside', insidetextanchor='start')
+    fig.update_layout(
+        xaxis_title="Tempo desde o início da execução (ms)",
+        yaxis_title="",
+        showlegend=False,
+        barmode='overlay',
+        template="plotly_white",
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+
+    return fig
+
+
+# Função para montar o mapa (sem chamadas ao Streamlit) no modo escolhido:
+# calor, densidade por nível de zoom ou marcadores agrupados. Retorna o mapa
+# e uma nota sobre a agregação dos pontos (ou None)
+def build_map(lat, lon, aggregation='points', zoom=None, hotspots=None, mode='heat'):
+    import folium
+    from folium.plugins import HeatMap
+    from map_tiles import add_density_tiles, add_marker_clusters
+
+    if zoom is None:
+        zoom = zoom_for_points(lat, lon)
+
+    # Criar mapa centrado na média das coordenadas
+    m = folium.Map(location=[lat.mean(), lon.mean()], zoom_start=zoom, width='100%')
+
+    note = None
+    if mode == 'tiles':
+        bands = add_density_tiles(m, lat, lon)
+        note = f"{len(lat)} ocorrências pré-agregadas em {bands} faixas de zoom."
+    elif mode == 'cluster':
+        markers = add_marker_clusters(m, lat, lon)
+        note = f"{len(lat)} ocorrências agrupadas em {markers} marcadores."
+    else:
+        # Adicionar pontos de calor
+        heat_lat, heat_lon, weights = aggregate_points(lat, lon, aggregation, zoom)
+        HeatMap(heat_data(heat_lat, heat_lon, weights)).add_to(m)
+        if aggregation != 'points' or len(weights) < len(lat):
+            note = (
+                f"{len(lat)} ocorrências agregadas em {len(weights)} células "
+                f"(máximo de {MAX_HEAT_POINTS} pontos no mapa)."
+            )
+
+    # Adicionar os polígonos dos hotspots, se houver
+    if hotspots is not None and not hotspots.empty:
+        add_hotspot_polygons(m, hotspots)
+
+    return m, note
+
+
+# Função para desenhar os polígonos dos hotspots no mapa (células ranqueadas
+# ou agrupamentos), com a descrição de cada um ao passar o mouse
+def add_hotspot_polygons(m, hotspots):
+    import folium
+
+    layer = folium.FeatureGroup(name="Hotspots")
+    for record in hotspots.to_dict('records'):
+        if 'Agrupamento' in record:
+            tooltip = f"Agrupamento {record['Agrupamento']}: {record['Ocorrências']} ocorrências"
+        else:
+            group = f"{record['Grupo']} · " if record.get('Grupo') else ""
+            tooltip = (
+                f"{group}#{record['Posição']}: {record['Ocorrências']} ocorrências "
+                f"({record['Densidade (ocorr./km²)']:.0f}/km²)"
+            )
+        folium.Polygon(
+            locations=record['polygon'],
+            color='#B91C1C',
+            weight=2,
+            fill=True,
+            fill_opacity=0.25,
+            tooltip=tooltip
+        ).add_to(layer)
+    layer.add_to(m)
+
+
+# Função para detectar hotspots nas coordenadas do DataFrame. settings traz o
+# método ('kde' ou 'dbscan'), os parâmetros e a coluna de agrupamento do
+# ranking (None, uma coluna ou lista de colunas)
+def detect_hotspots(df, settings):
+    lat, lon, valid = extract_points(df, with_mask=True)
+    if settings['method'] == 'dbscan':
+        _, clusters = grid_dbscan(lat, lon, settings['eps_m'], settings['min_points'])
+        return _with_invalid(clusters.head(settings['top_n']), valid)
+
+    labels = None
+    if settings['group_by']:
+        columns = settings['group_by']
+        labels = df[columns[0]].astype(str).to_numpy()[valid]
+        for column in columns[1:]:
+            labels = labels + " · " + df[column].astype(str).to_numpy()[valid]
+    return _with_invalid(top_hotspots(lat, lon, settings['top_n'], labels, settings['cell_m']), valid)
+
+
+# Função para registrar no resultado as ocorrências sem coordenadas válidas
+def _with_invalid(result, valid):
+    result.attrs['invalid'] = int(len(valid) - valid.sum())
+    return result
+
+
+# Função para gerar o HTML do mapa das coordenadas (sem chamadas ao Streamlit,
+# para ser guardado por estado dos filtros). Retorna (HTML ou None, mensagem)
+def render_coordinate_map(df, aggregation='points', zoom=None, hotspots=None, mode='heat'):
+    from map_tiles import map_html
+
+    lat, lon = extract_points(df)
+    if len(lat) == 0:
+        return None, "Não há coordenadas válidas para exibir no mapa."
+
+    m, note = build_map(lat, lon, aggregation, zoom, hotspots, mode)
+    return map_html(m), note
+
+
+# Função para geocodificar um endereço com o cache persistente e o
+# geocodificador informados (provider None: apenas o cache)
+def locate_address(store, provider, municipio, logradouro, numero, bairro):
+    try:
+        return resolve_address(store, provider, municipio, logradouro, numero, bairro)
+    except Exception as e:
+        report_error(f"Erro ao geocodificar endereço: {e}")
+        return None
@@ -1,27 +1,33 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import folium
-from folium.plugins import HeatMap
-from streamlit_folium import folium_static
-import datetime
-import io
-from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
-from openpyxl.chart import BarChart, Reference, PieChart
-from openpyxl.drawing.image import Image
-import matplotlib.pyplot as plt
-import os
-from pptx import Presentation
-from pptx.util import Inches, Pt
-from pptx.enum.text import PP_ALIGN
-from pptx.dml.color import RGBColor
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
-import time
 import uuid
-from PIL import Image as PILImage
+from ingest import ingest
+from dataset_store import DATASET_CACHE_ENTRIES, DatasetRegistry
+from schema import MESES, count_values, memory_mb, memory_report
+from unit_index import UnitIndex, extract_units
+from cube import COUNT_COLUMN, TEMPORAL_DIMENSIONS, CountCube
+from combined import COMBINED_CACHE_ENTRIES, CombinedView
+from sectors import SECTOR_COLUMN, SectorMap
+from spatial import MAP_MODES
+from comparison import BASELINE_WINDOW, METRICS as COMPARISON_METRICS
+from text_index import TEXT_INDEX_SUFFIX, MultiTextIndex, load_or_build
+from geocache import GEOCODER, GeocodeStore, geocode_batch, make_provider
+from filter_engine import FilterEngine
+from exports import excel_bytes, ppt_bytes
+from export_jobs import DONE, QUEUED, RUNNING, ExportJobManager
+from temporal import FREQUENCIES, SHIFTS, hour_weekday_matrix, shift_table, time_series
+from hotspots import CLUSTER_EPS_METERS, CLUSTER_MIN_POINTS, HOTSPOT_CELL_METERS, METHODS as HOTSPOT_METHODS
+from analysis import (
+    build_map, category_counts, compute_variation, create_hour_weekday_heatmap,
+    create_percentage_change_chart, create_period_comparison_chart, create_profile_chart, create_shift_chart,
+    create_time_series_chart, crime_month_counts, detect_hotspots, draw_bar_chart,
+    draw_comparative_bar_chart, draw_crime_analysis, draw_pie_chart, locate_address,
+    month_category_counts, render_coordinate_map, set_message_handlers
+)
+from figure_cache import FigureCache, mask_hash
+from instrumentation import PROFILE_ENABLED, finish_run, stage, start_run, track_cache
 
 # Configuração da página
 st.set_page_config(
@@ -108,353 +114,186 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Função para ler o logo uma única vez por processo (e não a cada execução do script)
+@st.cache_resource
+def load_logo(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
 # Adicionar logo no canto superior direito
 logo_path = "assets/pmms_logo.png"
-logo_image = PILImage.open(logo_path)
 logo_col1, logo_col2 = st.columns([4, 1])
 with logo_col2:
-    st.image(logo_image, width=150)
+    st.image(load_logo(logo_path), width=150)
 
 # Inicializar estado da sessão para armazenar múltiplas planilhas
-if 'dataframes' not in st.session_state:
-    st.session_state.dataframes = {}  # Dicionário para armazenar múltiplos DataFrames
+# (os dados ficam no registro de bases do servidor; a sessão guarda apenas os identificadores)
+if 'datasets' not in st.session_state:
+    st.session_state.datasets = {}  # Mês -> identificador da base no registro
 
 if 'active_dataframes' not in st.session_state:
     st.session_state.active_dataframes = []  # Lista para controlar quais DataFrames estão ativos
 
-# Meses do ano para seleção
-MESES = [
-    "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
-    "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
-]
+if 'filter_engine' not in st.session_state:
+    st.session_state.filter_engine = FilterEngine()  # Máscaras de filtro reaproveitadas entre interações
 
-# Função para extrair unidades individuais de uma string com múltiplas unidades
-def extract_units(unit_string):
-    if pd.isna(unit_string):
-        return []
-    
-    # Dividir por ponto e vírgula para separar múltiplas unidades
-    units = [unit.strip() for unit in str(unit_string).split(';')]
-    return units
+if 'sector_map' not in st.session_state:
+    st.session_state.sector_map = None  # Setores de policiamento carregados (GeoJSON)
+
+if 'export_owner' not in st.session_state:
+    st.session_state.export_owner = uuid.uuid4().hex  # Identifica as exportações desta sessão na fila
 
 # Função para carregar os dados
-@st.cache_data
-def load_data(file, month_name=None):
-    df = pd.read_excel(file)
-    
-    # Converter colunas de data e hora para datetime
-    df['DATA_HORA'] = pd.to_datetime(
-        df['DATA DE INÍCIO DO ATENDIMENTO'] + ' ' + df['HORA DE INÍCIO DO ATENDIMENTO'],
-        format='%d/%m/%Y %H:%M:%S',
-        errors='coerce'
-    )
-    
-    # Adicionar coluna com o nome do mês para identificação
-    if month_name:
-        df['MES_REFERENCIA'] = month_name
-    
-    return df
+# A leitura passa pela camada de ingestão, que reaproveita o snapshot colunar
+# da planilha (identificado pelo hash do conteúdo) entre sessões e reinícios;
+# o DataFrame não é guardado em cache aqui, pois o registro de bases mantém
+# em memória apenas as bases em uso.
+# Com streaming=True a planilha é lida em blocos, limitando o uso de memória
+def load_data(file, month_name=None, streaming=None):
+    with stage("load_data"):
+        return ingest(file, month_name, streaming)
 
-# Função para combinar múltiplos DataFrames
-def combine_dataframes(dataframes_dict, active_keys=None):
-    if not dataframes_dict:
-        return pd.DataFrame()
-    
-    # Se active_keys não for fornecido, use todas as chaves
-    if active_keys is None or len(active_keys) == 0:
-        active_keys = list(dataframes_dict.keys())
-    
-    # Filtrar apenas os DataFrames ativos
-    active_dfs = [dataframes_dict[key] for key in active_keys if key in dataframes_dict]
-    
-    if not active_dfs:
-        return pd.DataFrame()
-    
-    # Combinar os DataFrames
-    combined_df = pd.concat(active_dfs, ignore_index=True)
-    return combined_df
+# Função para obter o registro de bases mensais (compartilhado entre sessões)
+@st.cache_resource
+def get_dataset_registry():
+    return DatasetRegistry()
 
-# Função para filtrar os dados
-def filter_data(df, start_date, end_date, crime_type, location, unit, keywords):
-    filtered_df = df.copy()
-    
-    # Filtro de data
-    if start_date and end_date:
-        filtered_df = filtered_df[
-            (filtered_df['DATA_HORA'] >= pd.to_datetime(start_date)) & 
-            (filtered_df['DATA_HORA'] <= pd.to_datetime(end_date))
-        ]
-    
-    # Filtro de tipo de crime
-    if crime_type:
-        filtered_df = filtered_df[filtered_df['EVENTO'].isin(crime_type)]
-    
-    # Filtro de localidade
-    if location:
-        filtered_df = filtered_df[filtered_df['ÁREA URBANA'].isin(location)]
-    
-    # Filtro de unidade responsável - modificado para tratar múltiplas unidades
-    if unit:
-        # Criar uma máscara para filtrar registros que contêm qualquer uma das unidades selecionadas
-        mask = filtered_df['UNIDADE DA VIATURA'].apply(
-            lambda x: any(selected_unit in extract_units(x) for selected_unit in unit)
-        )
-        filtered_df = filtered_df[mask]
-    
-    # Filtro de palavras-chave
-    if keywords:
-        # Combinar históricos e evoluções para busca
-        filtered_df = filtered_df[
-            filtered_df['HISTÓRICOS'].str.contains(keywords, case=False, na=False) | 
-            filtered_df['EVOLUÇÕES'].str.contains(keywords, case=False, na=False)
-        ]
-    
-    return filtered_df
+# Função para obter os DataFrames dos meses da sessão (somente leitura,
+# compartilhados com as demais sessões que usam as mesmas bases). Bases
+# removidas do servidor pelo limite de espaço saem da sessão
+def session_dataframes():
+    registry = get_dataset_registry()
+    dataframes = {}
+    for month, dataset_id in list(st.session_state.datasets.items()):
+        try:
+            dataframes[month] = registry.load(dataset_id)
+        except OSError:
+            del st.session_state.datasets[month]
+            if month in st.session_state.active_dataframes:
+                st.session_state.active_dataframes.remove(month)
+            st.warning(f"A base de {month} foi removida do servidor e precisa ser carregada novamente.")
+    return dataframes
 
-# Função para criar gráfico de barras
-def create_bar_chart(df, column, title, color='#1E3A8A'):
-    if df.empty:
-        st.warning("Não há dados para exibir no gráfico.")
-        return None
-    
-    count_df = df[column].value_counts().reset_index()
-    count_df.columns = [column, 'Contagem']
-    
-    fig = px.bar(
-        count_df, 
-        x=column, 
-        y='Contagem',
-        title=title,
-        color_discrete_sequence=[color],
-        height=600  # Aumentar altura do gráfico
-    )
-    
-    fig.update_layout(
-        xaxis_title=column,
-        yaxis_title="Número de Ocorrências",
-        template="plotly_white",
-        title_font_size=24,  # Aumentar tamanho do título
-        font=dict(size=16),  # Aumentar tamanho da fonte geral
-        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
-    )
-    
-    return fig
+# Função para obter os códigos de setor das ocorrências de uma base (calculados
+# uma vez por base e arquivo de setores, compartilhados entre sessões)
+@track_cache("build_sector_codes", st.cache_resource(max_entries=DATASET_CACHE_ENTRIES))
+def build_sector_codes(dataset_id, sectors_key, _sector_map):
+    return _sector_map.sector_codes(get_dataset_registry().load(dataset_id))
 
-# Função para criar gráfico de barras comparativo por mês
-def create_comparative_bar_chart(df, column):
-    if df.empty or 'MES_REFERENCIA' not in df.columns:
-        st.warning("Não há dados para comparação entre meses.")
-        return None
-    
-    # Agrupar por mês de referência e coluna selecionada
-    grouped = df.groupby(['MES_REFERENCIA', column]).size().reset_index(name='Contagem')
-    
-    fig = px.bar(
-        grouped,
-        x=column,
-        y='Contagem',
-        color='MES_REFERENCIA',
-        title=f"Comparação de {column} por Mês",
-        barmode='group',
-        height=600  # Aumentar altura do gráfico
-    )
-    
-    fig.update_layout(
-        xaxis_title=column,
-        yaxis_title="Número de Ocorrências",
-        legend_title="Mês",
-        template="plotly_white",
-        title_font_size=24,  # Aumentar tamanho do título
-        font=dict(size=16),  # Aumentar tamanho da fonte geral
-        legend=dict(font=dict(size=14)),  # Aumentar tamanho da fonte da legenda
-        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
-    )
-    
-    return fig
+# Função para obter o índice de unidades de uma base (construído uma vez por
+# base e compartilhado entre sessões)
+@track_cache("build_unit_index", st.cache_resource(max_entries=DATASET_CACHE_ENTRIES))
+def build_unit_index(dataset_id):
+    df = get_dataset_registry().load(dataset_id)
+    return UnitIndex.build(df['UNIDADE DA VIATURA'])
 
-# Função para criar gráfico de variação percentual
-def create_percentage_change_chart(df, column, months):
-    if df.empty or 'MES_REFERENCIA' not in df.columns or len(months) < 2:
-        st.warning("São necessários pelo menos dois meses para análise de variação.")
-        return None
-    
-    # Agrupar por mês e coluna selecionada
-    grouped = df.groupby(['MES_REFERENCIA', column]).size().reset_index(name='Contagem')
-    
-    # Criar um pivot para facilitar o cálculo
-    pivot = grouped.pivot(index=column, columns='MES_REFERENCIA', values='Contagem').fillna(0)
-    
-    # Calcular a variação percentual entre os meses selecionados
-    month1, month2 = months[0], months[1]
-    
-    if month1 not in pivot.columns or month2 not in pivot.columns:
-        st.warning(f"Dados insuficientes para os meses {month1} e {month2}.")
-        return None
-    
-    # Calcular variação percentual
-    pivot['Variação'] = ((pivot[month2] - pivot[month1]) / pivot[month1] * 100).fillna(0)
-    
-    # Filtrar apenas os tipos de crime com dados em ambos os meses
-    valid_rows = (pivot[month1] > 0) & (pivot[month2] > 0)
-    variation_data = pivot[valid_rows].reset_index()
-    
-    if variation_data.empty:
-        st.warning("Não há dados suficientes para calcular a variação percentual.")
-        return None
-    
-    # Criar gráfico de barras para variação percentual
-    fig = px.bar(
-        variation_data,
-        x=column,
-        y='Variação',
-        title=f"Variação Percentual de {column} entre {month1} e {month2}",
-        color='Variação',
-        color_continuous_scale=['green', 'yellow', 'red'],
-        range_color=[-50, 50],
-        height=600  # Aumentar altura do gráfico
-    )
-    
-    fig.update_layout(
-        xaxis_title=column,
-        yaxis_title="Variação Percentual (%)",
-        template="plotly_white",
-        title_font_size=24,  # Aumentar tamanho do título
-        font=dict(size=16),  # Aumentar tamanho da fonte geral
-        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
-    )
-    
-    return fig
+# Função para obter o índice de unidades de um mês da sessão
+def get_unit_index(month):
+    return build_unit_index(st.session_state.datasets[month])
 
-# Função para criar gráfico de pizza
-def create_pie_chart(df, column, title):
-    if df.empty:
-        st.warning("Não há dados para exibir no gráfico.")
-        return None
-    
-    count_df = df[column].value_counts().reset_index()
-    count_df.columns = [column, 'Contagem']
-    
-    fig = px.pie(
-        count_df, 
-        names=column, 
-        values='Contagem',
-        title=title,
-        color_discrete_sequence=px.colors.qualitative.Set3,
-        height=600  # Aumentar altura do gráfico
-    )
-    
-    fig.update_layout(
-        template="plotly_white",
-        title_font_size=24,  # Aumentar tamanho do título
-        font=dict(size=16),  # Aumentar tamanho da fonte geral
-        legend=dict(font=dict(size=14)),  # Aumentar tamanho da fonte da legenda
-        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
-    )
-    
-    return fig
+# Função para obter o índice de texto de uma base. O índice é salvo ao lado
+# do arquivo da base, de forma que reinícios do servidor não precisem reconstruí-lo
+@track_cache("build_text_index", st.cache_resource(max_entries=DATASET_CACHE_ENTRIES))
+def build_text_index(dataset_id):
+    registry = get_dataset_registry()
+    return load_or_build(registry.load(dataset_id), registry.path(dataset_id, TEXT_INDEX_SUFFIX))
 
-# Função para criar análise por tipo de crime ao longo dos meses
-def create_crime_analysis(df, selected_crimes=None):
-    if df.empty:
-        st.warning("Não há dados para exibir no gráfico.")
-        return None
-    
-    # Se não houver mês de referência, usar o mês da data
-    if 'MES_REFERENCIA' not in df.columns:
-        df['MES_REFERENCIA'] = df['DATA_HORA'].dt.month.map({
-            1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril',
-            5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
-            9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
-        })
-    
-    # Filtrar por crimes selecionados, se houver
-    if selected_crimes and len(selected_crimes) > 0:
-        df = df[df['EVENTO'].isin(selected_crimes)]
-    else:
-        # Se não houver crimes selecionados, usar os 5 mais comuns
-        top_crimes = df['EVENTO'].value_counts().nlargest(5).index.tolist()
-        df = df[df['EVENTO'].isin(top_crimes)]
-    
-    # Agrupar por mês e tipo de crime
-    grouped = df.groupby(['MES_REFERENCIA', 'EVENTO']).size().reset_index(name='Contagem')
-    
-    # Ordenar os meses corretamente
-    month_order = {month: i for i, month in enumerate(MESES)}
-    grouped['month_order'] = grouped['MES_REFERENCIA'].map(month_order)
-    grouped = grouped.sort_values('month_order')
-    
-    # Criar gráfico de linhas
-    fig = px.line(
-        grouped,
-        x='MES_REFERENCIA',
-        y='Contagem',
-        color='EVENTO',
-        title="Análise de Crimes por Mês",
-        markers=True,
-        height=600,  # Aumentar altura do gráfico
-        category_orders={"MES_REFERENCIA": MESES}  # Garantir ordem correta dos meses
-    )
-    
-    fig.update_layout(
-        xaxis_title="Mês",
-        yaxis_title="Número de Ocorrências",
-        legend_title="Tipo de Crime",
-        template="plotly_white",
-        title_font_size=24,  # Aumentar tamanho do título
-        font=dict(size=16),  # Aumentar tamanho da fonte geral
-        legend=dict(font=dict(size=14)),  # Aumentar tamanho da fonte da legenda
-        margin=dict(l=50, r=50, t=80, b=50)  # Ajustar margens
-    )
-    
-    # Aumentar tamanho dos marcadores e linhas
-    fig.update_traces(
-        marker=dict(size=12),
-        line=dict(width=3)
+# Função para obter o índice de texto de um mês da sessão
+def get_text_index(month):
+    return build_text_index(st.session_state.datasets[month])
+
+# Função para obter o cubo de contagens de uma base (construído uma vez por base)
+@track_cache("build_month_cube", st.cache_resource(max_entries=DATASET_CACHE_ENTRIES))
+def build_month_cube(dataset_id):
+    return CountCube.build(get_dataset_registry().load(dataset_id))
+
+# Função para obter o cubo temporal (hora e dia da semana) de uma base
+@track_cache("build_month_temporal_cube", st.cache_resource(max_entries=DATASET_CACHE_ENTRIES))
+def build_month_temporal_cube(dataset_id):
+    return CountCube.build(get_dataset_registry().load(dataset_id), TEMPORAL_DIMENSIONS)
+
+# Função para combinar as bases (mês -> identificador) em uma visão com o
+# intervalo de linhas de cada mês (a seleção de meses é feita depois, por
+# máscara). Com setores carregados, a visão recebe a coluna SETOR calculada por base
+def combine_dataframes(datasets, sector_map=None):
+    registry = get_dataset_registry()
+    with stage("combine_dataframes") as timing:
+        view = CombinedView.build({month: registry.load(dataset_id) for month, dataset_id in datasets.items()})
+        
+        if sector_map is not None and datasets:
+            codes = np.concatenate([
+                build_sector_codes(dataset_id, sector_map.key, sector_map) for dataset_id in datasets.values()
+            ])
+            view.df[SECTOR_COLUMN] = sector_map.categorical(codes)
+        timing.rows = len(view.df)
+    return view
+
+# Função para montar os dados combinados de um conjunto de bases: visão com
+# todos os meses, índices de unidades e de texto e cubos, na ordem dos meses.
+# A combinação é feita uma única vez por conjunto de bases e setores e
+# compartilhada entre as sessões, que guardam só os identificadores e as
+# máscaras dos filtros (os dados são somente leitura)
+@track_cache("build_combined_data", st.cache_resource(max_entries=COMBINED_CACHE_ENTRIES))
+def build_combined_data(datasets, sectors_key, _sector_map):
+    datasets = dict(datasets)
+    registry = get_dataset_registry()
+    return (
+        combine_dataframes(datasets, _sector_map),
+        UnitIndex.concat([build_unit_index(dataset_id) for dataset_id in datasets.values()]),
+        MultiTextIndex([
+            (build_text_index(dataset_id), registry.load(dataset_id)) for dataset_id in datasets.values()
+        ]),
+        CountCube.concat(build_month_cube(dataset_id) for dataset_id in datasets.values()),
+        CountCube.concat(build_month_temporal_cube(dataset_id) for dataset_id in datasets.values()),
     )
-    
-    return fig
+
+# Função para registrar um mês carregado no servidor (gravado uma única vez por
+# planilha) e associá-lo à sessão; retorna o DataFrame compartilhado
+def store_dataframe(month_name, df, source_name=None):
+    dataset_id = get_dataset_registry().register(df, month_name, source_name)
+    st.session_state.datasets[month_name] = dataset_id
+    
+    # Preparar os índices da base antes do primeiro filtro
+    get_unit_index(month_name)
+    get_text_index(month_name)
+    return get_dataset_registry().load(dataset_id)
+
+# Função para obter a visão combinada de todos os meses da sessão. Os dados
+# combinados vêm do cache compartilhado e são repassados ao motor de filtros a
+# cada execução (a sessão guarda só os identificadores e as máscaras); o motor
+# só descarta as máscaras quando um mês é carregado ou removido ou os setores
+# mudam (ligar e desligar meses na análise não copia dados)
+def get_combined_data(engine):
+    session_dataframes()  # Retira da sessão as bases removidas do servidor
+    sector_map = st.session_state.sector_map
+    datasets = tuple(st.session_state.datasets.items())
+    sectors_key = sector_map.key if sector_map else None
+    
+    with stage("get_combined_data") as timing:
+        engine.set_data((datasets, sectors_key), build_combined_data(datasets, sectors_key, sector_map))
+        timing.rows = len(engine.df)
+    return engine.view, engine.unit_index
+
+# Função para obter o cache persistente de geocodificação (compartilhado entre sessões)
+@st.cache_resource
+def get_geocode_store():
+    return GeocodeStore()
+
+# Função para obter o geocodificador configurado (Nominatim, base local ou offline)
+@st.cache_resource
+def get_geocoder():
+    return make_provider()
 
 # Função para geocodificar endereços
-@st.cache_data
-def geocode_address(municipio, logradouro, numero, bairro):
-    try:
-        # Inicializar o geocodificador
-        geolocator = Nominatim(user_agent="crime_analysis_app")
-        
-        # Construir o endereço completo
-        address = f"{logradouro}, {numero}, {bairro}, {municipio}, Brasil"
-        
-        # Geocodificar o endereço
-        location = geolocator.geocode(address, timeout=10)
-        
-        # Se não encontrar, tentar sem o número
-        if location is None:
-            address = f"{logradouro}, {bairro}, {municipio}, Brasil"
-            location = geolocator.geocode(address, timeout=10)
-        
-        # Se ainda não encontrar, tentar apenas com município e bairro
-        if location is None:
-            address = f"{bairro}, {municipio}, Brasil"
-            location = geolocator.geocode(address, timeout=10)
-            
-        # Se ainda não encontrar, tentar apenas com município
-        if location is None:
-            address = f"{municipio}, Brasil"
-            location = geolocator.geocode(address, timeout=10)
-        
-        if location:
-            return (location.latitude, location.longitude)
-        else:
-            return None
-    except (GeocoderTimedOut, GeocoderUnavailable):
-        # Em caso de timeout ou serviço indisponível
-        return None
-    except Exception as e:
-        st.error(f"Erro ao geocodificar endereço: {e}")
-        return None
+# Cada nível de fallback (com número, sem número, bairro e município) é
+# consultado primeiro no cache persistente; no modo offline o endereço é
+# resolvido apenas pelo cache, sem acessar o serviço externo
+def geocode_address(municipio, logradouro, numero, bairro, offline=False):
+    provider = None if offline else get_geocoder()
+    return locate_address(get_geocode_store(), provider, municipio, logradouro, numero, bairro)
 
 # Função para criar mapa de calor usando endereços
-def create_heatmap_from_addresses(df):
+def create_heatmap_from_addresses(df, offline=False, aggregation='points', zoom=None, mode='heat'):
     if df.empty:
         st.warning("Não há dados para exibir no mapa.")
         return None
@@ -467,302 +306,165 @@ def create_heatmap_from_addresses(df):
         st.warning(f"Colunas necessárias ausentes: {', '.join(missing_columns)}")
         return None
     
-    # Criar um DataFrame para armazenar as coordenadas
-    coords_df = pd.DataFrame(columns=['lat', 'lon'])
-    
     # Barra de progresso
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    # Limitar a quantidade de endereços para geocodificação (para evitar sobrecarga da API)
-    sample_size = min(500, len(df))
-    df_sample = df.sample(sample_size) if len(df) > sample_size else df
-    
-    # Geocodificar endereços
+    # Geocodificar em lote: endereços repetidos são consultados uma única vez,
+    # o cache persistente é lido de uma vez e as ausências vão para o geocodificador
     status_text.text("Geocodificando endereços... Isso pode levar alguns minutos.")
     
-    coords_list = []
-    for i, (_, row) in enumerate(df_sample.iterrows()):
-        # Atualizar barra de progresso
-        progress = int((i + 1) / len(df_sample) * 100)
-        progress_bar.progress(progress)
-        
-        # Obter valores das colunas, tratando valores ausentes
-        municipio = str(row['MUNICÍPIO']) if pd.notna(row['MUNICÍPIO']) else ""
-        logradouro = str(row['LOGRADOURO']) if pd.notna(row['LOGRADOURO']) else ""
-        numero = str(row['NÚMERO DO LOGRADOURO']) if pd.notna(row['NÚMERO DO LOGRADOURO']) else ""
-        bairro = str(row['BAIRRO']) if pd.notna(row['BAIRRO']) else ""
-        
-        # Pular se não houver informações suficientes
-        if not (municipio and (logradouro or bairro)):
-            continue
-        
-        # Geocodificar o endereço
-        coords = geocode_address(municipio, logradouro, numero, bairro)
-        
-        if coords:
-            coords_list.append(coords)
-        
-        # Adicionar um pequeno atraso para evitar sobrecarregar a API
-        time.sleep(0.1)
+    coords, stats = geocode_batch(
+        df,
+        get_geocode_store(),
+        None if offline else get_geocoder(),
+        progress=lambda done, total: progress_bar.progress(int(done / total * 100))
+    )
     
     # Limpar a barra de progresso e o texto de status
     progress_bar.empty()
     status_text.empty()
     
+    coords = coords.dropna()
+    
     # Verificar se há coordenadas válidas
-    if not coords_list:
+    if coords.empty:
         st.warning("Não foi possível geocodificar nenhum endereço. Verifique os dados de endereço.")
         return None
     
-    # Criar mapa centrado na média das coordenadas
-    center_lat = sum(lat for lat, _ in coords_list) / len(coords_list)
-    center_lon = sum(lon for _, lon in coords_list) / len(coords_list)
-    
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=12, width='100%')
-    
-    # Adicionar pontos de calor
-    HeatMap(coords_list).add_to(m)
+    st.caption(
+        f"{len(coords)} de {stats['rows']} ocorrências geocodificadas a partir de "
+        f"{stats['addresses']} endereços únicos ({stats['from_cache']} do cache, "
+        f"{stats['looked_up']} consultados, {stats['failed']} com falha do geocodificador)."
+    )
     
-    return m
+    return build_heatmap(
+        coords['lat'].to_numpy(dtype='float64'),
+        coords['lon'].to_numpy(dtype='float64'),
+        aggregation,
+        zoom,
+        mode=mode
+    )
 
-# Função para criar mapa de calor usando coordenadas existentes
-def create_heatmap_from_coordinates(df):
-    if df.empty:
-        st.warning("Não há dados para exibir no mapa.")
-        return None
-    
-    # Verificar se há coordenadas válidas
-    df['COORDENADA X'] = pd.to_numeric(df['COORDENADA X'], errors='coerce')
-    df['COORDENADA y'] = pd.to_numeric(df['COORDENADA y'], errors='coerce')
-    
-    # Filtrar apenas registros com coordenadas válidas
-    valid_coords = df.dropna(subset=['COORDENADA X', 'COORDENADA y'])
-    
-    if valid_coords.empty:
-        st.warning("Não há coordenadas válidas para exibir no mapa.")
-        return None
-    
-    # Criar mapa centrado na média das coordenadas
-    center_lat = valid_coords['COORDENADA y'].mean()
-    center_lon = valid_coords['COORDENADA X'].mean()
-    
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=12, width='100%')
-    
-    # Adicionar pontos de calor
-    heat_data = [[row['COORDENADA y'], row['COORDENADA X']] for _, row in valid_coords.iterrows()]
-    HeatMap(heat_data).add_to(m)
-    
+# Função para criar o mapa de calor a partir de arrays de latitude e longitude,
+# agregando os pontos no servidor conforme o modo e o zoom escolhidos
+def build_heatmap(lat, lon, aggregation='points', zoom=None, hotspots=None, mode='heat'):
+    m, note = build_map(lat, lon, aggregation, zoom, hotspots, mode)
+    if note:
+        st.caption(note)
     return m
 
+# Função para obter o cache de gráficos (compartilhado entre sessões)
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
+# Função para obter um gráfico do cache. A agregação é identificada pela versão
+# dos dados, pelo hash da máscara dos filtros (calculado uma vez por estado dos
+# filtros), pelo escopo (ex.: mês exibido) e pela agregação; a figura, também
+# pelo estilo. Com spec=True retorna a especificação JSON (para a exportação)
+def cached_chart(engine, scope, aggregation, style, aggregate, draw, spec=False):
+    rows = engine.derived('mask_hash', lambda: mask_hash(engine.mask()))
+    key = (engine.data_key, rows, scope) + aggregation
+    cache = get_figure_cache()
+    with stage(f"chart:{style[0]}:{aggregation[0]}"):
+        return (cache.spec if spec else cache.figure)(key, style, aggregate, draw)
+
+# Funções para os gráficos de barras, pizza, análise por mês e comparativo
+# a partir do cache (barras e pizza compartilham a mesma contagem)
+def bar_chart(engine, scope, df, column, title, color='#1E3A8A', spec=False):
+    return cached_chart(
+        engine, scope, ('counts', column), ('bar', title, color),
+        lambda: category_counts(df, column),
+        lambda counts: draw_bar_chart(counts, column, title, color),
+        spec
+    )
+
+def pie_chart(engine, scope, df, column, title, spec=False):
+    return cached_chart(
+        engine, scope, ('counts', column), ('pie', title),
+        lambda: category_counts(df, column),
+        lambda counts: draw_pie_chart(counts, column, title),
+        spec
+    )
+
+def crime_analysis_chart(engine, scope, df, selected_crimes=None, spec=False):
+    crimes = tuple(sorted(selected_crimes)) if selected_crimes else None
+    return cached_chart(
+        engine, scope, ('crime_month', crimes), ('line',),
+        lambda: crime_month_counts(df, selected_crimes),
+        draw_crime_analysis,
+        spec
+    )
+
+def comparative_chart(engine, scope, cube, column, spec=False):
+    return cached_chart(
+        engine, scope, ('month_counts', column), ('grouped_bar',),
+        lambda: month_category_counts(cube, column),
+        lambda grouped: draw_comparative_bar_chart(grouped, column),
+        spec
+    )
+
 # Função para exportar para Excel
-def export_to_excel(df):
-    output = io.BytesIO()
-    
-    # Criar um novo workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Dados Criminais"
-    
-    # Adicionar os dados
-    for r in dataframe_to_rows(df, index=False, header=True):
-        ws.append(r)
-    
-    # Criar uma nova aba para gráficos
-    ws_charts = wb.create_sheet(title="Gráficos")
-    
-    # Adicionar dados para gráficos
-    crime_counts = df['EVENTO'].value_counts().reset_index()
-    crime_counts.columns = ['Tipo de Crime', 'Contagem']
-    
-    for r in dataframe_to_rows(crime_counts, index=False, header=True):
-        ws_charts.append(r)
-    
-    # Criar gráfico de barras
-    chart = BarChart()
-    chart.title = "Ocorrências por Tipo de Crime"
-    chart.x_axis.title = "Tipo de Crime"
-    chart.y_axis.title = "Contagem"
-    
-    data = Reference(ws_charts, min_col=2, min_row=1, max_row=len(crime_counts)+1)
-    cats = Reference(ws_charts, min_col=1, min_row=2, max_row=len(crime_counts)+1)
-    chart.add_data(data, titles_from_data=True)
-    chart.set_categories(cats)
-    
-    ws_charts.add_chart(chart, "A10")
-    
-    # Salvar o workbook
-    wb.save(output)
-    output.seek(0)
-    
-    return output
+# Exportações grandes usam abas write-only gravadas em blocos e são divididas
+# em várias abas de dados quando ultrapassam o limite de linhas do Excel
+def export_to_excel(df, streaming=None, progress=None):
+    return excel_bytes(df, streaming, progress=progress)
 
 # Função para exportar para PowerPoint
-def export_to_ppt(df, bar_fig, pie_fig, analysis_fig, comparative_fig=None):
-    # Criar apresentação
-    prs = Presentation()
-    
-    # Slide de título
-    title_slide_layout = prs.slide_layouts[0]
-    slide = prs.slides.add_slide(title_slide_layout)
-    title = slide.shapes.title
-    subtitle = slide.placeholders[1]
-    
-    title.text = "Análise de Dados Criminais"
-    
-    # Verificar se há múltiplos meses
-    if 'MES_REFERENCIA' in df.columns and df['MES_REFERENCIA'].nunique() > 1:
-        months = sorted(df['MES_REFERENCIA'].unique())
-        subtitle.text = f"Análise Comparativa: {', '.join(months)}"
-    else:
-        subtitle.text = f"Período: {df['DATA_HORA'].min().strftime('%d/%m/%Y')} a {df['DATA_HORA'].max().strftime('%d/%m/%Y')}"
-    
-    # Salvar gráficos como imagens temporárias
-    temp_files = []
-    
-    if bar_fig:
-        bar_img_path = f"temp_bar_chart_{uuid.uuid4()}.png"
-        bar_fig.write_image(bar_img_path)
-        temp_files.append(bar_img_path)
-        
-        # Slide para gráfico de barras
-        slide = prs.slides.add_slide(prs.slide_layouts[5])
-        title = slide.shapes.title
-        title.text = "Ocorrências por Tipo de Crime"
-        
-        slide.shapes.add_picture(bar_img_path, Inches(1), Inches(1.5), width=Inches(8))
-    
-    if pie_fig:
-        pie_img_path = f"temp_pie_chart_{uuid.uuid4()}.png"
-        pie_fig.write_image(pie_img_path)
-        temp_files.append(pie_img_path)
-        
-        # Slide para gráfico de pizza
-        slide = prs.slides.add_slide(prs.slide_layouts[5])
-        title = slide.shapes.title
-        title.text = "Proporção por Tipo de Crime"
-        
-        slide.shapes.add_picture(pie_img_path, Inches(1), Inches(1.5), width=Inches(8))
-    
-    if analysis_fig:
-        analysis_img_path = f"temp_analysis_chart_{uuid.uuid4()}.png"
-        analysis_fig.write_image(analysis_img_path)
-        temp_files.append(analysis_img_path)
-        
-        # Slide para análise de crimes
-        slide = prs.slides.add_slide(prs.slide_layouts[5])
-        title = slide.shapes.title
-        title.text = "Análise de Crimes por Mês"
-        
-        slide.shapes.add_picture(analysis_img_path, Inches(1), Inches(1.5), width=Inches(8))
-    
-    # Adicionar gráfico comparativo se disponível
-    if comparative_fig:
-        comp_img_path = f"temp_comparative_chart_{uuid.uuid4()}.png"
-        comparative_fig.write_image(comp_img_path)
-        temp_files.append(comp_img_path)
-        
-        # Slide para gráfico comparativo
-        slide = prs.slides.add_slide(prs.slide_layouts[5])
-        title = slide.shapes.title
-        title.text = "Análise Comparativa entre Períodos"
-        
-        slide.shapes.add_picture(comp_img_path, Inches(1), Inches(1.5), width=Inches(8))
-    
-    # Slide para tabela de totalizadores
-    slide = prs.slides.add_slide(prs.slide_layouts[5])
-    title = slide.shapes.title
-    title.text = "Resumo Estatístico"
-    
-    # Criar tabela de totalizadores
-    crime_counts = df['EVENTO'].value_counts().reset_index()
-    crime_counts.columns = ['Tipo de Crime', 'Contagem']
-    
-    rows, cols = len(crime_counts) + 1, 2
-    left = Inches(2)
-    top = Inches(2)
-    width = Inches(6)
-    height = Inches(0.5 * rows)
-    
-    table = slide.shapes.add_table(rows, cols, left, top, width, height).table
-    
-    # Preencher cabeçalho
-    table.cell(0, 0).text = "Tipo de Crime"
-    table.cell(0, 1).text = "Contagem"
-    
-    # Preencher dados
-    for i, (crime, count) in enumerate(zip(crime_counts['Tipo de Crime'], crime_counts['Contagem'])):
-        table.cell(i+1, 0).text = str(crime)
-        table.cell(i+1, 1).text = str(count)
-    
-    # Slide para análise textual
-    slide = prs.slides.add_slide(prs.slide_layouts[5])
-    title = slide.shapes.title
-    title.text = "Análise Textual"
-    
-    # Gerar análise textual simples
-    total_ocorrencias = len(df)
-    crime_mais_comum = crime_counts.iloc[0]['Tipo de Crime']
-    qtd_crime_mais_comum = crime_counts.iloc[0]['Contagem']
-    
-    text_box = slide.shapes.add_textbox(Inches(1), Inches(1.5), Inches(8), Inches(4))
-    text_frame = text_box.text_frame
-    
-    p = text_frame.add_paragraph()
-    p.text = f"Análise de {total_ocorrencias} ocorrências registradas no período."
-    p.font.size = Pt(14)
-    
-    p = text_frame.add_paragraph()
-    p.text = f"O tipo de crime mais comum foi '{crime_mais_comum}' com {qtd_crime_mais_comum} ocorrências, representando {(qtd_crime_mais_comum/total_ocorrencias*100):.1f}% do total."
-    p.font.size = Pt(14)
-    
-    # Adicionar análise comparativa se houver múltiplos meses
-    if 'MES_REFERENCIA' in df.columns and df['MES_REFERENCIA'].nunique() > 1:
-        p = text_frame.add_paragraph()
-        p.text = f"A análise comparativa entre {df['MES_REFERENCIA'].nunique()} períodos mostra variações nos padrões criminais ao longo do tempo."
-        p.font.size = Pt(14)
-        
-        # Análise por mês
-        monthly_data = df.groupby('MES_REFERENCIA').size()
-        max_month = monthly_data.idxmax()
-        min_month = monthly_data.idxmin()
-        
-        p = text_frame.add_paragraph()
-        p.text = f"O período com maior número de ocorrências foi {max_month} com {monthly_data[max_month]} registros."
-        p.font.size = Pt(14)
+# As imagens dos gráficos são renderizadas em paralelo, direto em memória, e
+# reaproveitadas do cache quando a especificação da figura não mudou. Os
+# gráficos podem ser figuras ou especificações JSON do cache de gráficos
+def export_to_ppt(df, bar_fig, pie_fig, analysis_fig, comparative_fig=None, progress=None):
+    return ppt_bytes(df, bar_fig, pie_fig, analysis_fig, comparative_fig, progress)
+
+# Função para obter a fila de exportações em segundo plano (compartilhada entre sessões)
+@st.cache_resource
+def get_export_manager():
+    return ExportJobManager()
+
+# Função para exibir as exportações da sessão, com progresso e download.
+# Enquanto houver exportações em andamento o fragmento é reexecutado a cada
+# segundo, sem reexecutar o restante da página
+def show_export_jobs(manager, owner, polling):
+    jobs = manager.jobs(owner)
+    
+    if polling and not any(job.active for job in jobs):
+        # Todas as exportações terminaram: reexecutar a página para parar a atualização
+        st.rerun()
+    
+    for job in jobs:
+        if job.status == QUEUED:
+            st.caption(f"⏳ {job.label}: aguardando na fila")
+        elif job.status == RUNNING:
+            st.progress(job.progress, text=f"⚙️ {job.label}: {job.progress:.0%}")
+        elif job.status == DONE:
+            st.download_button(
+                label=f"Baixar {job.label}",
+                data=job.data,
+                file_name=job.file_name,
+                mime=job.mime,
+                key=f"download_{job.id}",
+                use_container_width=True
+            )
+        else:
+            st.error(f"{job.label}: falha na exportação ({job.error})")
         
-        p = text_frame.add_paragraph()
-        p.text = f"O período com menor número de ocorrências foi {min_month} com {monthly_data[min_month]} registros."
-        p.font.size = Pt(14)
-    else:
-        p = text_frame.add_paragraph()
-        p.text = f"A média mensal de ocorrências no período analisado foi de {total_ocorrencias / df['DATA_HORA'].dt.to_period('M').nunique():.1f} registros."
-        p.font.size = Pt(14)
-    
-    # Adicionar créditos do autor
-    p = text_frame.add_paragraph()
-    p.text = "Criado por Leandro Vieira de Souza"
-    p.font.size = Pt(12)
-    p.font.italic = True
-    
-    # Salvar apresentação em um buffer
-    output = io.BytesIO()
-    prs.save(output)
-    output.seek(0)
-    
-    # Limpar arquivos temporários
-    for file in temp_files:
-        if os.path.exists(file):
-            os.remove(file)
-    
-    return output
+        if not job.active and st.button("Descartar", key=f"discard_{job.id}"):
+            manager.remove(job.id)
+            st.rerun(scope="fragment")
 
 # Função para obter todas as unidades únicas do DataFrame
-def get_unique_units(df):
+# (lidas diretamente do índice de unidades, quando disponível)
+def get_unique_units(df, unit_index=None):
+    if unit_index is not None:
+        return unit_index.units
+    
     all_units = []
     
-    # Iterar sobre todas as linhas e extrair unidades
-    for unit_string in df['UNIDADE DA VIATURA'].dropna():
+    # Iterar sobre todos os textos de viatura e extrair unidades
+    unit_strings = df['UNIDADE DA VIATURA'] if isinstance(df, pd.DataFrame) else df
+    for unit_string in pd.Series(unit_strings).dropna():
         units = extract_units(unit_string)
         all_units.extend(units)
     
@@ -772,6 +474,9 @@ def get_unique_units(df):
 
 # Interface principal
 def main():
+    # Avisos das funções de análise são exibidos na página
+    set_message_handlers(warning=st.warning, error=st.error)
+    
     # Título e descrição
     with st.container():
         col1, col2 = st.columns([4, 1])
@@ -791,6 +496,13 @@ def main():
                 ["Upload de planilha única", "Upload de múltiplas planilhas (comparação mensal)"]
             )
             
+            # Leitura em blocos para planilhas grandes (ativada automaticamente acima de um tamanho)
+            streaming = st.checkbox(
+                "Leitura em blocos (planilhas grandes)",
+                help="Lê a planilha em partes para reduzir o uso de memória. "
+                     "Arquivos grandes já usam este modo automaticamente."
+            ) or None
+            
             if upload_option == "Upload de planilha única":
                 uploaded_file = st.file_uploader("Carregar planilha de ocorrências", type=["xlsx"])
                 
@@ -798,11 +510,18 @@ def main():
                     # Selecionar o mês de referência
                     month_name = st.selectbox("Selecione o mês de referência:", MESES)
                     
-                    # Carregar dados
-                    df = load_data(uploaded_file, month_name)
+                    # Carregar dados apenas quando o arquivo ou o mês mudarem
+                    upload_key = (uploaded_file.file_id, month_name)
+                    if (st.session_state.get('single_upload_key') != upload_key
+                            or month_name not in st.session_state.datasets):
+                        df = load_data(uploaded_file, month_name, streaming)
+                        
+                        # Registrar no servidor e associar à sessão
+                        df = store_dataframe(month_name, df, uploaded_file.name)
+                        st.session_state.single_upload_key = upload_key
+                    else:
+                        df = session_dataframes()[month_name]
                     
-                    # Armazenar no estado da sessão
-                    st.session_state.dataframes[month_name] = df
                     st.session_state.active_dataframes = [month_name]
                     
                     st.success(f"Dados de {month_name} carregados com sucesso! {len(df)} registros encontrados.")
@@ -824,14 +543,14 @@ def main():
                     # Botão para adicionar a planilha
                     if st.button("Adicionar Planilha"):
                         # Verificar se o mês já foi carregado
-                        if month_name in st.session_state.dataframes:
+                        if month_name in st.session_state.datasets:
                             st.warning(f"Já existe uma planilha para {month_name}. Ela será substituída.")
                         
                         # Carregar dados
-                        df = load_data(uploaded_file, month_name)
+                        df = load_data(uploaded_file, month_name, streaming)
                         
-                        # Armazenar no estado da sessão
-                        st.session_state.dataframes[month_name] = df
+                        # Registrar no servidor e associar à sessão
+                        df = store_dataframe(month_name, df, uploaded_file.name)
                         
                         # Adicionar à lista de ativos se não estiver lá
                         if month_name not in st.session_state.active_dataframes:
@@ -840,18 +559,84 @@ def main():
                         st.success(f"Planilha de {month_name} adicionada com sucesso! {len(df)} registros.")
                 
                 # Mostrar quais planilhas foram carregadas
-                if st.session_state.dataframes:
+                if st.session_state.datasets:
                     st.markdown("### Planilhas Carregadas")
                     
-                    for month, df in st.session_state.dataframes.items():
-                        st.info(f"{month}: {len(df)} registros")
+                    for month, df in session_dataframes().items():
+                        st.info(f"{month}: {len(df)} registros ({memory_mb(df):.1f} MB)")
+            
+        # Bases já ingeridas no servidor (por qualquer sessão) podem ser usadas
+        # sem novo upload
+        available_datasets = get_dataset_registry().list()
+        if available_datasets:
+            with st.expander("🗄️ Bases no Servidor", expanded=not st.session_state.datasets):
+                dataset_labels = {
+                    entry['id']: f"{entry['month']} — {entry['source'] or 'planilha'} "
+                                 f"({entry['rows']} registros, {entry['created_at'][:10]})"
+                    for entry in available_datasets
+                }
+                selected_datasets = st.multiselect(
+                    "Selecione as bases para incluir na análise:",
+                    list(dataset_labels),
+                    format_func=dataset_labels.get,
+                    key="server_datasets"
+                )
+                if selected_datasets and st.button("Adicionar à análise", use_container_width=True):
+                    for dataset_id in selected_datasets:
+                        month = get_dataset_registry().info(dataset_id)['month']
+                        st.session_state.datasets[month] = dataset_id
+                        if month not in st.session_state.active_dataframes:
+                            st.session_state.active_dataframes.append(month)
+                    st.rerun()
         
+        # Limites dos setores de policiamento (GeoJSON): cada ocorrência com
+        # coordenadas válidas recebe o setor em que está
+        if st.session_state.datasets:
+            with st.expander("🗺️ Setores de Policiamento", expanded=False):
+                sector_file = st.file_uploader(
+                    "Carregar limites dos setores (GeoJSON)",
+                    type=["geojson", "json"],
+                    key="sector_file"
+                )
+                if sector_file and st.button("Aplicar setores", use_container_width=True):
+                    try:
+                        st.session_state.sector_map = SectorMap.from_geojson(sector_file.getvalue())
+                    except (ValueError, KeyError, TypeError) as e:
+                        st.error(f"Não foi possível ler os setores: {e}")
+                
+                if st.session_state.sector_map is not None:
+                    st.info(f"{len(st.session_state.sector_map)} setores carregados.")
+                    if st.button("Remover setores", use_container_width=True):
+                        st.session_state.sector_map = None
+                        st.rerun()
+        
+        # Relatório de uso de memória por mês carregado
+        if st.session_state.datasets:
+            with st.expander("🧮 Uso de Memória", expanded=False):
+                st.caption("As bases são compartilhadas entre as sessões que usam os mesmos meses.")
+                memory_summary = pd.DataFrame([
+                    {'Mês': month, 'Registros': len(df), 'Memória (MB)': round(memory_mb(df), 2)}
+                    for month, df in session_dataframes().items()
+                ])
+                st.dataframe(memory_summary, hide_index=True, use_container_width=True)
+                
+                report_month = st.selectbox(
+                    "Detalhar mês:",
+                    list(st.session_state.datasets.keys()),
+                    key="memory_report_month"
+                )
+                st.dataframe(
+                    memory_report(session_dataframes()[report_month]),
+                    hide_index=True,
+                    use_container_width=True
+                )
+    
         # Verificar se há dados para mostrar filtros
-        if st.session_state.dataframes and st.session_state.active_dataframes:
+        if st.session_state.datasets and st.session_state.active_dataframes:
             with st.expander("🔍 Filtros", expanded=True):
                 # Seleção de meses para análise
                 st.subheader("Meses para Análise")
-                all_months = list(st.session_state.dataframes.keys())
+                all_months = list(st.session_state.datasets.keys())
                 selected_months = st.multiselect(
                     "Selecione os meses para incluir na análise:",
                     all_months,
@@ -862,13 +647,16 @@ def main():
                 if selected_months:
                     st.session_state.active_dataframes = selected_months
                 
-                # Combinar os DataFrames ativos
-                df = combine_dataframes(st.session_state.dataframes, st.session_state.active_dataframes)
+                # Visão combinada de todos os meses (reaproveitada enquanto as
+                # bases da sessão não mudarem); os meses ativos são uma máscara
+                engine = st.session_state.filter_engine
+                view, unit_index = get_combined_data(engine)
+                active_months = view.resolve(st.session_state.active_dataframes)
+                all_active = len(active_months) == len(view.months)
                 
                 # Filtro de data
                 st.subheader("Período")
-                min_date = df['DATA_HORA'].min().date()
-                max_date = df['DATA_HORA'].max().date()
+                min_date, max_date = (value.date() for value in view.date_range(active_months))
                 
                 col1, col2 = st.columns(2)
                 with col1:
@@ -878,66 +666,103 @@ def main():
                 
                 # Filtro de tipo de crime
                 st.subheader("Tipo de Crime")
-                crime_options = sorted(df['EVENTO'].unique())
+                crime_options = view.unique('EVENTO', active_months)
                 crime_type = st.multiselect("Selecione os tipos de crime", crime_options)
                 
                 # Filtro de localidade
                 st.subheader("Localidade")
-                location_options = sorted(df['ÁREA URBANA'].dropna().unique())
+                location_options = view.unique('ÁREA URBANA', active_months)
                 location = st.multiselect("Selecione as localidades", location_options)
                 
+                # Filtro de setor de policiamento (apenas com setores carregados)
+                sector = []
+                if SECTOR_COLUMN in view.df.columns:
+                    st.subheader("Setor")
+                    sector = st.multiselect("Selecione os setores", view.unique(SECTOR_COLUMN, active_months))
+                
                 # Filtro de unidade responsável - modificado para mostrar unidades individuais
                 st.subheader("Unidade Responsável")
-                unit_options = get_unique_units(df)  # Obter unidades únicas
+                # (do índice quando todos os meses estão ativos; senão, dos textos distintos dos meses)
+                with stage("get_unique_units") as timing:
+                    unit_options = (
+                        get_unique_units(view.df, unit_index) if all_active
+                        else get_unique_units(view.unique('UNIDADE DA VIATURA', active_months))
+                    )
+                    timing.rows = len(unit_options)
                 unit = st.multiselect("Selecione as unidades", unit_options)
                 
                 # Filtro de palavras-chave
                 st.subheader("Palavras-chave")
-                keywords = st.text_input("Buscar nos históricos e evoluções")
+                keywords = st.text_input(
+                    "Buscar nos históricos e evoluções",
+                    help='Busca por palavras inteiras: todos os termos devem aparecer (sem diferenciar '
+                         'acentos e maiúsculas). Para partes de palavras use * no final (ex.: furt* encontra '
+                         '"furto" e "furtado"). Use OR para alternativas e "aspas" para frases. '
+                         'Buscas sem letras ou números (ex.: -) ou com palavras de mais de 40 caracteres '
+                         'procuram o trecho exato no texto.'
+                )
                 
-                # Aplicar filtros
-                filtered_df = filter_data(df, start_date, end_date, crime_type, location, unit, keywords)
+                # Aplicar filtros (apenas os predicados alterados são recalculados)
+                with stage("filter") as timing:
+                    filtered_df = engine.apply(start_date, end_date, crime_type, location, unit, keywords,
+                                               active_months, sector)
+                    timing.rows = len(filtered_df)
                 
-                st.info(f"Exibindo {len(filtered_df)} de {len(df)} registros após aplicação dos filtros.")
+                st.info(f"Exibindo {len(filtered_df)} de {view.rows(active_months)} registros após aplicação dos filtros.")
             
             # Botões de exportação
             with st.expander("📊 Exportar Resultados", expanded=True):
                 col1, col2 = st.columns(2)
                 
+                # As exportações entram na fila em segundo plano e continuam
+                # mesmo que a página seja reexecutada por outro widget
+                export_manager = get_export_manager()
+                export_owner = st.session_state.export_owner
+                
                 with col1:
                     if st.button("📥 Exportar Excel", use_container_width=True):
-                        excel_data = export_to_excel(filtered_df)
-                        st.download_button(
-                            label="Baixar arquivo Excel",
-                            data=excel_data,
-                            file_name="dados_criminais.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            use_container_width=True
+                        export_df = filtered_df
+                        job = export_manager.submit(
+                            export_owner,
+                            f"Excel ({len(export_df)} registros)",
+                            "dados_criminais.xlsx",
+                            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            lambda progress: export_to_excel(export_df, progress=progress)
                         )
+                        if job is None:
+                            st.warning("Limite de exportações em andamento atingido. Aguarde a conclusão.")
                 
                 with col2:
                     if st.button("📊 Exportar PowerPoint", use_container_width=True):
-                        # Verificar se estamos em modo de comparação
-                        is_comparison_mode = 'MES_REFERENCIA' in filtered_df.columns and filtered_df['MES_REFERENCIA'].nunique() > 1
+                        export_df = filtered_df
                         
-                        # Criar gráficos para o PowerPoint
-                        bar_fig = create_bar_chart(filtered_df, 'EVENTO', "Ocorrências por Tipo de Crime")
-                        pie_fig = create_pie_chart(filtered_df, 'EVENTO', "Proporção por Tipo de Crime")
-                        analysis_fig = create_crime_analysis(filtered_df)
+                        # Verificar se estamos em modo de comparação
+                        is_comparison_mode = 'MES_REFERENCIA' in export_df.columns and export_df['MES_REFERENCIA'].nunique() > 1
                         
-                        if is_comparison_mode:
-                            comp_fig = create_comparative_bar_chart(filtered_df, 'EVENTO')
-                            ppt_data = export_to_ppt(filtered_df, bar_fig, pie_fig, analysis_fig, comp_fig)
-                        else:
-                            ppt_data = export_to_ppt(filtered_df, bar_fig, pie_fig, analysis_fig)
+                        # Gráficos para o PowerPoint, do mesmo cache usado pelas abas
+                        # (especificações JSON, seguras para a fila em segundo plano)
+                        bar_fig = bar_chart(engine, None, export_df, 'EVENTO', "Ocorrências por Tipo de Crime", spec=True)
+                        pie_fig = pie_chart(engine, None, export_df, 'EVENTO', "Proporção por Tipo de Crime", spec=True)
+                        analysis_fig = crime_analysis_chart(engine, None, export_df, spec=True)
+                        comp_fig = (
+                            comparative_chart(engine, None, engine.cube(), 'EVENTO', spec=True)
+                            if is_comparison_mode else None
+                        )
                         
-                        st.download_button(
-                            label="Baixar apresentação PowerPoint",
-                            data=ppt_data,
-                            file_name="analise_criminal.pptx",
-                            mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-                            use_container_width=True
+                        job = export_manager.submit(
+                            export_owner,
+                            f"PowerPoint ({len(export_df)} registros)",
+                            "analise_criminal.pptx",
+                            "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+                            lambda progress: export_to_ppt(export_df, bar_fig, pie_fig, analysis_fig, comp_fig, progress)
                         )
+                        if job is None:
+                            st.warning("Limite de exportações em andamento atingido. Aguarde a conclusão.")
+                
+                polling = any(job.active for job in export_manager.jobs(export_owner))
+                st.fragment(run_every=1 if polling else None)(show_export_jobs)(
+                    export_manager, export_owner, polling
+                )
                 
                 # Salvar estado dos filtros
                 if st.button("💾 Salvar Filtros", use_container_width=True):
@@ -958,12 +783,9 @@ def main():
     
     # Conteúdo principal
     with col_main:
-        if st.session_state.dataframes and st.session_state.active_dataframes:
-            # Combinar os DataFrames ativos
-            df = combine_dataframes(st.session_state.dataframes, st.session_state.active_dataframes)
-            
-            # Aplicar filtros
-            filtered_df = filter_data(df, start_date, end_date, crime_type, location, unit, keywords) if 'start_date' in locals() else df
+        if st.session_state.datasets and st.session_state.active_dataframes:
+            # Os dados combinados e filtrados já foram calculados na barra lateral
+            # pelo motor de filtros; aqui apenas são reaproveitados
             
             if not filtered_df.empty:
                 # Métricas principais
@@ -975,17 +797,18 @@ def main():
                     st.metric("Total de Ocorrências", len(filtered_df))
                 
                 with col2:
-                    top_crime = filtered_df['EVENTO'].value_counts().index[0] if not filtered_df.empty else "N/A"
+                    top_crime = count_values(filtered_df['EVENTO']).index[0] if not filtered_df.empty else "N/A"
                     st.metric("Crime Mais Comum", top_crime)
                 
                 with col3:
-                    top_location = filtered_df['ÁREA URBANA'].value_counts().index[0] if not filtered_df.empty else "N/A"
+                    top_location = count_values(filtered_df['ÁREA URBANA']).index[0] if not filtered_df.empty else "N/A"
                     st.metric("Localidade Mais Afetada", top_location)
                 
                 # Visualizações
                 st.header("📈 Visualizações")
                 
                 # Seletor de mês específico para visualizações
+                selected_month_viz = None
                 if len(st.session_state.active_dataframes) > 1:
                     selected_month_viz = st.selectbox(
                         "Selecione um mês específico para visualização:",
@@ -1000,31 +823,42 @@ def main():
                 else:
                     viz_df = filtered_df
                 
-                tab1, tab2, tab3, tab4 = st.tabs([
+                # Escopo dos gráficos no cache: None quando são exibidas todas as
+                # linhas filtradas (compartilhado com a exportação)
+                viz_scope = None if viz_df is filtered_df else selected_month_viz
+                
+                tab1, tab2, tab3, tab_time, tab4 = st.tabs([
                     "Gráficos de Barras", 
                     "Gráficos de Pizza", 
                     "Análise", 
+                    "Análise Temporal",
                     "Mapa de Calor"
                 ])
                 
-                with tab1:
+                with tab1, stage("tab:bars"):
                     st.subheader("Ocorrências por Tipo de Crime")
-                    bar_fig = create_bar_chart(viz_df, 'EVENTO', "Ocorrências por Tipo de Crime")
+                    bar_fig = bar_chart(engine, viz_scope, viz_df, 'EVENTO', "Ocorrências por Tipo de Crime")
                     if bar_fig:
                         st.plotly_chart(bar_fig, use_container_width=True)
                     
                     st.subheader("Ocorrências por Localidade")
-                    bar_fig_loc = create_bar_chart(viz_df, 'ÁREA URBANA', "Ocorrências por Localidade", color='#15803D')
+                    bar_fig_loc = bar_chart(engine, viz_scope, viz_df, 'ÁREA URBANA', "Ocorrências por Localidade", color='#15803D')
                     if bar_fig_loc:
                         st.plotly_chart(bar_fig_loc, use_container_width=True)
+                    
+                    if SECTOR_COLUMN in viz_df.columns:
+                        st.subheader("Ocorrências por Setor")
+                        bar_fig_sector = bar_chart(engine, viz_scope, viz_df, SECTOR_COLUMN, "Ocorrências por Setor", color='#B45309')
+                        if bar_fig_sector:
+                            st.plotly_chart(bar_fig_sector, use_container_width=True)
                 
-                with tab2:
+                with tab2, stage("tab:pie"):
                     st.subheader("Proporção por Tipo de Crime")
-                    pie_fig = create_pie_chart(viz_df, 'EVENTO', "Proporção por Tipo de Crime")
+                    pie_fig = pie_chart(engine, viz_scope, viz_df, 'EVENTO', "Proporção por Tipo de Crime")
                     if pie_fig:
                         st.plotly_chart(pie_fig, use_container_width=True)
                 
-                with tab3:
+                with tab3, stage("tab:analysis"):
                     st.subheader("Análise de Crimes por Mês")
                     
                     # Seleção de crimes para análise
@@ -1032,11 +866,11 @@ def main():
                     selected_crimes = st.multiselect(
                         "Selecione os tipos de crime para analisar:",
                         crime_options,
-                        default=viz_df['EVENTO'].value_counts().nlargest(5).index.tolist()
+                        default=count_values(viz_df['EVENTO']).nlargest(5).index.tolist()
                     )
                     
                     # Criar gráfico de análise
-                    analysis_fig = create_crime_analysis(viz_df, selected_crimes)
+                    analysis_fig = crime_analysis_chart(engine, viz_scope, viz_df, selected_crimes)
                     if analysis_fig:
                         st.plotly_chart(analysis_fig, use_container_width=True)
                     
@@ -1052,7 +886,75 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
                 
-                with tab4:
+                with tab_time, stage("tab:time"):
+                    # As tabelas são guardadas pelo motor de filtros enquanto os
+                    # filtros e o mês de visualização não mudarem
+                    st.subheader("Ocorrências por Dia da Semana e Hora")
+                    time_crimes = st.multiselect(
+                        "Restringir aos tipos de crime:",
+                        sorted(viz_df['EVENTO'].unique()),
+                        key="time_crimes"
+                    )
+                    time_df = viz_df[viz_df['EVENTO'].isin(time_crimes)] if time_crimes else viz_df
+                    time_key = (selected_month_viz, tuple(time_crimes))
+                    
+                    # Com filtros que o cubo temporal responde, a matriz e os turnos por
+                    # tipo de crime somam as células do cubo em vez de contar as linhas
+                    time_cube = engine.temporal_cube()
+                    if time_cube is not None:
+                        time_cube = time_cube.slice({
+                            'MES_REFERENCIA': None if viz_scope is None else [selected_month_viz],
+                            'EVENTO': time_crimes,
+                        })
+                    
+                    matrix = engine.derived(
+                        ('hour_weekday',) + time_key,
+                        lambda: hour_weekday_matrix(time_df) if time_cube is None
+                        else hour_weekday_matrix(time_cube.cells, time_cube.cells[COUNT_COLUMN])
+                    )
+                    hour_fig = create_hour_weekday_heatmap(matrix)
+                    if hour_fig:
+                        st.plotly_chart(hour_fig, use_container_width=True)
+                    
+                    st.subheader("Evolução no Tempo")
+                    freq = st.radio(
+                        "Agregação da série:",
+                        list(FREQUENCIES),
+                        format_func=FREQUENCIES.get,
+                        horizontal=True,
+                        key="time_freq"
+                    )
+                    # Uma linha por tipo de crime selecionado (ou os 5 mais comuns)
+                    series_crimes = time_crimes or count_values(viz_df['EVENTO']).nlargest(5).index.tolist()
+                    series = engine.derived(
+                        ('time_series', freq) + time_key,
+                        lambda: time_series(time_df, freq, 'EVENTO', series_crimes)
+                    )
+                    series_fig = create_time_series_chart(series, freq)
+                    if series_fig:
+                        st.plotly_chart(series_fig, use_container_width=True)
+                    
+                    st.subheader("Distribuição por Turno")
+                    st.caption(" · ".join(f"{name}: {start:02d}h–{end:02d}h" for name, start, end in SHIFTS))
+                    shift_column = st.radio(
+                        "Agrupar por:",
+                        ['EVENTO', 'UNIDADE DA VIATURA'],
+                        format_func=lambda column: "Tipo de crime" if column == 'EVENTO' else "Unidade",
+                        horizontal=True,
+                        key="shift_column"
+                    )
+                    shifts = engine.derived(
+                        ('shift', shift_column) + time_key,
+                        lambda: shift_table(time_df, shift_column)
+                        if time_cube is None or shift_column not in time_cube.dimensions
+                        else shift_table(time_cube.cells, shift_column, time_cube.cells[COUNT_COLUMN])
+                    )
+                    shift_fig = create_shift_chart(shifts, shift_column)
+                    if shift_fig:
+                        st.plotly_chart(shift_fig, use_container_width=True)
+                        st.dataframe(shifts, use_container_width=True)
+                
+                with tab4, stage("tab:map"):
                     st.subheader("Mapa de Calor de Ocorrências")
                     
                     # Opções para o mapa de calor
@@ -1061,16 +963,171 @@ def main():
                         ["Usar endereços (MUNICÍPIO, LOGRADOURO, BAIRRO)", "Usar coordenadas (X, Y)"]
                     )
                     
+                    # Agregação no servidor: limita o número de pontos enviados ao navegador
+                    aggregation_labels = {
+                        'points': "Pontos individuais",
+                        'grid': "Grade",
+                        'hex': "Hexágonos"
+                    }
+                    map_col0, map_col1, map_col2 = st.columns(3)
+                    with map_col0:
+                        map_mode = st.selectbox(
+                            "Modo do mapa:",
+                            list(MAP_MODES),
+                            format_func=MAP_MODES.get,
+                            key="map_mode"
+                        )
+                    with map_col1:
+                        aggregation = st.selectbox(
+                            "Agregação dos pontos:",
+                            list(aggregation_labels),
+                            format_func=aggregation_labels.get,
+                            disabled=map_mode != 'heat'
+                        )
+                    with map_col2:
+                        zoom = st.slider(
+                            "Nível de zoom / resolução da agregação:",
+                            min_value=8, max_value=18, value=12,
+                            disabled=map_mode == 'heat' and aggregation == 'points'
+                        )
+                    
                     if map_option == "Usar endereços (MUNICÍPIO, LOGRADOURO, BAIRRO)":
-                        heatmap = create_heatmap_from_addresses(viz_df)
+                        offline_geocoding = st.checkbox(
+                            "Modo offline (usar apenas o cache de geocodificação)",
+                            value=GEOCODER == "offline"
+                        )
+                        
+                        # Importação e exportação do cache persistente de geocodificação
+                        with st.expander("🗂️ Cache de Geocodificação", expanded=False):
+                            store = get_geocode_store()
+                            stats = store.stats()
+                            st.caption(
+                                f"{stats['total']} endereços em cache: {stats['found']} encontrados, "
+                                f"{stats['not_found']} sem resultado."
+                            )
+                            st.download_button(
+                                label="Exportar cache (CSV)",
+                                data=store.export_csv(),
+                                file_name="cache_geocodificacao.csv",
+                                mime="text/csv"
+                            )
+                            geocode_file = st.file_uploader(
+                                "Importar cache ou endereços geocodificados (CSV)",
+                                type=["csv"],
+                                key="geocode_import"
+                            )
+                            if geocode_file and st.button("Importar para o cache"):
+                                imported = store.import_csv(geocode_file)
+                                st.success(f"{imported} endereços importados para o cache.")
+                        
+                        with stage("create_heatmap_from_addresses", rows=len(viz_df)):
+                            heatmap = create_heatmap_from_addresses(viz_df, offline_geocoding, aggregation, zoom, map_mode)
                     else:
-                        heatmap = create_heatmap_from_coordinates(viz_df)
+                        # Detecção de hotspots sobre as coordenadas (polígonos desenhados no mapa)
+                        hotspots = None
+                        if st.checkbox("Detectar hotspots", key="hotspots_enabled"):
+                            hot_col1, hot_col2, hot_col3 = st.columns(3)
+                            with hot_col1:
+                                hotspot_method = st.selectbox(
+                                    "Método:",
+                                    list(HOTSPOT_METHODS),
+                                    format_func=HOTSPOT_METHODS.get,
+                                    key="hotspot_method"
+                                )
+                                hotspot_top = st.slider("Quantidade de hotspots:", 1, 50, 10, key="hotspot_top")
+                            
+                            group_labels = {
+                                (): "Todas as ocorrências",
+                                ('EVENTO',): "Por tipo de crime",
+                                ('MES_REFERENCIA',): "Por mês",
+                                ('EVENTO', 'MES_REFERENCIA'): "Por tipo de crime e mês",
+                            }
+                            with hot_col2:
+                                if hotspot_method == 'kde':
+                                    hotspot_cell = st.slider(
+                                        "Tamanho da célula (m):", 50, 1000, int(HOTSPOT_CELL_METERS), step=50,
+                                        key="hotspot_cell"
+                                    )
+                                else:
+                                    hotspot_eps = st.slider(
+                                        "Distância máxima entre ocorrências (m):", 50, 1000, int(CLUSTER_EPS_METERS),
+                                        step=50, key="hotspot_eps"
+                                    )
+                            with hot_col3:
+                                if hotspot_method == 'kde':
+                                    hotspot_group = st.selectbox(
+                                        "Ranking:", list(group_labels), format_func=group_labels.get,
+                                        key="hotspot_group"
+                                    )
+                                else:
+                                    hotspot_min = st.slider(
+                                        "Mínimo de ocorrências por agrupamento:", 2, 100, CLUSTER_MIN_POINTS,
+                                        key="hotspot_min"
+                                    )
+                            
+                            hotspot_settings = {
+                                'method': hotspot_method,
+                                'top_n': hotspot_top,
+                                'cell_m': hotspot_cell if hotspot_method == 'kde' else None,
+                                'group_by': list(hotspot_group) if hotspot_method == 'kde' else None,
+                                'eps_m': hotspot_eps if hotspot_method == 'dbscan' else None,
+                                'min_points': hotspot_min if hotspot_method == 'dbscan' else None,
+                            }
+                            hotspot_key = ('hotspots', selected_month_viz) + tuple(
+                                (name, tuple(value) if isinstance(value, list) else value)
+                                for name, value in hotspot_settings.items()
+                            )
+                            hotspots = engine.derived(hotspot_key, lambda: detect_hotspots(viz_df, hotspot_settings))
+                        
+                        # O HTML do mapa é gerado uma vez por estado dos filtros e do mapa;
+                        # nas demais execuções o mesmo texto é reenviado e reaproveitado
+                        # pelo navegador, sem reconstruir o mapa
+                        map_key = ('map', selected_month_viz, map_mode, aggregation, zoom,
+                                   hotspot_key if hotspots is not None else None)
+                        with stage("render_coordinate_map", rows=len(viz_df)):
+                            map_page, map_note = engine.derived(
+                                map_key,
+                                lambda: render_coordinate_map(viz_df, aggregation, zoom, hotspots, map_mode)
+                            )
+                        if map_page:
+                            if map_note:
+                                st.caption(map_note)
+                            components.html(map_page, width=1200, height=710)
+                        else:
+                            st.warning(map_note)
+                        heatmap = map_page
                     
-                    if heatmap:
+                    if map_option == "Usar endereços (MUNICÍPIO, LOGRADOURO, BAIRRO)" and heatmap:
+                        # streamlit_folium é carregado só quando o mapa por endereços é exibido
+                        from streamlit_folium import folium_static
+
                         # Aumentar tamanho do mapa
                         folium_static(heatmap, width=1200, height=700)
-                    else:
+                    elif not heatmap:
                         st.warning("Não foi possível gerar o mapa de calor. Verifique se há dados de localização válidos.")
+                    
+                    if map_option != "Usar endereços (MUNICÍPIO, LOGRADOURO, BAIRRO)" and hotspots is not None:
+                        st.subheader("🎯 Hotspots")
+                        # Ocorrências que ficaram fora da detecção (sem coordenadas válidas
+                        # ou fora da área definida em CRIME_APP_HOTSPOT_BOUNDS)
+                        invalid = hotspots.attrs.get('invalid', 0)
+                        outside = hotspots.attrs.get('outside', 0)
+                        if invalid or outside:
+                            dropped = []
+                            if invalid:
+                                dropped.append(f"{invalid} sem coordenadas válidas")
+                            if outside:
+                                dropped.append(f"{outside} fora da área configurada")
+                            st.warning(f"{invalid + outside} ocorrências ignoradas na detecção: {' e '.join(dropped)}.")
+                        if hotspot_method == 'kde' and hotspots.attrs.get('cell_m', hotspot_cell) > hotspot_cell:
+                            st.warning(
+                                f"As coordenadas cobrem uma área extensa: a célula foi ampliada de {hotspot_cell} m "
+                                f"para {hotspots.attrs['cell_m']:.0f} m para caber no limite da grade."
+                            )
+                        if hotspots.empty:
+                            st.info("Nenhum hotspot encontrado com os parâmetros escolhidos.")
+                        else:
+                            st.dataframe(hotspots.drop(columns=['polygon']), use_container_width=True, hide_index=True)
                 
                 # Seção autônoma para análise comparativa
                 if len(st.session_state.active_dataframes) > 1:
@@ -1094,128 +1151,162 @@ def main():
                     )
                     
                     if len(comp_months) >= 2:
-                        # Filtrar dados apenas para os meses selecionados
-                        comp_df = filtered_df[filtered_df['MES_REFERENCIA'].isin(comp_months)]
+                        # Filtrar o cubo de contagens apenas para os meses selecionados
+                        # (o cubo dos dados filtrados é calculado uma vez por estado dos filtros)
+                        comp_cube = engine.cube().slice({'MES_REFERENCIA': comp_months})
+                        crime_counts = comp_cube.counts('EVENTO')
+                        crime_counts = crime_counts[crime_counts > 0]
                         
                         # Seleção de tipos de crime para comparação
                         selected_crimes = st.multiselect(
                             "Selecione os tipos de crime para comparar:",
-                            sorted(comp_df['EVENTO'].unique()),
-                            default=comp_df['EVENTO'].value_counts().nlargest(5).index.tolist(),
+                            sorted(crime_counts.index),
+                            default=crime_counts.nlargest(5).index.tolist(),
                             key="comp_crimes"
                         )
                         
                         if selected_crimes:
                             # Gráfico de barras comparativo
                             st.subheader("Comparação de Crimes por Mês")
-                            comp_df_filtered = comp_df[comp_df['EVENTO'].isin(selected_crimes)]
-                            comp_bar_fig = create_comparative_bar_chart(comp_df_filtered, 'EVENTO')
+                            comp_cube_filtered = comp_cube.slice({'EVENTO': selected_crimes})
+                            comp_bar_fig = comparative_chart(
+                                engine, ('comparison', tuple(comp_months), tuple(sorted(selected_crimes))),
+                                comp_cube_filtered, 'EVENTO'
+                            )
                             if comp_bar_fig:
                                 st.plotly_chart(comp_bar_fig, use_container_width=True)
                             
                             # Análise de variação percentual
-                            if len(comp_months) == 2:
-                                st.subheader("Variação Percentual entre Períodos")
-                                var_fig = create_percentage_change_chart(comp_df_filtered, 'EVENTO', comp_months)
-                                if var_fig:
-                                    st.plotly_chart(var_fig, use_container_width=True)
+                            # (com mais de dois meses, entre os dois últimos selecionados)
+                            st.subheader("Variação Percentual entre Períodos")
+                            if len(comp_months) > 2:
+                                st.caption(f"Comparação entre {comp_months[-2]} e {comp_months[-1]}, os dois últimos meses selecionados.")
+                            var_fig = create_percentage_change_chart(comp_cube_filtered, 'EVENTO', comp_months[-2:])
+                            if var_fig:
+                                st.plotly_chart(var_fig, use_container_width=True)
+                            
+                                # Calcular estatísticas de variação
+                                month1, month2 = comp_months[-2], comp_months[-1]
+                                variation_data = compute_variation(comp_cube_filtered, 'EVENTO', month1, month2)
+                            
+                                if variation_data is not None:
+                                    if not variation_data.empty:
+                                        # Calcular estatísticas
+                                        aumentos = (variation_data['Variação'] > 0).sum()
+                                        diminuicoes = (variation_data['Variação'] < 0).sum()
+                                        sem_alteracao = (variation_data['Variação'] == 0).sum()
                                     
-                                    # Calcular estatísticas de variação
-                                    grouped = comp_df_filtered.groupby(['MES_REFERENCIA', 'EVENTO']).size().reset_index(name='Contagem')
-                                    pivot = grouped.pivot(index='EVENTO', columns='MES_REFERENCIA', values='Contagem').fillna(0)
+                                        # Mostrar estatísticas em cards
+                                        st.markdown("""
+                                        <h3 style="margin-top: 1.5rem;">Resumo da Variação</h3>
+                                        """, unsafe_allow_html=True)
                                     
-                                    month1, month2 = comp_months[0], comp_months[1]
-                                    if month1 in pivot.columns and month2 in pivot.columns:
-                                        pivot['Variação'] = ((pivot[month2] - pivot[month1]) / pivot[month1] * 100).fillna(0)
-                                        
-                                        # Filtrar apenas os tipos de crime com dados em ambos os meses
-                                        valid_rows = (pivot[month1] > 0) & (pivot[month2] > 0)
-                                        variation_data = pivot[valid_rows]
-                                        
-                                        if not variation_data.empty:
-                                            # Calcular estatísticas
-                                            aumentos = (variation_data['Variação'] > 0).sum()
-                                            diminuicoes = (variation_data['Variação'] < 0).sum()
-                                            sem_alteracao = (variation_data['Variação'] == 0).sum()
-                                            
-                                            # Mostrar estatísticas em cards
+                                        col1, col2, col3 = st.columns(3)
+                                    
+                                        with col1:
+                                            st.markdown(f"""
+                                            <div style="background-color: #ffcccb; padding: 1rem; border-radius: 0.5rem; text-align: center;">
+                                                <h2 style="margin: 0; color: #cc0000;">{aumentos}</h2>
+                                                <p style="margin: 0; font-weight: bold;">Crimes com Aumento</p>
+                                            </div>
+                                            """, unsafe_allow_html=True)
+                                    
+                                        with col2:
+                                            st.markdown(f"""
+                                            <div style="background-color: #ccffcc; padding: 1rem; border-radius: 0.5rem; text-align: center;">
+                                                <h2 style="margin: 0; color: #007700;">{diminuicoes}</h2>
+                                                <p style="margin: 0; font-weight: bold;">Crimes com Diminuição</p>
+                                            </div>
+                                            """, unsafe_allow_html=True)
+                                    
+                                        with col3:
+                                            st.markdown(f"""
+                                            <div style="background-color: #e0e0e0; padding: 1rem; border-radius: 0.5rem; text-align: center;">
+                                                <h2 style="margin: 0; color: #555555;">{sem_alteracao}</h2>
+                                                <p style="margin: 0; font-weight: bold;">Sem Alteração</p>
+                                            </div>
+                                            """, unsafe_allow_html=True)
+                                    
+                                        # Mostrar os maiores aumentos e diminuições
+                                        col1, col2 = st.columns(2)
+                                    
+                                        with col1:
                                             st.markdown("""
-                                            <h3 style="margin-top: 1.5rem;">Resumo da Variação</h3>
+                                            <h4 style="margin-top: 1.5rem;">Maiores Aumentos:</h4>
                                             """, unsafe_allow_html=True)
-                                            
-                                            col1, col2, col3 = st.columns(3)
-                                            
-                                            with col1:
-                                                st.markdown(f"""
-                                                <div style="background-color: #ffcccb; padding: 1rem; border-radius: 0.5rem; text-align: center;">
-                                                    <h2 style="margin: 0; color: #cc0000;">{aumentos}</h2>
-                                                    <p style="margin: 0; font-weight: bold;">Crimes com Aumento</p>
-                                                </div>
-                                                """, unsafe_allow_html=True)
-                                            
-                                            with col2:
+                                        
+                                            # Mostrar os 3 maiores aumentos
+                                            top_increases = variation_data.sort_values('Variação', ascending=False).head(3)
+                                            for crime, row in top_increases.iterrows():
                                                 st.markdown(f"""
-                                                <div style="background-color: #ccffcc; padding: 1rem; border-radius: 0.5rem; text-align: center;">
-                                                    <h2 style="margin: 0; color: #007700;">{diminuicoes}</h2>
-                                                    <p style="margin: 0; font-weight: bold;">Crimes com Diminuição</p>
+                                                <div style="background-color: #fff0f0; padding: 0.8rem; border-radius: 0.5rem; margin-bottom: 0.5rem;">
+                                                    <h5 style="margin: 0; color: #cc0000;">{crime}</h5>
+                                                    <p style="margin: 0; font-weight: bold;">Aumento de {row['Variação']:.1f}%</p>
+                                                    <p style="margin: 0;">({int(row[month1])} → {int(row[month2])} ocorrências)</p>
                                                 </div>
                                                 """, unsafe_allow_html=True)
-                                            
-                                            with col3:
+                                    
+                                        with col2:
+                                            st.markdown("""
+                                            <h4 style="margin-top: 1.5rem;">Maiores Diminuições:</h4>
+                                            """, unsafe_allow_html=True)
+                                        
+                                            # Mostrar as 3 maiores diminuições
+                                            top_decreases = variation_data.sort_values('Variação').head(3)
+                                            for crime, row in top_decreases.iterrows():
                                                 st.markdown(f"""
-                                                <div style="background-color: #e0e0e0; padding: 1rem; border-radius: 0.5rem; text-align: center;">
-                                                    <h2 style="margin: 0; color: #555555;">{sem_alteracao}</h2>
-                                                    <p style="margin: 0; font-weight: bold;">Sem Alteração</p>
+                                                <div style="background-color: #f0fff0; padding: 0.8rem; border-radius: 0.5rem; margin-bottom: 0.5rem;">
+                                                    <h5 style="margin: 0; color: #007700;">{crime}</h5>
+                                                    <p style="margin: 0; font-weight: bold;">Diminuição de {abs(row['Variação']):.1f}%</p>
+                                                    <p style="margin: 0;">({int(row[month1])} → {int(row[month2])} ocorrências)</p>
                                                 </div>
                                                 """, unsafe_allow_html=True)
-                                            
-                                            # Mostrar os maiores aumentos e diminuições
-                                            col1, col2 = st.columns(2)
-                                            
-                                            with col1:
-                                                st.markdown("""
-                                                <h4 style="margin-top: 1.5rem;">Maiores Aumentos:</h4>
-                                                """, unsafe_allow_html=True)
-                                                
-                                                # Mostrar os 3 maiores aumentos
-                                                top_increases = variation_data.sort_values('Variação', ascending=False).head(3)
-                                                for crime, row in top_increases.iterrows():
-                                                    st.markdown(f"""
-                                                    <div style="background-color: #fff0f0; padding: 0.8rem; border-radius: 0.5rem; margin-bottom: 0.5rem;">
-                                                        <h5 style="margin: 0; color: #cc0000;">{crime}</h5>
-                                                        <p style="margin: 0; font-weight: bold;">Aumento de {row['Variação']:.1f}%</p>
-                                                        <p style="margin: 0;">({int(row[month1])} → {int(row[month2])} ocorrências)</p>
-                                                    </div>
-                                                    """, unsafe_allow_html=True)
-                                            
-                                            with col2:
-                                                st.markdown("""
-                                                <h4 style="margin-top: 1.5rem;">Maiores Diminuições:</h4>
-                                                """, unsafe_allow_html=True)
-                                                
-                                                # Mostrar as 3 maiores diminuições
-                                                top_decreases = variation_data.sort_values('Variação').head(3)
-                                                for crime, row in top_decreases.iterrows():
-                                                    st.markdown(f"""
-                                                    <div style="background-color: #f0fff0; padding: 0.8rem; border-radius: 0.5rem; margin-bottom: 0.5rem;">
-                                                        <h5 style="margin: 0; color: #007700;">{crime}</h5>
-                                                        <p style="margin: 0; font-weight: bold;">Diminuição de {abs(row['Variação']):.1f}%</p>
-                                                        <p style="margin: 0;">({int(row[month1])} → {int(row[month2])} ocorrências)</p>
-                                                    </div>
-                                                    """, unsafe_allow_html=True)
+                            
+                            # Comparação entre todos os períodos de uma vez (métricas
+                            # calculadas sobre uma única matriz de contagens)
+                            st.subheader("Comparação entre Vários Períodos")
+                            period_col1, period_col2, period_col3 = st.columns(3)
+                            with period_col1:
+                                period_mode = st.radio(
+                                    "Períodos:",
+                                    ["Meses selecionados", "Ano-mês da ocorrência"],
+                                    key="period_mode"
+                                )
+                            metric_options = [
+                                metric for metric in COMPARISON_METRICS
+                                if metric != 'yoy_pct' or period_mode == "Ano-mês da ocorrência"
+                            ]
+                            with period_col2:
+                                period_metric = st.selectbox(
+                                    "Métrica:",
+                                    metric_options,
+                                    format_func=COMPARISON_METRICS.get,
+                                    key="period_metric"
+                                )
+                            with period_col3:
+                                baseline_window = st.slider(
+                                    "Períodos na média móvel:",
+                                    min_value=1, max_value=12, value=BASELINE_WINDOW,
+                                    disabled=period_metric != 'baseline_pct',
+                                    key="baseline_window"
+                                )
+                            
+                            period_fig = create_period_comparison_chart(
+                                comp_cube_filtered,
+                                'EVENTO',
+                                'MES_REFERENCIA' if period_mode == "Meses selecionados" else 'PERIODO',
+                                comp_months if period_mode == "Meses selecionados" else None,
+                                period_metric,
+                                baseline_window
+                            )
+                            if period_fig:
+                                st.plotly_chart(period_fig, use_container_width=True)
                             
                             # Tabela comparativa
                             st.subheader("Tabela Comparativa por Mês")
                             
                             # Criar tabela pivô
-                            pivot_table = pd.pivot_table(
-                                comp_df_filtered,
-                                values='ID',
-                                index=['EVENTO'],
-                                columns=['MES_REFERENCIA'],
-                                aggfunc='count',
-                                fill_value=0
-                            )
+                            pivot_table = comp_cube_filtered.pivot('EVENTO', 'MES_REFERENCIA')
                             
                             # Adicionar linha de total
                             pivot_table.loc['TOTAL'] = pivot_table.sum()
@@ -1255,5 +1346,38 @@ def main():
                     - EVOLUÇÕES
                 """)
 
+# Função para exibir o painel de desempenho da execução (aberto com ?debug=1):
+# etapas em estilo flame graph, linhas processadas e acertos dos caches
+def show_profile_panel(profile):
+    with st.expander("⏱️ Desempenho desta execução", expanded=True):
+        st.caption(f"Tempo total da execução: {profile.total_ms:.0f} ms")
+        records = profile.records()
+        profile_fig = create_profile_chart(records)
+        if profile_fig:
+            st.plotly_chart(profile_fig, use_container_width=True)
+        
+        if records:
+            stages_df = pd.DataFrame(records).rename(columns={
+                'stage': 'Etapa', 'depth': 'Nível', 'start_ms': 'Início (ms)',
+                'duration_ms': 'Duração (ms)', 'rows': 'Linhas'
+            })
+            st.dataframe(stages_df, use_container_width=True, hide_index=True)
+        
+        if profile.caches:
+            caches_df = pd.DataFrame(
+                [(name, hits, misses) for name, (hits, misses) in profile.caches.items()],
+                columns=['Cache', 'Acertos', 'Falhas']
+            )
+            st.dataframe(caches_df, use_container_width=True, hide_index=True)
+
 if __name__ == "__main__":
-    main()
+    # Perfil da execução: sempre com CRIME_APP_PROFILE=1; o painel aparece com ?debug=1
+    show_profile = st.query_params.get("debug") == "1"
+    start_run(PROFILE_ENABLED or show_profile, st.session_state.export_owner)
+    try:
+        with stage("main"):
+            main()
+    finally:
+        profile = finish_run()
+    if profile is not None and show_profile:
+        show_profile_panel(profile)
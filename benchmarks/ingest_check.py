@@ -0,0 +1,109 @@
+# Verificação da leitura em blocos da planilha.
+# Grava uma planilha com datas e horas nos formatos encontrados nas planilhas
+# mensais (células de data/hora do Excel, textos DD/MM/AAAA e HH:MM:SS e
+# células vazias), lê a mesma planilha pelos dois caminhos de ingestão
+# (leitura completa com read_excel e leitura em blocos somente leitura) e
+# confere se DATA_HORA e as colunas numéricas são iguais nos dois.
+#
+# Uso:
+#   python benchmarks/ingest_check.py
+#   python benchmarks/ingest_check.py --rows 5000 --chunk-rows 700
+#
+# Termina com código 1 se os dois caminhos divergirem.
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Cache de snapshots próprio da verificação, definido antes de importar o
+# módulo de ingestão
+CHECK_CACHE_DIR = tempfile.mkdtemp(prefix="crime_app_ingest_check_")
+os.environ["CRIME_APP_CACHE_DIR"] = CHECK_CACHE_DIR
+
+import pandas as pd  # noqa: E402
+
+from ingest import NUMERIC_COLUMNS, iter_excel_chunks, parse_excel  # noqa: E402
+
+from synthetic import generate  # noqa: E402
+
+MONTH = 3
+
+
+# Função para gerar a planilha: um terço das linhas com data e hora como
+# células tipadas do Excel, um terço em texto e parte com células vazias
+def build_workbook(path, rows, seed=0):
+    df = generate(rows, MONTH, seed=seed)
+    dates = df['DATA DE INÍCIO DO ATENDIMENTO'].astype(object)
+    times = df['HORA DE INÍCIO DO ATENDIMENTO'].astype(object)
+
+    typed = df.index % 3 == 0
+    dates[typed] = [datetime.datetime.strptime(value, '%d/%m/%Y') for value in dates[typed]]
+    times[typed] = [datetime.datetime.strptime(value, '%H:%M:%S').time() for value in times[typed]]
+
+    dates[df.index % 17 == 5] = None
+    times[df.index % 19 == 7] = None
+
+    df['DATA DE INÍCIO DO ATENDIMENTO'] = dates
+    df['HORA DE INÍCIO DO ATENDIMENTO'] = times
+    df.to_excel(path, index=False)
+
+
+# Função para comparar os dois caminhos de leitura; retorna as divergências
+def compare_paths(path, chunk_rows):
+    month_name = 'Março'
+    full = parse_excel(path, month_name)
+    streamed = pd.concat(list(iter_excel_chunks(path, chunk_rows, month_name)), ignore_index=True)
+
+    problems = []
+    if len(full) != len(streamed):
+        problems.append(f"linhas: read_excel {len(full)}, em blocos {len(streamed)}")
+        return problems
+
+    if full['DATA_HORA'].isna().all():
+        problems.append("DATA_HORA vazia na leitura completa")
+    if not full['DATA_HORA'].equals(streamed['DATA_HORA']):
+        differs = full['DATA_HORA'].ne(streamed['DATA_HORA']) & ~(
+            full['DATA_HORA'].isna() & streamed['DATA_HORA'].isna()
+        )
+        first = differs.idxmax()
+        problems.append(
+            f"DATA_HORA diverge em {int(differs.sum())} linhas (ex.: linha {first}: "
+            f"read_excel {full['DATA_HORA'][first]}, em blocos {streamed['DATA_HORA'][first]})"
+        )
+
+    for column in NUMERIC_COLUMNS:
+        if column in full and not full[column].astype('float64').equals(streamed[column]):
+            problems.append(f"{column} diverge entre os dois caminhos")
+
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara a leitura completa e a leitura em blocos.")
+    parser.add_argument("--rows", type=int, default=3000, help="linhas da planilha (padrão: 3000)")
+    parser.add_argument("--chunk-rows", type=int, default=1000, help="linhas por bloco (padrão: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="semente dos dados sintéticos")
+    args = parser.parse_args(argv)
+
+    path = os.path.join(CHECK_CACHE_DIR, "planilha.xlsx")
+    try:
+        build_workbook(path, args.rows, args.seed)
+        problems = compare_paths(path, args.chunk_rows)
+    finally:
+        shutil.rmtree(CHECK_CACHE_DIR, ignore_errors=True)
+
+    if problems:
+        print("\n".join(problems), file=sys.stderr)
+        return 1
+
+    print(f"Leitura completa e em blocos iguais ({args.rows} linhas).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
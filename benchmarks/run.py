@@ -0,0 +1,235 @@
+# Benchmarks das etapas principais sobre dados sintéticos.
+# Para cada tamanho, gera as ocorrências (benchmarks/synthetic.py) e mede o
+# tempo (mediana de --repeat execuções) e o pico de memória alocada
+# (tracemalloc, em uma execução separada) de cada etapa:
+#   ingest       conversão da planilha lida para o DataFrame tipado
+#                (com --excel, leitura completa de um .xlsx gerado, até o limite
+#                de linhas do Excel)
+#   units        lista de unidades e índice de unidades (filtro "Unidades")
+#   filter       filter_data com período, tipos de crime, unidade e palavra-chave
+#   aggregation  cubo de contagens, contagens dos gráficos e matriz hora x dia
+#   heatmap      HTML do mapa das coordenadas com as opções padrão do aplicativo
+#   export       planilha Excel dos dados
+# Os resultados podem ser gravados como referência (--save) e comparados com
+# a referência gravada: etapas mais lentas ou com mais memória que a tolerância
+# são apontadas e o comando termina com código 1.
+#
+# Uso:
+#   python benchmarks/run.py                       # 10 mil e 100 mil linhas
+#   python benchmarks/run.py --rows 1000000 --stages ingest filter aggregation
+#   python benchmarks/run.py --save                # grava benchmarks/baseline.json
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Cache de snapshots próprio do benchmark (esvaziado a cada leitura do .xlsx),
+# definido antes de importar o módulo de ingestão
+BENCH_CACHE_DIR = os.path.join(tempfile.gettempdir(), "crime_app_bench_cache")
+os.environ["CRIME_APP_CACHE_DIR"] = BENCH_CACHE_DIR
+
+import pandas as pd  # noqa: E402
+
+from analysis import (  # noqa: E402
+    category_counts, crime_month_counts, filter_data, render_coordinate_map, set_message_handlers
+)
+from cube import CountCube  # noqa: E402
+from exports import excel_bytes  # noqa: E402
+from ingest import ingest, prepare_frame  # noqa: E402
+from schema import MESES, apply_schema  # noqa: E402
+from temporal import hour_weekday_matrix  # noqa: E402
+from unit_index import UnitIndex  # noqa: E402
+
+from synthetic import EXCEL_MAX_ROWS, generate, write  # noqa: E402
+
+STAGES = ['ingest', 'units', 'filter', 'aggregation', 'heatmap', 'export']
+DEFAULT_ROWS = [10000, 100000]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Mês dos dados sintéticos (e filtros usados na etapa filter)
+MONTH = 3
+FILTER_CRIMES = ['FURTO', 'ROUBO', 'AMEAÇA']
+FILTER_UNIT = ['1º BPM']
+FILTER_KEYWORDS = 'celular'
+
+# Etapas mais rápidas que isto não são apontadas como regressão de tempo
+# (a variação entre execuções domina a medida)
+MIN_SECONDS = 0.01
+
+
+# Função para preparar a entrada de cada etapa (fora da medição); retorna a
+# função medida, sem argumentos
+def stage_runner(stage, raw, df, excel_path=None):
+    month_name = MESES[MONTH - 1]
+
+    if stage == 'ingest':
+        if excel_path:
+            def run():
+                # Sem o snapshot da execução anterior: cada execução lê a planilha de novo
+                _clear_cache()
+                return ingest(excel_path, month_name, streaming=False)
+            return run
+        return lambda: apply_schema(prepare_frame(raw.copy(), month_name))
+
+    if stage == 'units':
+        return lambda: UnitIndex.build(df['UNIDADE DA VIATURA']).units
+
+    if stage == 'filter':
+        start = df['DATA_HORA'].min().date() + datetime.timedelta(days=3)
+        end = start + datetime.timedelta(days=14)
+        unit_index = UnitIndex.build(df['UNIDADE DA VIATURA'])
+        return lambda: filter_data(df, start, end, FILTER_CRIMES, [], FILTER_UNIT, FILTER_KEYWORDS,
+                                   unit_index=unit_index)
+
+    if stage == 'aggregation':
+        return lambda: (
+            CountCube.build(df),
+            category_counts(df, 'EVENTO'),
+            category_counts(df, 'ÁREA URBANA'),
+            crime_month_counts(df),
+            hour_weekday_matrix(df),
+        )
+
+    if stage == 'heatmap':
+        return lambda: render_coordinate_map(df, 'points', 12)
+
+    if stage == 'export':
+        return lambda: excel_bytes(df)
+
+    raise ValueError(f"Etapa desconhecida: {stage}")
+
+
+# Função para esvaziar o cache de snapshots do benchmark (etapa ingest com --excel)
+def _clear_cache():
+    if os.path.isdir(BENCH_CACHE_DIR):
+        for name in os.listdir(BENCH_CACHE_DIR):
+            os.remove(os.path.join(BENCH_CACHE_DIR, name))
+
+
+# Função para medir uma etapa: mediana do tempo em `repeat` execuções e pico de
+# memória alocada durante uma execução adicional com o tracemalloc ativo
+def measure(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': round(statistics.median(times), 4), 'peak_mb': round(peak / 1024 / 1024, 2)}
+
+
+# Função para executar as etapas para um tamanho de dados
+def run_size(rows, stages, repeat, seed=0, excel=False):
+    raw = generate(rows, MONTH, seed=seed)
+    df = apply_schema(prepare_frame(raw.copy(), MESES[MONTH - 1]))
+
+    excel_path = None
+    if excel and 'ingest' in stages:
+        if rows > EXCEL_MAX_ROWS:
+            print(f"  {rows} linhas excedem o limite do Excel; ingest medido sem a planilha.", file=sys.stderr)
+        else:
+            excel_path = os.path.join(tempfile.gettempdir(), f"crime_app_bench_{rows}_{seed}.xlsx")
+            if not os.path.exists(excel_path):
+                write(raw, excel_path)
+
+    results = {}
+    for stage in stages:
+        results[stage] = measure(stage_runner(stage, raw, df, excel_path), repeat)
+        print(f"  {stage:<12} {results[stage]['seconds']:>9.4f}s {results[stage]['peak_mb']:>10.2f} MB",
+              file=sys.stderr)
+    return results
+
+
+# Função para comparar os resultados com a referência; retorna as linhas do
+# relatório e se houve regressão
+def compare(results, baseline, tolerance):
+    lines = []
+    regressed = False
+    for rows, stages in results.items():
+        for stage, current in stages.items():
+            reference = baseline.get(rows, {}).get(stage)
+            if reference is None:
+                continue
+            time_ratio = current['seconds'] / reference['seconds'] if reference['seconds'] else 1.0
+            memory_ratio = current['peak_mb'] / reference['peak_mb'] if reference['peak_mb'] else 1.0
+            flags = []
+            if time_ratio > 1 + tolerance and current['seconds'] >= MIN_SECONDS:
+                flags.append("tempo")
+            if memory_ratio > 1 + tolerance:
+                flags.append("memória")
+            regressed = regressed or bool(flags)
+            lines.append(
+                f"{rows:>9} {stage:<12} {time_ratio:>6.2f}x tempo {memory_ratio:>6.2f}x memória"
+                + (f"  <- regressão ({', '.join(flags)})" if flags else "")
+            )
+    return lines, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede tempo e memória das etapas do aplicativo.")
+    parser.add_argument("--rows", type=int, nargs='+', default=DEFAULT_ROWS,
+                        help="tamanhos dos dados (padrão: 10000 100000)")
+    parser.add_argument("--stages", nargs='+', choices=STAGES, default=STAGES, help="etapas medidas")
+    parser.add_argument("--repeat", type=int, default=3, help="execuções por etapa (padrão: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="semente dos dados sintéticos")
+    parser.add_argument("--excel", action="store_true", help="medir a ingestão a partir de um .xlsx")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="arquivo de referência (JSON)")
+    parser.add_argument("--save", action="store_true", help="gravar os resultados como referência")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="aumento aceito em relação à referência (padrão: 0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    set_message_handlers(warning=lambda message: None, error=lambda message: None)
+
+    results = {}
+    for rows in args.rows:
+        print(f"{rows} linhas:", file=sys.stderr)
+        results[str(rows)] = run_size(rows, args.stages, args.repeat, args.seed, args.excel)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as fh:
+                baseline = json.load(fh).get('results', {})
+        for rows, stages in results.items():
+            baseline.setdefault(rows, {}).update(stages)
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump({
+                'python': platform.python_version(),
+                'pandas': pd.__version__,
+                'machine': platform.machine(),
+                'results': baseline,
+            }, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        print(f"Referência gravada em {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Nenhuma referência gravada; use --save para criar uma.")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as fh:
+        baseline = json.load(fh).get('results', {})
+    lines, regressed = compare(results, baseline, args.tolerance)
+    print("\n".join(lines) if lines else "Nenhuma etapa com referência para comparar.")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# Medição do tempo de inicialização do aplicativo.
+# Cada rodada executa, em um processo Python novo (como um worker recém-criado),
+# a primeira execução do app.py pelo AppTest do Streamlit e mede separadamente
+# o import do Streamlit e a primeira execução do script. Também confere quais
+# dependências pesadas foram carregadas: elas devem ser importadas apenas quando
+# a funcionalidade correspondente é usada (exportação, mapas, geocodificação).
+#
+# Uso:
+#   python benchmarks/startup.py
+#   python benchmarks/startup.py --runs 5 --max-seconds 3
+#
+# Termina com código 1 se alguma dependência pesada for carregada na
+# inicialização ou se a mediana da primeira execução passar de --max-seconds.
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+LOGO_PATH = os.path.join("assets", "pmms_logo.png")
+
+# Módulos que não devem ser carregados antes do uso da funcionalidade (o
+# próprio Streamlit importa o plotly base, mas não o plotly.express)
+LAZY_MODULES = [
+    'plotly.express', 'folium', 'branca', 'streamlit_folium', 'openpyxl', 'pptx',
+    'matplotlib', 'geopy', 'kaleido',
+]
+
+# Script executado em cada processo; imprime o resultado em JSON
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+imported = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=120)
+ready = time.perf_counter()
+at.run()
+finished = time.perf_counter()
+print(json.dumps({
+    'import_streamlit': imported - start,
+    'first_run': finished - ready,
+    'exceptions': [e.message for e in at.exception],
+    'modules': sorted(sys.modules),
+}))
+"""
+
+
+# Função para preparar o diretório de trabalho com o logo em assets/ (o app
+# lê o logo por caminho relativo); usa o logo da raiz do repositório se preciso
+def prepare_workdir(workdir):
+    if os.path.exists(os.path.join(workdir, LOGO_PATH)):
+        return workdir
+    temp_dir = tempfile.mkdtemp(prefix="startup_bench_")
+    os.makedirs(os.path.join(temp_dir, "assets"))
+    shutil.copy(os.path.join(ROOT, "pmms_logo.png"), os.path.join(temp_dir, LOGO_PATH))
+    return temp_dir
+
+
+# Função para executar uma rodada em um processo novo
+def run_once(workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run(
+        [sys.executable, "-c", _CHILD, APP_PATH],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o tempo de inicialização do aplicativo.")
+    parser.add_argument("--runs", type=int, default=3, help="número de processos medidos (padrão: 3)")
+    parser.add_argument("--max-seconds", type=float, help="limite para a mediana da primeira execução")
+    parser.add_argument("--workdir", default=ROOT, help="diretório de trabalho do app (padrão: o repositório)")
+    args = parser.parse_args(argv)
+
+    workdir = prepare_workdir(args.workdir)
+    try:
+        results = [run_once(workdir) for _ in range(args.runs)]
+    finally:
+        if workdir != args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    import_times = [r['import_streamlit'] for r in results]
+    run_times = [r['first_run'] for r in results]
+    print(f"import streamlit:  mediana {statistics.median(import_times):.3f}s "
+          f"(min {min(import_times):.3f}s, max {max(import_times):.3f}s)")
+    print(f"primeira execução: mediana {statistics.median(run_times):.3f}s "
+          f"(min {min(run_times):.3f}s, max {max(run_times):.3f}s)")
+
+    failed = False
+    exceptions = results[0]['exceptions']
+    if exceptions:
+        print(f"Erro na execução do app: {exceptions}", file=sys.stderr)
+        failed = True
+
+    loaded = sorted(set(LAZY_MODULES) & set(results[0]['modules']))
+    if loaded:
+        print(f"Dependências carregadas na inicialização: {', '.join(loaded)}", file=sys.stderr)
+        failed = True
+
+    if args.max_seconds is not None and statistics.median(run_times) > args.max_seconds:
+        print(f"A primeira execução passou do limite de {args.max_seconds:.3f}s.", file=sys.stderr)
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+# Gerador de ocorrências sintéticas no formato da planilha mensal.
+# Produz as colunas documentadas no aplicativo (data e hora em texto,
+# UNIDADE DA VIATURA com várias unidades separadas por ";", EVENTO com
+# distribuição concentrada em poucos tipos, históricos e evoluções em
+# português, endereço e coordenadas agrupadas em focos ao redor do centro).
+# A geração é vetorizada: textos e combinações de unidades são montados uma
+# vez em um conjunto de valores distintos e sorteados por índice, o que permite
+# gerar de 10 mil a 5 milhões de linhas em poucos segundos.
+#
+# Uso:
+#   python benchmarks/synthetic.py --rows 100000 --month 3 --output marco.xlsx
+#   python benchmarks/synthetic.py --rows 5000000 --output grande.parquet
+#
+# O Excel aceita no máximo 1.048.575 linhas de dados por aba; volumes maiores
+# devem ser gravados em Parquet (ou usados direto pelo benchmarks/run.py).
+import argparse
+import calendar
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+EXCEL_MAX_ROWS = 1048575
+
+# Centro aproximado da área de cobertura (Campo Grande - MS)
+CENTER_LAT, CENTER_LON = -20.4697, -54.6201
+
+# Tipos de ocorrência, do mais ao menos frequente (pesos de Zipf)
+EVENTS = [
+    'FURTO', 'VIOLÊNCIA DOMÉSTICA', 'AMEAÇA', 'ROUBO', 'LESÃO CORPORAL',
+    'PERTURBAÇÃO DO SOSSEGO', 'ACIDENTE DE TRÂNSITO', 'DANO', 'ESTELIONATO',
+    'TRÁFICO DE DROGAS', 'PORTE ILEGAL DE ARMA', 'EMBRIAGUEZ AO VOLANTE',
+    'DESACATO', 'RECEPTAÇÃO', 'INVASÃO DE DOMICÍLIO', 'FURTO DE VEÍCULO',
+    'ROUBO DE VEÍCULO', 'VIAS DE FATO', 'INJÚRIA', 'DESOBEDIÊNCIA',
+    'HOMICÍDIO', 'TENTATIVA DE HOMICÍDIO', 'ESTUPRO', 'SEQUESTRO',
+]
+EVENT_SKEW = 1.1
+
+UNITS = [
+    '1º BPM', '9º BPM', '10º BPM', '5º BPM', 'CIPM', 'BPTRAN', 'BPCHOQUE',
+    'CPA-1', 'ROTAI', 'GETAM', 'BOPE', '1ª CIPM', '2ª CIPM', 'PM AMBIENTAL',
+]
+# Proporção de textos com uma, duas e três unidades
+UNIT_COUNT_WEIGHTS = [0.70, 0.25, 0.05]
+
+NEIGHBORHOODS = [
+    'CENTRO', 'TIRADENTES', 'COOPHAVILA II', 'MORENINHA', 'AERO RANCHO',
+    'GUANANDI', 'NOVA LIMA', 'UNIVERSITÁRIO', 'SÃO FRANCISCO', 'JARDIM DOS ESTADOS',
+    'MONTE CASTELO', 'VILA NASSER', 'SANTO AMARO', 'PIONEIROS', 'LAS PALMAS',
+    'TAQUARUSSU', 'CARANDÁ BOSQUE', 'ESTRELA DALVA', 'JARDIM PACAEMBU', 'SÃO CONRADO',
+    'COPHASUL', 'VILA ALBA', 'JARDIM PAULISTA', 'MATA DO JACINTO', 'SEMINÁRIO',
+]
+STREETS = [
+    'RUA 14 DE JULHO', 'AV. AFONSO PENA', 'RUA DOM AQUINO', 'AV. MATO GROSSO',
+    'RUA BAHIA', 'AV. CALÓGERAS', 'RUA 26 DE AGOSTO', 'AV. DUQUE DE CAXIAS',
+    'RUA DA PAZ', 'AV. BANDEIRANTES', 'RUA BRILHANTE', 'AV. GURY MARQUES',
+    'RUA MARACAJU', 'AV. JÚLIO DE CASTILHO', 'RUA ANTÔNIO MARIA COELHO',
+    'AV. ERNESTO GEISEL', 'RUA JOAQUIM MURTINHO', 'AV. COSTA E SILVA',
+    'RUA SÃO PAULO', 'AV. TAMANDARÉ', 'RUA PEDRO CELESTINO', 'AV. ZAHRAN',
+]
+MUNICIPALITIES = ['CAMPO GRANDE', 'SIDROLÂNDIA', 'TERENOS', 'JARAGUARI']
+MUNICIPALITY_WEIGHTS = [0.94, 0.03, 0.02, 0.01]
+
+# Peso relativo de cada hora do dia (menos ocorrências de madrugada)
+HOUR_WEIGHTS = np.array([
+    4, 3, 2, 2, 1, 1, 2, 3, 4, 5, 5, 6,
+    6, 6, 6, 6, 7, 8, 9, 9, 9, 8, 7, 5,
+], dtype=np.float64)
+
+# Fragmentos dos históricos e das evoluções
+_SUBJECTS = [
+    'Vítima relata que', 'Solicitante informa que', 'Comunicante afirma que',
+    'Testemunha declara que', 'Guarnição foi acionada pois', 'Vizinhos relatam que',
+]
+_ACTIONS = [
+    'teve o celular furtado', 'foi ameaçada pelo ex-companheiro', 'teve a residência invadida',
+    'foi abordada por dois indivíduos armados', 'sofreu agressão física', 'teve a motocicleta subtraída',
+    'presenciou uma discussão com vias de fato', 'teve o estabelecimento comercial assaltado',
+    'recebeu ameaças por mensagem', 'foi vítima de golpe pelo telefone', 'teve o veículo danificado',
+    'ouviu disparos de arma de fogo', 'encontrou o portão arrombado', 'teve a bolsa arrancada',
+]
+_PLACES = [
+    'na praça', 'em frente ao comércio', 'no ponto de ônibus', 'na residência',
+    'no estacionamento do mercado', 'próximo à escola', 'na via pública', 'no terminal',
+    'em uma conveniência', 'no interior do veículo', 'na feira livre', 'no posto de combustível',
+]
+_DETAILS = [
+    'durante a madrugada.', 'por volta do meio-dia.', 'no início da noite.',
+    'após sair do trabalho.', 'enquanto aguardava o transporte.', 'sem testemunhas no local.',
+    'e o autor fugiu em uma motocicleta.', 'e o suspeito foi reconhecido pela vítima.',
+    'e as câmeras de segurança registraram a ação.', 'e a vítima não soube informar características.',
+]
+_EVOLUTIONS = [
+    'Suspeito evadiu-se do local antes da chegada da guarnição.',
+    'Guarnição conduziu as partes à delegacia de pronto atendimento.',
+    'Realizado patrulhamento nas imediações sem êxito na localização do autor.',
+    'Autor preso em flagrante e encaminhado à DEPAC.',
+    'Vítima orientada a registrar boletim de ocorrência.',
+    'Objeto recuperado e entregue à vítima.',
+    'Solicitado apoio do SAMU para atendimento da vítima.',
+    'Partes orientadas e liberadas no local.',
+]
+
+
+# Função para os pesos de Zipf de n categorias (a primeira é a mais frequente)
+def zipf_weights(n, skew):
+    weights = 1.0 / np.arange(1, n + 1) ** skew
+    return weights / weights.sum()
+
+
+# Função para montar o conjunto de textos de viatura (uma a três unidades) com
+# a probabilidade de cada texto
+def unit_strings(rng, pool_size=400):
+    unit_weights = zipf_weights(len(UNITS), 0.8)
+    texts = {}
+    for _ in range(pool_size):
+        count = rng.choice(len(UNIT_COUNT_WEIGHTS), p=UNIT_COUNT_WEIGHTS) + 1
+        units = rng.choice(len(UNITS), size=count, replace=False, p=unit_weights)
+        text = '; '.join(UNITS[i] for i in units)
+        texts[text] = texts.get(text, 0) + 1.0 / count ** 2
+    weights = np.array(list(texts.values()))
+    return np.array(list(texts), dtype=object), weights / weights.sum()
+
+
+# Função para montar o conjunto de históricos distintos
+def history_texts(rng, size):
+    parts = [rng.integers(0, len(options), size) for options in (_SUBJECTS, _ACTIONS, _PLACES, _DETAILS)]
+    plates = rng.integers(1000, 9999, size)
+    texts = np.empty(size, dtype=object)
+    for i in range(size):
+        text = (f"{_SUBJECTS[parts[0][i]]} {_ACTIONS[parts[1][i]]} {_PLACES[parts[2][i]]} "
+                f"{_DETAILS[parts[3][i]]}")
+        # Parte dos históricos cita uma placa ou um valor, como nos registros reais
+        if i % 3 == 0:
+            text += f" Veículo de placa QA{chr(65 + i % 26)}{plates[i]}."
+        elif i % 3 == 1:
+            text += f" Prejuízo estimado em R$ {plates[i]},00."
+        texts[i] = text
+    return texts
+
+
+# Função para sortear as coordenadas: focos (hotspots) e um fundo disperso ao
+# redor do centro; parte das ocorrências fica sem coordenadas
+def coordinates(rng, rows, n_hotspots=12, hotspot_share=0.6, missing_share=0.03):
+    centers_lat = CENTER_LAT + rng.uniform(-0.06, 0.06, n_hotspots)
+    centers_lon = CENTER_LON + rng.uniform(-0.06, 0.06, n_hotspots)
+
+    in_hotspot = rng.random(rows) < hotspot_share
+    hotspot = rng.choice(n_hotspots, rows, p=zipf_weights(n_hotspots, 0.7))
+    lat = np.where(in_hotspot, centers_lat[hotspot] + rng.normal(0, 0.004, rows),
+                   CENTER_LAT + rng.normal(0, 0.04, rows))
+    lon = np.where(in_hotspot, centers_lon[hotspot] + rng.normal(0, 0.004, rows),
+                   CENTER_LON + rng.normal(0, 0.04, rows))
+
+    missing = rng.random(rows) < missing_share
+    lat[missing] = np.nan
+    lon[missing] = np.nan
+    return lat, lon
+
+
+# Função para gerar as ocorrências de um mês no formato da planilha
+def generate(rows, month=1, year=2024, seed=0):
+    rng = np.random.default_rng(seed)
+
+    # Data e hora em texto (DD/MM/AAAA e HH:MM:SS), montadas a partir dos
+    # textos distintos de cada dia e de cada segundo do dia
+    days_in_month = calendar.monthrange(year, month)[1]
+    day_texts = np.array([f"{day:02d}/{month:02d}/{year}" for day in range(1, days_in_month + 1)], dtype=object)
+    second_texts = np.array(
+        [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)], dtype=object
+    )
+    hours = rng.choice(24, rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    seconds = hours * 3600 + rng.integers(0, 3600, rows)
+
+    units, unit_weights = unit_strings(rng)
+    histories = history_texts(rng, int(min(max(rows // 4, 1000), 200000)))
+    lat, lon = coordinates(rng, rows)
+
+    numbers = rng.integers(1, 3000, rows).astype(str).astype(object)
+    numbers[rng.random(rows) < 0.05] = 'S/N'
+
+    evolutions = np.array(_EVOLUTIONS, dtype=object)[rng.integers(0, len(_EVOLUTIONS), rows)]
+    evolutions[rng.random(rows) < 0.3] = None
+
+    return pd.DataFrame({
+        'ID': np.arange(rows, dtype=np.int64) + month * 10_000_000 + (year % 100) * 1_000_000_000,
+        'DATA DE INÍCIO DO ATENDIMENTO': day_texts[rng.integers(0, days_in_month, rows)],
+        'HORA DE INÍCIO DO ATENDIMENTO': second_texts[seconds],
+        'UNIDADE DA VIATURA': units[rng.choice(len(units), rows, p=unit_weights)],
+        'EVENTO': np.array(EVENTS, dtype=object)[rng.choice(len(EVENTS), rows, p=zipf_weights(len(EVENTS), EVENT_SKEW))],
+        'CIRCUNSTÂNCIA': np.where(rng.random(rows) < 0.85, 'CONSUMADO', 'TENTADO').astype(object),
+        'ÁREA URBANA': np.where(rng.random(rows) < 0.92, 'URBANA', 'RURAL').astype(object),
+        'MUNICÍPIO': np.array(MUNICIPALITIES, dtype=object)[rng.choice(len(MUNICIPALITIES), rows, p=MUNICIPALITY_WEIGHTS)],
+        'LOGRADOURO': np.array(STREETS, dtype=object)[rng.choice(len(STREETS), rows, p=zipf_weights(len(STREETS), 0.6))],
+        'NÚMERO DO LOGRADOURO': numbers,
+        'BAIRRO': np.array(NEIGHBORHOODS, dtype=object)[rng.choice(len(NEIGHBORHOODS), rows, p=zipf_weights(len(NEIGHBORHOODS), 0.8))],
+        'HISTÓRICOS': histories[rng.integers(0, len(histories), rows)],
+        'EVOLUÇÕES': evolutions,
+        'COORDENADA X': lon,
+        'COORDENADA y': lat,
+    })
+
+
+# Função para gravar as ocorrências geradas em .xlsx ou .parquet
+def write(df, path):
+    if path.lower().endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    elif len(df) > EXCEL_MAX_ROWS:
+        raise ValueError(f"O Excel aceita no máximo {EXCEL_MAX_ROWS} linhas; use um arquivo .parquet.")
+    else:
+        df.to_excel(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera uma planilha mensal de ocorrências sintéticas.")
+    parser.add_argument("--rows", type=int, default=10000, help="número de ocorrências (padrão: 10000)")
+    parser.add_argument("--month", type=int, default=1, choices=range(1, 13), help="mês (1 a 12)")
+    parser.add_argument("--year", type=int, default=2024, help="ano (padrão: 2024)")
+    parser.add_argument("--seed", type=int, default=0, help="semente do gerador")
+    parser.add_argument("--output", required=True, help="arquivo de saída (.xlsx ou .parquet)")
+    args = parser.parse_args(argv)
+
+    try:
+        write(generate(args.rows, args.month, args.year, args.seed), args.output)
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+
+    print(os.path.abspath(args.output))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+# Visão combinada dos meses da sessão.
+# Todos os meses carregados são concatenados uma única vez em um DataFrame,
+# com um índice mês -> intervalo de linhas. A seleção de meses passa a ser uma
+# máscara sobre esse DataFrame (como os demais filtros), de modo que ligar ou
+# desligar meses não copia nenhuma linha; resumos por mês (datas, valores
+# distintos) são lidos das fatias de cada intervalo, também sem cópia.
+# A concatenação copia as linhas uma vez por conjunto de meses: a visão é
+# montada em um cache compartilhado entre as sessões (ver app.build_combined_data)
+# e não deve ser alterada depois de montada.
+import os
+
+import numpy as np
+import pandas as pd
+
+from schema import align_categories
+
+# Conjuntos de meses combinados mantidos em memória ao mesmo tempo
+COMBINED_CACHE_ENTRIES = int(os.environ.get("CRIME_APP_COMBINED_CACHE_ENTRIES", "4"))
+
+
+class CombinedView:
+    def __init__(self, df, ranges):
+        # DataFrame com todos os meses e mês -> (linha inicial, linha final)
+        self.df = df
+        self.ranges = ranges
+        self.months = list(ranges)
+
+    def __len__(self):
+        return len(self.df)
+
+    # Função para montar a visão a partir dos DataFrames de cada mês (as
+    # categorias são unificadas em cópias rasas, sem alterar os originais)
+    @classmethod
+    def build(cls, dataframes_dict):
+        frames = align_categories({month: df.copy(deep=False) for month, df in dataframes_dict.items()})
+
+        ranges = {}
+        start = 0
+        for month, df in frames.items():
+            ranges[month] = (start, start + len(df))
+            start += len(df)
+
+        if not frames:
+            return cls(pd.DataFrame(), ranges)
+        return cls(pd.concat(list(frames.values()), ignore_index=True), ranges)
+
+    # Função para obter os meses selecionados que existem na visão (todos quando vazio)
+    def resolve(self, months=None):
+        if not months:
+            return list(self.months)
+        return [month for month in months if month in self.ranges]
+
+    # Função para obter a máscara das linhas dos meses selecionados
+    # (None quando todos os meses estão selecionados)
+    def month_mask(self, months=None):
+        months = self.resolve(months)
+        if set(months) == set(self.months):
+            return None
+
+        mask = np.zeros(len(self.df), dtype=bool)
+        for month in months:
+            start, stop = self.ranges[month]
+            mask[start:stop] = True
+        return mask
+
+    # Função para obter as fatias (sem cópia) de uma coluna nos meses selecionados
+    def column_slices(self, column, months=None):
+        series = self.df[column]
+        return [series.iloc[slice(*self.ranges[month])] for month in self.resolve(months)]
+
+    # Função para contar as linhas dos meses selecionados
+    def rows(self, months=None):
+        return sum(stop - start for start, stop in (self.ranges[month] for month in self.resolve(months)))
+
+    # Função para obter a menor e a maior data/hora dos meses selecionados
+    def date_range(self, months=None, column='DATA_HORA'):
+        slices = [part for part in self.column_slices(column, months) if len(part)]
+        return min(part.min() for part in slices), max(part.max() for part in slices)
+
+    # Função para obter os valores distintos de uma coluna nos meses selecionados
+    def unique(self, column, months=None):
+        values = set()
+        for part in self.column_slices(column, months):
+            values.update(part.dropna().unique())
+        return sorted(values)
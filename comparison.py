@@ -0,0 +1,131 @@
+# Comparação entre vários períodos.
+# As contagens de uma dimensão (ex.: EVENTO) por período são lidas do cubo em
+# uma única matriz (categorias x períodos) e todas as métricas são calculadas
+# com operações vetorizadas sobre essa matriz: variação período a período,
+# variação em relação à média móvel dos períodos anteriores, variação anual e
+# escore z em relação à média dos períodos selecionados.
+import numpy as np
+import pandas as pd
+
+from schema import MESES
+
+# Métricas disponíveis (chave -> rótulo exibido)
+METRICS = {
+    'mom_pct': "Variação em relação ao período anterior (%)",
+    'baseline_pct': "Variação em relação à média móvel dos períodos anteriores (%)",
+    'yoy_pct': "Variação em relação ao mesmo mês do ano anterior (%)",
+    'zscore': "Escore z em relação à média dos períodos selecionados",
+}
+
+# Períodos anteriores considerados na média móvel
+BASELINE_WINDOW = 3
+
+
+# Função para formatar um período AAAAMM como AAAA-MM
+def period_label(period):
+    period = int(period)
+    return f"{period // 100}-{period % 100:02d}" if period > 0 else "Sem data"
+
+
+# Função para ordenar períodos: meses de referência na ordem do calendário
+# (como no aplicativo, outros nomes depois deles) e períodos AAAAMM em ordem crescente
+def sort_periods(periods):
+    return sorted(periods, key=lambda period: (MESES.index(period) if period in MESES else len(MESES), period))
+
+
+# Função para montar a matriz de contagens (categorias x períodos) a partir do
+# cubo. periods define as colunas e a ordem (None: todos os períodos do cubo,
+# em ordem cronológica); períodos sem ocorrências ficam com zero
+def period_matrix(cube, column, period_dimension='MES_REFERENCIA', periods=None):
+    counts = cube.counts([column, period_dimension])
+    matrix = counts.unstack(fill_value=0) if len(counts) else pd.DataFrame()
+
+    if periods is None:
+        periods = sort_periods(matrix.columns)
+    periods = list(periods)
+    matrix = matrix.reindex(columns=periods, fill_value=0)
+    matrix.columns = pd.Index(periods)
+    matrix.index = matrix.index.astype(str)
+    return matrix.astype(np.int64)
+
+
+# Função para dividir ignorando denominadores nulos (resultado NaN)
+def _safe_ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / np.where(denominator > 0, denominator, 1), np.nan)
+
+
+class PeriodComparison:
+    def __init__(self, matrix):
+        # Matriz de contagens: linhas = categorias, colunas = períodos em ordem
+        self.matrix = matrix
+        self.values = matrix.to_numpy(dtype=np.float64)
+
+    def _frame(self, values):
+        return pd.DataFrame(values, index=self.matrix.index, columns=self.matrix.columns)
+
+    # Função para a variação absoluta em relação ao período anterior
+    def deltas(self):
+        values = np.full_like(self.values, np.nan)
+        values[:, 1:] = np.diff(self.values, axis=1)
+        return self._frame(values)
+
+    # Função para a variação percentual em relação ao período anterior
+    def mom_pct(self):
+        values = np.full_like(self.values, np.nan)
+        values[:, 1:] = _safe_ratio(np.diff(self.values, axis=1), self.values[:, :-1]) * 100
+        return self._frame(values)
+
+    # Função para a média dos `window` períodos anteriores (somas acumuladas)
+    def rolling_baseline(self, window=BASELINE_WINDOW):
+        n_periods = self.values.shape[1]
+        cumulative = np.zeros((self.values.shape[0], n_periods + 1))
+        cumulative[:, 1:] = np.cumsum(self.values, axis=1)
+
+        end = np.arange(n_periods)
+        start = np.maximum(end - window, 0)
+        sizes = end - start
+        with np.errstate(divide='ignore', invalid='ignore'):
+            baseline = (cumulative[:, end] - cumulative[:, start]) / sizes
+        baseline[:, sizes == 0] = np.nan
+        return self._frame(baseline)
+
+    # Função para a variação percentual em relação à média móvel
+    def baseline_pct(self, window=BASELINE_WINDOW):
+        baseline = self.rolling_baseline(window).to_numpy()
+        return self._frame(_safe_ratio(self.values - baseline, baseline) * 100)
+
+    # Função para a variação percentual em relação ao mesmo mês do ano anterior
+    # (exige colunas no formato AAAAMM; meses sem o ano anterior ficam NaN)
+    def yoy_pct(self):
+        periods = np.asarray(self.matrix.columns, dtype=np.int64)
+        position = {period: i for i, period in enumerate(periods)}
+        previous = np.array([position.get(period - 100, -1) for period in periods])
+
+        values = np.full_like(self.values, np.nan)
+        has_previous = previous >= 0
+        if has_previous.any():
+            base = self.values[:, previous[has_previous]]
+            values[:, has_previous] = _safe_ratio(self.values[:, has_previous] - base, base) * 100
+        return self._frame(values)
+
+    # Função para o escore z de cada período em relação à média da categoria
+    # nos períodos selecionados (categorias constantes ficam com zero)
+    def zscore(self):
+        mean = self.values.mean(axis=1, keepdims=True)
+        std = self.values.std(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(std > 0, (self.values - mean) / np.where(std > 0, std, 1), 0.0)
+        return self._frame(values)
+
+    # Função para calcular uma métrica pelo nome (ver METRICS)
+    def metric(self, name, window=BASELINE_WINDOW):
+        if name == 'mom_pct':
+            return self.mom_pct()
+        if name == 'baseline_pct':
+            return self.baseline_pct(window)
+        if name == 'yoy_pct':
+            return self.yoy_pct()
+        if name == 'zscore':
+            return self.zscore()
+        raise ValueError(f"Métrica desconhecida: {name}")
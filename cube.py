@@ -0,0 +1,107 @@
+# Cubo de contagens para a análise comparativa.
+# As ocorrências são agrupadas uma única vez pelas dimensões principais (mês,
+# ano-mês, tipo de crime, área urbana e unidade) e apenas as combinações
+# existentes são guardadas, com a respectiva contagem. Gráficos, cards de
+# variação e tabelas comparativas são respondidos filtrando e somando as
+# células do cubo, sem voltar às linhas originais.
+# Hora e dia da semana ficam num cubo separado e menor (TEMPORAL_DIMENSIONS),
+# usado só pela análise temporal: no mesmo cubo, multiplicariam o número de
+# células de todas as consultas comparativas.
+import numpy as np
+import pandas as pd
+
+from unit_index import extract_units
+
+# Dimensões do cubo comparativo (PERIODO é o ano-mês da ocorrência no formato
+# AAAAMM, derivado de DATA_HORA; quase sempre coincide com o mês e não aumenta
+# o número de células)
+CUBE_DIMENSIONS = ['MES_REFERENCIA', 'PERIODO', 'EVENTO', 'ÁREA URBANA', 'UNIDADE DA VIATURA']
+
+# Dimensões do cubo temporal (HORA e DIA_SEMANA vêm pré-calculadas na carga e
+# só são derivadas de DATA_HORA quando ausentes)
+TEMPORAL_DIMENSIONS = ['MES_REFERENCIA', 'EVENTO', 'ÁREA URBANA', 'HORA', 'DIA_SEMANA']
+
+COUNT_COLUMN = 'Contagem'
+
+
+class CountCube:
+    def __init__(self, cells):
+        # Uma linha por combinação existente das dimensões, com a coluna Contagem
+        self.cells = cells
+
+    def __len__(self):
+        return len(self.cells)
+
+    @property
+    def dimensions(self):
+        return [column for column in self.cells.columns if column != COUNT_COLUMN]
+
+    # Função para construir o cubo a partir das ocorrências
+    @classmethod
+    def build(cls, df, dimensions=CUBE_DIMENSIONS):
+        keys = {}
+        for dimension in dimensions:
+            if dimension in df.columns:
+                keys[dimension] = df[dimension]
+            elif dimension == 'PERIODO' and 'DATA_HORA' in df.columns:
+                dates = df['DATA_HORA']
+                keys[dimension] = (dates.dt.year * 100 + dates.dt.month).fillna(-1).astype(np.int32)
+            elif dimension == 'HORA' and 'DATA_HORA' in df.columns:
+                # -1 identifica ocorrências sem data/hora
+                keys[dimension] = df['DATA_HORA'].dt.hour.fillna(-1).astype(np.int8)
+            elif dimension == 'DIA_SEMANA' and 'DATA_HORA' in df.columns:
+                keys[dimension] = df['DATA_HORA'].dt.dayofweek.fillna(-1).astype(np.int8)
+
+        if not keys:
+            return cls(pd.DataFrame({COUNT_COLUMN: [len(df)]}))
+
+        grouped = pd.DataFrame(keys).groupby(list(keys), observed=True, dropna=False, sort=False).size()
+        cells = grouped.reset_index(name=COUNT_COLUMN)
+        cells[COUNT_COLUMN] = cells[COUNT_COLUMN].astype(np.int64)
+        return cls(cells)
+
+    # Função para juntar cubos de meses diferentes
+    @classmethod
+    def concat(cls, cubes):
+        cubes = list(cubes)
+        if not cubes:
+            return cls(pd.DataFrame({COUNT_COLUMN: pd.Series(dtype=np.int64)}))
+        return cls(pd.concat([cube.cells for cube in cubes], ignore_index=True))
+
+    # Função para restringir o cubo; filters mapeia dimensão -> valores aceitos
+    # (dimensões com valor vazio ou None são ignoradas)
+    def slice(self, filters):
+        mask = np.ones(len(self.cells), dtype=bool)
+        for dimension, values in filters.items():
+            if values is None or len(values) == 0:
+                continue
+            mask &= self.cells[dimension].isin(values).to_numpy()
+        return CountCube(self.cells[mask])
+
+    # Função para restringir o cubo às unidades selecionadas (a dimensão guarda
+    # o texto da viatura, que pode conter várias unidades)
+    def slice_units(self, units):
+        if not units:
+            return self
+        column = self.cells['UNIDADE DA VIATURA']
+        texts = column.dropna().unique()
+        selected = [text for text in texts if any(unit in extract_units(text) for unit in units)]
+        return CountCube(self.cells[column.isin(selected).to_numpy()])
+
+    # Função para obter as contagens agregadas pelas dimensões informadas
+    def counts(self, dimensions):
+        if isinstance(dimensions, str):
+            dimensions = [dimensions]
+        return self.cells.groupby(dimensions, observed=True)[COUNT_COLUMN].sum()
+
+    # Função para obter a tabela de contagens (linhas x colunas), com zeros
+    # nas combinações sem ocorrências
+    def pivot(self, index, columns):
+        table = self.counts([index, columns]).unstack(fill_value=0)
+        table.index = table.index.astype(str)
+        table.columns = table.columns.astype(str)
+        return table
+
+    # Função para obter o total de ocorrências do cubo
+    def total(self):
+        return int(self.cells[COUNT_COLUMN].sum())
@@ -0,0 +1,216 @@
+# Registro de bases mensais no servidor.
+# Cada planilha ingerida é gravada uma única vez em disco no formato Arrow IPC
+# (um arquivo por mês, identificado pela chave de ingestão) e listada em um
+# registro JSON. Os arquivos são lidos por mapeamento em memória e o DataFrame
+# resultante é mantido em um cache do processo, compartilhado por todas as
+# sessões; cada sessão guarda apenas os identificadores das bases que usa.
+# Só as colunas numéricas e de data sem valores ausentes apontam para o arquivo
+# mapeado: colunas categóricas, de texto e com valores ausentes são copiadas
+# para a memória do processo na carga (uma vez por base, não por sessão).
+# O diretório tem limite de tamanho e de bases: ao registrar uma nova base,
+# as usadas há mais tempo são removidas (LRU, como o cache de snapshots da
+# ingestão), exceto as que estão carregadas em memória.
+# Os DataFrames compartilhados são somente leitura e não devem ser alterados.
+import datetime
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from schema import add_time_codes
+
+DATASET_DIR = os.environ.get("CRIME_APP_DATASET_DIR", os.path.join(".cache", "datasets"))
+
+# Bases mantidas carregadas em memória ao mesmo tempo
+DATASET_CACHE_ENTRIES = int(os.environ.get("CRIME_APP_DATASET_CACHE_ENTRIES", "24"))
+
+# Limites do diretório de bases (tamanho total e número de bases)
+DATASET_MAX_BYTES = int(float(os.environ.get("CRIME_APP_DATASET_MAX_MB", "2048")) * 1024 * 1024)
+DATASET_MAX_ENTRIES = int(os.environ.get("CRIME_APP_DATASET_MAX_ENTRIES", "100"))
+
+DATASET_SUFFIX = ".arrow"
+REGISTRY_FILE = "registry.json"
+
+
+class DatasetRegistry:
+    def __init__(self, directory=DATASET_DIR, cache_entries=DATASET_CACHE_ENTRIES,
+                 max_bytes=DATASET_MAX_BYTES, max_entries=DATASET_MAX_ENTRIES):
+        self.directory = directory
+        self.cache_entries = cache_entries
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._frames = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    # Função para obter o caminho de um arquivo da base (dados ou índices auxiliares)
+    def path(self, dataset_id, suffix=DATASET_SUFFIX):
+        return os.path.join(self.directory, f"{dataset_id}{suffix}")
+
+    # Função para ler o registro (identificador -> metadados)
+    def _read_registry(self):
+        try:
+            with open(os.path.join(self.directory, REGISTRY_FILE), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    # Função para gravar o registro de forma atômica
+    def _write_registry(self, registry):
+        path = os.path.join(self.directory, REGISTRY_FILE)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fh:
+                json.dump(registry, fh, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # Função para listar as bases registradas (mais recentes primeiro), apenas
+    # as que ainda têm arquivo em disco
+    def list(self):
+        with self._lock:
+            registry = self._read_registry()
+        entries = [
+            dict(entry, id=dataset_id) for dataset_id, entry in registry.items()
+            if os.path.exists(self.path(dataset_id))
+        ]
+        return sorted(entries, key=lambda entry: entry['created_at'], reverse=True)
+
+    # Função para obter os metadados de uma base
+    def info(self, dataset_id):
+        with self._lock:
+            return self._read_registry().get(dataset_id)
+
+    # Função para registrar uma base já ingerida; a mesma planilha (mesma chave
+    # de ingestão) é gravada uma única vez
+    def register(self, df, month, source_name=None):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        dataset_id = df.attrs.get('dataset_key') or uuid.uuid4().hex
+        path = self.path(dataset_id)
+
+        with self._lock:
+            registry = self._read_registry()
+            if dataset_id in registry and os.path.exists(path):
+                self._touch(dataset_id)
+                return dataset_id
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with pa.OSFile(tmp_path, "wb") as sink:
+                    with ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            registry[dataset_id] = {
+                'month': month,
+                'source': source_name,
+                'rows': len(df),
+                'bytes': os.path.getsize(path),
+                'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            }
+            self._write_registry(registry)
+            self.evict(protect=dataset_id)
+
+        return dataset_id
+
+    # Função para carregar uma base (somente leitura). Só as colunas numéricas
+    # e de data sem valores ausentes apontam diretamente para o arquivo mapeado;
+    # as demais são convertidas (copiadas) pelo to_pandas
+    def load(self, dataset_id):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        with self._lock:
+            df = self._frames.get(dataset_id)
+            if df is not None:
+                self._frames.move_to_end(dataset_id)
+                return df
+
+            source = pa.memory_map(self.path(dataset_id), "r")
+            self._touch(dataset_id)
+            table = ipc.open_file(source).read_all()
+            df = table.to_pandas(split_blocks=True)
+            # Bases gravadas antes dos códigos de hora/dia da semana os recebem na carga
+            add_time_codes(df)
+            df.attrs['dataset_key'] = dataset_id
+
+            self._frames[dataset_id] = df
+            while len(self._frames) > self.cache_entries:
+                self._frames.popitem(last=False)
+            return df
+
+    # Função para listar os arquivos de uma base (dados e índices auxiliares)
+    def _entry_files(self, dataset_id):
+        return [name for name in os.listdir(self.directory) if name.split('.', 1)[0] == dataset_id]
+
+    # Função para marcar os arquivos de uma base como acessados agora
+    def _touch(self, dataset_id):
+        for name in self._entry_files(dataset_id):
+            try:
+                os.utime(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    # Função para listar as bases em disco com tamanho total e último acesso
+    def entries(self):
+        entries = {}
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp") or name == REGISTRY_FILE:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            dataset_id = name.split(".", 1)[0]
+            size, last_access = entries.get(dataset_id, (0, 0.0))
+            entries[dataset_id] = (size + stat.st_size, max(last_access, stat.st_mtime))
+        return [(dataset_id, size, last_access) for dataset_id, (size, last_access) in entries.items()]
+
+    # Função para aplicar o limite de tamanho e de bases do diretório,
+    # removendo primeiro as bases usadas há mais tempo (LRU). As bases
+    # carregadas em memória estão em uso e não são removidas
+    def evict(self, max_bytes=None, max_entries=None, protect=None):
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_entries = self.max_entries if max_entries is None else max_entries
+
+        with self._lock:
+            entries = sorted(self.entries(), key=lambda entry: entry[2])
+            total_bytes = sum(size for _, size, _ in entries)
+            total_entries = len(entries)
+
+            removed = []
+            for dataset_id, size, _ in entries:
+                if total_bytes <= max_bytes and total_entries <= max_entries:
+                    break
+                if dataset_id == protect or dataset_id in self._frames:
+                    continue
+                self.remove(dataset_id)
+                removed.append(dataset_id)
+                total_bytes -= size
+                total_entries -= 1
+
+            return removed
+
+    # Função para remover uma base do registro e do disco (inclusive índices
+    # auxiliares gravados com o mesmo identificador)
+    def remove(self, dataset_id):
+        with self._lock:
+            registry = self._read_registry()
+            registry.pop(dataset_id, None)
+            self._write_registry(registry)
+            self._frames.pop(dataset_id, None)
+
+            for name in self._entry_files(dataset_id):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
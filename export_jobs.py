@@ -0,0 +1,163 @@
+# Fila de exportações em segundo plano.
+# As exportações (Excel e PowerPoint) são executadas por um número fixo de
+# threads de trabalho, fora da thread que executa o script do Streamlit, e
+# sobrevivem às reexecuções da página. A próxima exportação é escolhida entre
+# as sessões com menos exportações em andamento, para que nenhum analista ocupe
+# a fila sozinho. Os arquivos prontos ficam em um armazenamento limitado (por
+# quantidade, tamanho total e tempo) até serem baixados ou descartados.
+import os
+import threading
+import time
+import uuid
+
+# Threads de trabalho (exportações executadas ao mesmo tempo)
+EXPORT_WORKERS = int(os.environ.get("CRIME_APP_EXPORT_WORKERS", "2"))
+
+# Exportações aguardando ou em andamento por sessão
+EXPORT_MAX_PENDING_PER_SESSION = int(os.environ.get("CRIME_APP_EXPORT_MAX_PENDING", "3"))
+
+# Limites do armazenamento de arquivos prontos
+EXPORT_MAX_ARTIFACTS = int(os.environ.get("CRIME_APP_EXPORT_MAX_ARTIFACTS", "20"))
+EXPORT_MAX_BYTES = int(float(os.environ.get("CRIME_APP_EXPORT_MAX_MB", "512")) * 1024 * 1024)
+EXPORT_TTL_SECONDS = float(os.environ.get("CRIME_APP_EXPORT_TTL_MINUTES", "60")) * 60
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ExportJob:
+    def __init__(self, owner, label, file_name, mime, run):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.label = label
+        self.file_name = file_name
+        self.mime = mime
+        # run(progress) deve devolver os bytes (ou um BytesIO) do arquivo
+        self.run = run
+        self.status = QUEUED
+        self.progress = 0.0
+        self.error = None
+        self.data = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def size(self):
+        return len(self.data) if self.data is not None else 0
+
+
+class ExportJobManager:
+    def __init__(self, workers=EXPORT_WORKERS, max_pending=EXPORT_MAX_PENDING_PER_SESSION,
+                 max_artifacts=EXPORT_MAX_ARTIFACTS, max_bytes=EXPORT_MAX_BYTES,
+                 ttl_seconds=EXPORT_TTL_SECONDS):
+        self.max_pending = max_pending
+        self.max_artifacts = max_artifacts
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._condition = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"export-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # Função para enfileirar uma exportação; devolve None quando a sessão já
+    # atingiu o limite de exportações pendentes
+    def submit(self, owner, label, file_name, mime, run):
+        with self._condition:
+            pending = sum(1 for job in self._jobs.values() if job.owner == owner and job.active)
+            if pending >= self.max_pending:
+                return None
+
+            job = ExportJob(owner, label, file_name, mime, run)
+            self._jobs[job.id] = job
+            self._condition.notify()
+            return job
+
+    # Função para listar as exportações de uma sessão (mais recentes primeiro)
+    def jobs(self, owner):
+        with self._condition:
+            self._evict()
+            found = [job for job in self._jobs.values() if job.owner == owner]
+        return sorted(found, key=lambda job: job.created_at, reverse=True)
+
+    # Função para obter uma exportação pelo identificador
+    def get(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    # Função para descartar uma exportação (exportações em andamento não são
+    # interrompidas)
+    def remove(self, job_id):
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != RUNNING:
+                del self._jobs[job_id]
+
+    # Função para escolher a próxima exportação: a mais antiga da sessão com
+    # menos exportações em andamento
+    def _next_job(self):
+        running = {}
+        for job in self._jobs.values():
+            if job.status == RUNNING:
+                running[job.owner] = running.get(job.owner, 0) + 1
+
+        queued = [job for job in self._jobs.values() if job.status == QUEUED]
+        if not queued:
+            return None
+        return min(queued, key=lambda job: (running.get(job.owner, 0), job.created_at))
+
+    # Função executada pelas threads de trabalho
+    def _worker(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+                job.status = RUNNING
+
+            def progress(done, total, job=job):
+                job.progress = min(done / total, 1.0) if total else 1.0
+
+            data, error = None, None
+            try:
+                data = job.run(progress)
+                data = data.getvalue() if hasattr(data, 'getvalue') else data
+            except Exception as e:
+                error = str(e)
+
+            with self._condition:
+                job.run = None
+                job.data = data
+                job.error = error
+                job.finished_at = time.time()
+                job.progress = 1.0 if error is None else job.progress
+                job.status = DONE if error is None else FAILED
+                self._evict()
+
+    # Função para descartar arquivos expirados e, acima dos limites de
+    # quantidade ou tamanho, os arquivos prontos mais antigos
+    def _evict(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if not job.active and now - job.finished_at > self.ttl_seconds:
+                del self._jobs[job_id]
+
+        finished = sorted(
+            (job for job in self._jobs.values() if not job.active),
+            key=lambda job: job.finished_at
+        )
+        total_bytes = sum(job.size for job in finished)
+        while finished and (len(finished) > self.max_artifacts or total_bytes > self.max_bytes):
+            job = finished.pop(0)
+            total_bytes -= job.size
+            del self._jobs[job.id]
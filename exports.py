@@ -0,0 +1,352 @@
+# Exportação dos dados filtrados para Excel e PowerPoint.
+# Excel: as linhas são gravadas em blocos a partir de colunas já convertidas para
+# valores nativos (datas, números e textos, com ausentes como célula vazia).
+# No modo streaming as abas são write-only: cada linha é serializada ao ser
+# adicionada, sem manter objetos de célula em memória. Exportações maiores que
+# o limite de linhas de uma aba são divididas em várias abas de dados. As
+# colunas auxiliares da carga (schema.HELPER_COLUMNS) e os códigos de setor
+# calculados na visão combinada (SETOR) não são exportados.
+# PowerPoint: as imagens dos gráficos são renderizadas em paralelo por um pool
+# de processos (cada um com o seu Kaleido), direto para bytes em memória, e
+# guardadas em cache pelo hash da especificação da figura.
+# openpyxl e python-pptx são importados apenas na primeira exportação, para
+# não atrasar a inicialização do aplicativo.
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from schema import HELPER_COLUMNS, count_values
+from sectors import SECTOR_COLUMN
+
+# Linhas de dados por aba (o Excel aceita 1.048.576 linhas, incluindo o cabeçalho)
+EXCEL_SHEET_ROWS = int(os.environ.get("CRIME_APP_EXCEL_SHEET_ROWS", "1048575"))
+
+# Linhas convertidas por bloco durante a gravação
+EXCEL_CHUNK_ROWS = int(os.environ.get("CRIME_APP_EXCEL_CHUNK_ROWS", "20000"))
+
+# A partir deste número de linhas a exportação usa abas write-only
+EXCEL_STREAMING_MIN_ROWS = int(os.environ.get("CRIME_APP_EXCEL_STREAMING_MIN_ROWS", "20000"))
+
+# Processos usados para renderizar as imagens dos gráficos
+RENDER_WORKERS = int(os.environ.get("CRIME_APP_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Imagens de gráficos mantidas no cache (por hash da especificação)
+IMAGE_CACHE_ENTRIES = int(os.environ.get("CRIME_APP_IMAGE_CACHE_ENTRIES", "64"))
+
+# Colunas que não vão para a exportação
+EXCLUDED_COLUMNS = HELPER_COLUMNS + [SECTOR_COLUMN]
+
+DATA_SHEET_TITLE = "Dados Criminais"
+CHART_SHEET_TITLE = "Gráficos"
+
+
+# Função para gerar as linhas de um DataFrame em blocos, com valores nativos
+# por coluna (datas, números e textos) e ausentes como None
+def iter_excel_rows(df, chunk_rows=EXCEL_CHUNK_ROWS):
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.itertuples(index=False, name=None)
+
+
+# Função para obter as colunas exportadas (as da planilha e as derivadas
+# exibidas no aplicativo, sem as colunas auxiliares)
+def export_columns(df):
+    return [column for column in df.columns if column not in EXCLUDED_COLUMNS]
+
+
+# Função para obter o título de cada aba de dados ("Dados Criminais", "Dados Criminais (2)", ...)
+def data_sheet_title(number):
+    return DATA_SHEET_TITLE if number == 1 else f"{DATA_SHEET_TITLE} ({number})"
+
+
+# Função para gravar as linhas nas abas de dados, abrindo uma nova aba sempre
+# que o limite de linhas é atingido. progress(linhas gravadas, total) é chamado
+# a cada bloco
+def write_data_sheets(wb, df, sheet_rows=EXCEL_SHEET_ROWS, chunk_rows=EXCEL_CHUNK_ROWS, progress=None):
+    columns = export_columns(df)
+    header = [str(column) for column in columns]
+    n_sheets = max(1, -(-len(df) // sheet_rows))
+    written = 0
+
+    for number in range(1, n_sheets + 1):
+        ws = wb.create_sheet(title=data_sheet_title(number))
+        ws.append(header)
+        part = df.iloc[(number - 1) * sheet_rows:number * sheet_rows]
+        for start in range(0, len(part), chunk_rows):
+            chunk = part.iloc[start:start + chunk_rows]
+            for row in iter_excel_rows(chunk[columns], chunk_rows):
+                ws.append(row)
+            written += len(chunk)
+            if progress is not None:
+                progress(written, len(df))
+
+    return n_sheets
+
+
+# Função para criar a aba de gráficos com a contagem por tipo de crime
+def write_chart_sheet(wb, df):
+    from openpyxl.chart import BarChart, Reference
+
+    ws_charts = wb.create_sheet(title=CHART_SHEET_TITLE)
+
+    # Adicionar dados para gráficos
+    crime_counts = count_values(df['EVENTO']).reset_index()
+    crime_counts.columns = ['Tipo de Crime', 'Contagem']
+
+    ws_charts.append(list(crime_counts.columns))
+    for row in iter_excel_rows(crime_counts):
+        ws_charts.append(row)
+
+    # Criar gráfico de barras
+    chart = BarChart()
+    chart.title = "Ocorrências por Tipo de Crime"
+    chart.x_axis.title = "Tipo de Crime"
+    chart.y_axis.title = "Contagem"
+
+    data = Reference(ws_charts, min_col=2, min_row=1, max_row=len(crime_counts)+1)
+    cats = Reference(ws_charts, min_col=1, min_row=2, max_row=len(crime_counts)+1)
+    chart.add_data(data, titles_from_data=True)
+    chart.set_categories(cats)
+
+    ws_charts.add_chart(chart, "A10")
+
+
+# Função para gerar o arquivo Excel (abas de dados e aba de gráficos) em memória.
+# Com streaming=None o modo write-only é escolhido pelo número de linhas
+def excel_bytes(df, streaming=None, sheet_rows=EXCEL_SHEET_ROWS, progress=None):
+    from openpyxl import Workbook
+
+    if streaming is None:
+        streaming = len(df) >= EXCEL_STREAMING_MIN_ROWS
+
+    wb = Workbook(write_only=streaming)
+    if not streaming:
+        # O workbook normal já vem com uma aba vazia
+        wb.remove(wb.active)
+
+    write_data_sheets(wb, df, sheet_rows, progress=progress)
+    write_chart_sheet(wb, df)
+
+    output = io.BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return output
+
+
+_image_cache = OrderedDict()
+_image_cache_lock = threading.Lock()
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+# Função para calcular o hash da especificação de uma figura (dados e layout)
+# junto com as opções de renderização
+def figure_hash(spec, image_format='png'):
+    return hashlib.sha256(f"{image_format}:{spec}".encode('utf-8')).hexdigest()
+
+
+# Função executada nos processos do pool: renderiza a especificação em bytes
+def _render_spec(spec, image_format='png'):
+    import plotly.io as pio
+
+    return pio.from_json(spec).to_image(format=image_format)
+
+
+# Função para obter o pool de renderização (criado uma vez e reaproveitado).
+# Os processos são iniciados com spawn para não herdar as threads do servidor
+def _get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _render_pool
+
+
+# Função para consultar o cache de imagens (atualiza a ordem de uso)
+def _cached_image(key):
+    with _image_cache_lock:
+        image = _image_cache.get(key)
+        if image is not None:
+            _image_cache.move_to_end(key)
+        return image
+
+
+# Função para guardar uma imagem no cache, descartando as menos usadas
+def _store_image(key, image):
+    with _image_cache_lock:
+        _image_cache[key] = image
+        _image_cache.move_to_end(key)
+        while len(_image_cache) > IMAGE_CACHE_ENTRIES:
+            _image_cache.popitem(last=False)
+
+
+# Função para renderizar várias figuras em bytes de imagem. Figuras já
+# renderizadas vêm do cache; as demais são distribuídas entre os processos do
+# pool (figuras idênticas são renderizadas uma única vez). Aceita figuras ou
+# especificações JSON já prontas (ex.: do cache de gráficos). None gera None
+def render_images(figures, image_format='png'):
+    specs = [fig if fig is None or isinstance(fig, str) else fig.to_json() for fig in figures]
+    keys = [None if spec is None else figure_hash(spec, image_format) for spec in specs]
+
+    images = {}
+    pending = {}
+    for key, spec in zip(keys, specs):
+        if key is None or key in images or key in pending:
+            continue
+        image = _cached_image(key)
+        if image is not None:
+            images[key] = image
+        else:
+            pending[key] = spec
+
+    if len(pending) == 1 or (pending and RENDER_WORKERS <= 1):
+        for key, spec in pending.items():
+            images[key] = _render_spec(spec, image_format)
+            _store_image(key, images[key])
+    elif pending:
+        pool = _get_render_pool()
+        futures = {key: pool.submit(_render_spec, spec, image_format) for key, spec in pending.items()}
+        for key, future in futures.items():
+            images[key] = future.result()
+            _store_image(key, images[key])
+
+    return [None if key is None else images[key] for key in keys]
+
+
+# Função para gerar a apresentação PowerPoint em memória. progress(etapa, total)
+# é chamado após a renderização das imagens e ao final
+def ppt_bytes(df, bar_fig, pie_fig, analysis_fig, comparative_fig=None, progress=None):
+    from pptx import Presentation
+    from pptx.util import Inches, Pt
+
+    # Criar apresentação
+    prs = Presentation()
+
+    # Slide de título
+    title_slide_layout = prs.slide_layouts[0]
+    slide = prs.slides.add_slide(title_slide_layout)
+    title = slide.shapes.title
+    subtitle = slide.placeholders[1]
+
+    title.text = "Análise de Dados Criminais"
+
+    # Verificar se há múltiplos meses
+    if 'MES_REFERENCIA' in df.columns and df['MES_REFERENCIA'].nunique() > 1:
+        months = sorted(df['MES_REFERENCIA'].unique())
+        subtitle.text = f"Análise Comparativa: {', '.join(months)}"
+    else:
+        subtitle.text = f"Período: {df['DATA_HORA'].min().strftime('%d/%m/%Y')} a {df['DATA_HORA'].max().strftime('%d/%m/%Y')}"
+
+    # Renderizar as imagens dos gráficos em paralelo (ou obtê-las do cache)
+    charts = [
+        (bar_fig, "Ocorrências por Tipo de Crime"),
+        (pie_fig, "Proporção por Tipo de Crime"),
+        (analysis_fig, "Análise de Crimes por Mês"),
+        (comparative_fig, "Análise Comparativa entre Períodos"),
+    ]
+    images = render_images([fig for fig, _ in charts])
+    if progress is not None:
+        progress(1, 2)
+
+    # Um slide por gráfico disponível
+    for (fig, slide_title), image in zip(charts, images):
+        if image is None:
+            continue
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        title = slide.shapes.title
+        title.text = slide_title
+
+        slide.shapes.add_picture(io.BytesIO(image), Inches(1), Inches(1.5), width=Inches(8))
+
+    # Slide para tabela de totalizadores
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    title = slide.shapes.title
+    title.text = "Resumo Estatístico"
+
+    # Criar tabela de totalizadores
+    crime_counts = count_values(df['EVENTO']).reset_index()
+    crime_counts.columns = ['Tipo de Crime', 'Contagem']
+
+    rows, cols = len(crime_counts) + 1, 2
+    left = Inches(2)
+    top = Inches(2)
+    width = Inches(6)
+    height = Inches(0.5 * rows)
+
+    table = slide.shapes.add_table(rows, cols, left, top, width, height).table
+
+    # Preencher cabeçalho
+    table.cell(0, 0).text = "Tipo de Crime"
+    table.cell(0, 1).text = "Contagem"
+
+    # Preencher dados
+    for i, (crime, count) in enumerate(zip(crime_counts['Tipo de Crime'], crime_counts['Contagem'])):
+        table.cell(i+1, 0).text = str(crime)
+        table.cell(i+1, 1).text = str(count)
+
+    # Slide para análise textual
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    title = slide.shapes.title
+    title.text = "Análise Textual"
+
+    # Gerar análise textual simples
+    total_ocorrencias = len(df)
+    crime_mais_comum = crime_counts.iloc[0]['Tipo de Crime']
+    qtd_crime_mais_comum = crime_counts.iloc[0]['Contagem']
+
+    text_box = slide.shapes.add_textbox(Inches(1), Inches(1.5), Inches(8), Inches(4))
+    text_frame = text_box.text_frame
+
+    p = text_frame.add_paragraph()
+    p.text = f"Análise de {total_ocorrencias} ocorrências registradas no período."
+    p.font.size = Pt(14)
+
+    p = text_frame.add_paragraph()
+    p.text = f"O tipo de crime mais comum foi '{crime_mais_comum}' com {qtd_crime_mais_comum} ocorrências, representando {(qtd_crime_mais_comum/total_ocorrencias*100):.1f}% do total."
+    p.font.size = Pt(14)
+
+    # Adicionar análise comparativa se houver múltiplos meses
+    if 'MES_REFERENCIA' in df.columns and df['MES_REFERENCIA'].nunique() > 1:
+        p = text_frame.add_paragraph()
+        p.text = f"A análise comparativa entre {df['MES_REFERENCIA'].nunique()} períodos mostra variações nos padrões criminais ao longo do tempo."
+        p.font.size = Pt(14)
+
+        # Análise por mês
+        monthly_data = df.groupby('MES_REFERENCIA', observed=True).size()
+        max_month = monthly_data.idxmax()
+        min_month = monthly_data.idxmin()
+
+        p = text_frame.add_paragraph()
+        p.text = f"O período com maior número de ocorrências foi {max_month} com {monthly_data[max_month]} registros."
+        p.font.size = Pt(14)
+
+        p = text_frame.add_paragraph()
+        p.text = f"O período com menor número de ocorrências foi {min_month} com {monthly_data[min_month]} registros."
+        p.font.size = Pt(14)
+    else:
+        p = text_frame.add_paragraph()
+        p.text = f"A média mensal de ocorrências no período analisado foi de {total_ocorrencias / df['DATA_HORA'].dt.to_period('M').nunique():.1f} registros."
+        p.font.size = Pt(14)
+
+    # Adicionar créditos do autor
+    p = text_frame.add_paragraph()
+    p.text = "Criado por Leandro Vieira de Souza"
+    p.font.size = Pt(12)
+    p.font.italic = True
+
+    # Salvar apresentação em um buffer
+    output = io.BytesIO()
+    prs.save(output)
+    output.seek(0)
+    if progress is not None:
+        progress(2, 2)
+
+    return output
@@ -0,0 +1,101 @@
+# Cache dos gráficos em duas camadas.
+# - Agregações (contagens por categoria, por mês etc.) guardadas por (versão
+#   dos dados, hash da máscara das linhas filtradas, escopo, agregação): um
+#   widget que não altera as linhas filtradas não refaz nenhuma contagem, e
+#   filtros diferentes que resultam nas mesmas linhas compartilham o resultado.
+# - Figuras guardadas por (chave da agregação, estilo), junto com a sua
+#   especificação JSON. A tela exibe a figura; a exportação para PowerPoint
+#   usa o JSON (imutável, seguro para a fila de exportação em segundo plano),
+#   que também é a chave do cache de imagens renderizadas.
+# O cache é compartilhado entre as sessões (os dados são identificados pelo
+# conteúdo das planilhas) e descarta as entradas menos usadas.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from instrumentation import cache_event
+
+# Agregações e figuras mantidas no cache (cada camada)
+FIGURE_CACHE_ENTRIES = int(os.environ.get("CRIME_APP_FIGURE_CACHE_ENTRIES", "256"))
+
+
+# Função para calcular o hash de uma máscara de linhas (None = todas as linhas)
+def mask_hash(mask):
+    if mask is None:
+        return None
+    mask = np.asarray(mask, dtype=bool)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(len(mask).to_bytes(8, 'little'))
+    digest.update(np.packbits(mask).tobytes())
+    return digest.hexdigest()
+
+
+class FigureCache:
+    def __init__(self, max_entries=FIGURE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        # Chave da agregação -> resultado
+        self._aggregates = OrderedDict()
+        # (chave da agregação, estilo) -> (figura, especificação JSON)
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+        # Contadores de acertos e cálculos (útil para diagnóstico)
+        self.stats = {'aggregate_hits': 0, 'aggregate_builds': 0, 'figure_hits': 0, 'figure_builds': 0}
+
+    # Função para consultar uma camada do cache (atualiza a ordem de uso)
+    def _get(self, entries, key, counter):
+        with self._lock:
+            if key in entries:
+                entries.move_to_end(key)
+                self.stats[f'{counter}_hits'] += 1
+                cache_event(f'chart_{counter}', True)
+                return True, entries[key]
+        cache_event(f'chart_{counter}', False)
+        return False, None
+
+    # Função para guardar um valor em uma camada, descartando os menos usados
+    def _store(self, entries, key, value, counter):
+        with self._lock:
+            entries[key] = value
+            entries.move_to_end(key)
+            self.stats[f'{counter}_builds'] += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    # Função para obter uma agregação; build() só é chamado se ela não estiver no cache
+    def aggregate(self, key, build):
+        found, value = self._get(self._aggregates, key, 'aggregate')
+        if not found:
+            value = build()
+            self._store(self._aggregates, key, value, 'aggregate')
+        return value
+
+    # Função para obter (figura, especificação JSON) de uma agregação com um
+    # estilo; draw(agregação) recebe a agregação do cache. Figuras None (sem
+    # dados) não são guardadas, para que o aviso seja exibido a cada execução
+    def entry(self, key, style, aggregate, draw):
+        found, value = self._get(self._figures, (key, style), 'figure')
+        if found:
+            return value
+
+        fig = draw(self.aggregate(key, aggregate))
+        if fig is None:
+            return None, None
+        value = (fig, fig.to_json())
+        self._store(self._figures, (key, style), value, 'figure')
+        return value
+
+    # Função para obter apenas a figura (exibição na tela)
+    def figure(self, key, style, aggregate, draw):
+        return self.entry(key, style, aggregate, draw)[0]
+
+    # Função para obter apenas a especificação JSON (exportação)
+    def spec(self, key, style, aggregate, draw):
+        return self.entry(key, style, aggregate, draw)[1]
+
+    def clear(self):
+        with self._lock:
+            self._aggregates.clear()
+            self._figures.clear()
@@ -0,0 +1,279 @@
+# Motor de filtros incremental.
+# Cada predicado (meses, período, tipo de crime, localidade, setor, unidade e
+# palavras-chave) gera uma máscara booleana guardada junto com o valor que a
+# produziu. A cada interação só é recalculado o predicado cujo valor mudou, e
+# as máscaras são combinadas com AND sobre a visão combinada de todos os meses
+# carregados (a seleção de meses é apenas mais uma máscara).
+# O motor fica na sessão e guarda só a chave dos dados, as máscaras e resultados
+# agregados: a visão, os índices e os cubos são compartilhados entre as sessões
+# e repassados a cada execução, e as linhas filtradas não são guardadas.
+import numpy as np
+import pandas as pd
+
+from cube import CountCube
+from instrumentation import cache_event
+from text_index import is_indexable
+from unit_index import extract_units
+
+# Ordem em que os predicados são avaliados e combinados
+PREDICATES = ['months', 'date', 'crime_type', 'location', 'sector', 'unit', 'keywords']
+
+# Predicados que podem ser respondidos diretamente pelo cubo de contagens
+# e pelo cubo temporal (que não tem a dimensão de unidade)
+CUBE_PREDICATES = {'months', 'crime_type', 'location', 'unit'}
+TEMPORAL_PREDICATES = {'months', 'crime_type', 'location'}
+
+
+# Função para a máscara do filtro de período
+def date_mask(df, start_date, end_date):
+    if not (start_date and end_date):
+        return None
+    return (
+        (df['DATA_HORA'] >= pd.to_datetime(start_date)) &
+        (df['DATA_HORA'] <= pd.to_datetime(end_date))
+    ).to_numpy()
+
+
+# Função para a máscara do filtro de tipo de crime
+def crime_mask(df, crime_type):
+    if not crime_type:
+        return None
+    return df['EVENTO'].isin(crime_type).to_numpy()
+
+
+# Função para a máscara do filtro de localidade
+def location_mask(df, location):
+    if not location:
+        return None
+    return df['ÁREA URBANA'].isin(location).to_numpy()
+
+
+# Função para a máscara do filtro de setor de policiamento (coluna SETOR,
+# presente quando há setores carregados)
+def sector_mask(df, sector):
+    if not sector or 'SETOR' not in df.columns:
+        return None
+    return df['SETOR'].isin(sector).to_numpy()
+
+
+# Função para a máscara do filtro de unidade responsável, usando o índice de
+# unidades quando disponível (deve corresponder às linhas de df)
+def unit_mask(df, unit, unit_index=None):
+    if not unit:
+        return None
+    if unit_index is not None and len(unit_index) == len(df):
+        return unit_index.mask(unit)
+    return df['UNIDADE DA VIATURA'].apply(
+        lambda x: any(selected_unit in extract_units(x) for selected_unit in unit)
+    ).to_numpy(dtype=bool)
+
+
+# Função para a máscara do filtro de palavras-chave (históricos e evoluções),
+# usando o índice invertido de texto quando disponível. Buscas que o índice não
+# responde (sem termos, ex.: "-", ou com termos longos demais) procuram o trecho
+# literal no texto, como antes do índice
+def keyword_mask(df, keywords, text_index=None):
+    if not keywords:
+        return None
+    regex = True
+    if text_index is not None and len(text_index) == len(df):
+        if is_indexable(keywords):
+            return text_index.query(keywords)
+        regex = False
+    return (
+        df['HISTÓRICOS'].str.contains(keywords, case=False, na=False, regex=regex) |
+        df['EVOLUÇÕES'].str.contains(keywords, case=False, na=False, regex=regex)
+    ).to_numpy()
+
+
+# Função para combinar máscaras com AND (None significa predicado inativo)
+def combine_masks(masks):
+    combined = None
+    for mask in masks:
+        if mask is None:
+            continue
+        combined = mask.copy() if combined is None else combined & mask
+    return combined
+
+
+# Função para transformar o valor de um filtro em chave comparável
+def _freeze(value):
+    if isinstance(value, (list, set)):
+        return tuple(sorted(str(item) for item in value))
+    return value
+
+
+class FilterEngine:
+    def __init__(self):
+        # Chave do conjunto de meses e dados combinados da execução atual
+        # (visão combinada, índice de unidades, índice de texto, cubo de
+        # contagens, cubo temporal)
+        self._data_key = None
+        self._data = None
+        # Predicado -> (valor do filtro, máscara)
+        self._masks = {}
+        # Máscara combinada dos filtros atuais (None quando nenhum filtra linhas)
+        self._result_key = None
+        self._mask = None
+        self._cube_key = None
+        self._cube = None
+        # Resultados derivados do filtro atual (chave -> valor), ver derived()
+        self._derived_key = None
+        self._derived = {}
+        # Predicados recalculados na última aplicação (útil para diagnóstico)
+        self.last_recomputed = []
+
+    # Função para informar os dados combinados do conjunto de meses ativo (a
+    # cada execução). As máscaras só são descartadas quando a chave muda
+    def set_data(self, data_key, data):
+        self._data = data
+        if data_key == self._data_key:
+            return self.df
+
+        self._data_key = data_key
+        self._masks = {}
+        self._result_key = None
+        self._mask = None
+        self._cube_key = None
+        self._cube = None
+        self._derived_key = None
+        self._derived = {}
+        return self.df
+
+    # Chave do conjunto de meses ativo (identifica a versão dos dados)
+    @property
+    def data_key(self):
+        return self._data_key
+
+    @property
+    def view(self):
+        return self._data[0]
+
+    @property
+    def df(self):
+        return self.view.df
+
+    @property
+    def unit_index(self):
+        return self._data[1]
+
+    @property
+    def text_index(self):
+        return self._data[2]
+
+    @property
+    def data_cube(self):
+        return self._data[3]
+
+    @property
+    def data_temporal_cube(self):
+        return self._data[4]
+
+    # Função para aplicar os filtros, recalculando apenas os predicados alterados
+    # (months: meses incluídos na análise; vazio ou None inclui todos)
+    def apply(self, start_date, end_date, crime_type, location, unit, keywords, months=None,
+              sector=None):
+        df = self.df
+        values = {
+            'months': self.view.resolve(months),
+            'date': (start_date, end_date),
+            'crime_type': crime_type,
+            'location': location,
+            'sector': sector,
+            'unit': unit,
+            'keywords': keywords,
+        }
+        compute = {
+            'months': lambda: self.view.month_mask(months),
+            'date': lambda: date_mask(df, start_date, end_date),
+            'crime_type': lambda: crime_mask(df, crime_type),
+            'location': lambda: location_mask(df, location),
+            'sector': lambda: sector_mask(df, sector),
+            'unit': lambda: unit_mask(df, unit, self.unit_index),
+            'keywords': lambda: keyword_mask(df, keywords, self.text_index),
+        }
+
+        self.last_recomputed = []
+        for name in PREDICATES:
+            key = _freeze(values[name])
+            cached = self._masks.get(name)
+            hit = cached is not None and cached[0] == key
+            cache_event('filter_mask', hit)
+            if not hit:
+                self._masks[name] = (key, compute[name]())
+                self.last_recomputed.append(name)
+
+        result_key = tuple(self._masks[name][0] for name in PREDICATES)
+        if result_key != self._result_key:
+            self._mask = combine_masks(self._masks[name][1] for name in PREDICATES)
+            self._result_key = result_key
+        return self.result()
+
+    # Função para obter as linhas filtradas (selecionadas a cada chamada a
+    # partir da máscara combinada, sem ficar guardadas na sessão)
+    def result(self):
+        return self.df if self._mask is None else self.df[self._mask]
+
+    # Função para obter a máscara combinada atual sobre o DataFrame combinado
+    def mask(self):
+        return np.ones(len(self.df), dtype=bool) if self._mask is None else self._mask
+
+    # Função para obter o cubo de contagens do resultado filtrado atual.
+    # Quando os filtros ativos são dimensões do cubo (meses, tipo de crime,
+    # área e unidade), o cubo dos meses é apenas fatiado; caso contrário, é agrupado
+    # uma vez a partir das linhas filtradas. O cubo fica guardado até os
+    # filtros mudarem
+    def cube(self):
+        if self._cube_key == self._result_key and self._cube is not None:
+            return self._cube
+
+        if self._active() <= CUBE_PREDICATES:
+            cube = self._slice_cube(self.data_cube)
+        else:
+            cube = CountCube.build(self.result())
+
+        self._cube = cube
+        self._cube_key = self._result_key
+        return cube
+
+    # Função para obter o cubo temporal (hora e dia da semana) do resultado
+    # filtrado atual, ou None quando há filtros ativos fora das dimensões do
+    # cubo (nesse caso a análise temporal conta as linhas filtradas)
+    def temporal_cube(self):
+        if not self._active() <= TEMPORAL_PREDICATES:
+            return None
+        return self.derived(('temporal_cube',), lambda: self._slice_cube(self.data_temporal_cube))
+
+    # Função para obter os predicados que restringem alguma linha
+    def _active(self):
+        return {
+            name for name in PREDICATES
+            if name in self._masks and self._masks[name][1] is not None
+            and not self._masks[name][1].all()
+        }
+
+    # Função para fatiar um cubo dos meses pelos predicados ativos
+    def _slice_cube(self, cube):
+        active = self._active()
+        values = {name: self._masks[name][0] for name in PREDICATES if name in self._masks}
+        cube = cube.slice({
+            'MES_REFERENCIA': values.get('months') if 'months' in active else None,
+            'EVENTO': values.get('crime_type') if 'crime_type' in active else None,
+            'ÁREA URBANA': values.get('location') if 'location' in active else None,
+        })
+        if 'unit' in active:
+            cube = cube.slice_units(values['unit'])
+        return cube
+
+    # Função para guardar um resultado calculado sobre o filtro atual (tabelas,
+    # séries etc.); build() só é chamado na primeira vez para cada chave e os
+    # resultados são descartados quando os filtros mudam
+    def derived(self, key, build):
+        if self._derived_key != self._result_key:
+            self._derived = {}
+            self._derived_key = self._result_key
+        hit = key in self._derived
+        cache_event('derived', hit)
+        if not hit:
+            self._derived[key] = build()
+        return self._derived[key]
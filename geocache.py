@@ -0,0 +1,468 @@
+# Cache persistente de geocodificação (endereço -> coordenadas) em SQLite.
+# Cada nível de fallback do endereço (logradouro com número, logradouro,
+# bairro e município) é guardado com sua própria chave normalizada, inclusive
+# os resultados negativos. O geocodificador é plugável: Nominatim, uma base
+# local (CSV) para testes e ambientes sem internet, ou modo offline, em que
+# tudo é resolvido apenas pelo cache.
+import csv
+import io
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+GEOCODE_DB = os.environ.get("CRIME_APP_GEOCODE_DB", os.path.join(".cache", "geocode.sqlite3"))
+
+# Geocodificador padrão: "nominatim", "offline" ou "local:<caminho do CSV>"
+GEOCODER = os.environ.get("CRIME_APP_GEOCODER", "nominatim")
+
+# Geocodificação em lote: threads, taxa máxima de requisições por segundo
+# (o Nominatim público aceita 1 por segundo), tentativas e espera inicial
+# entre tentativas após timeout (dobrada a cada nova tentativa)
+GEOCODE_WORKERS = int(os.environ.get("CRIME_APP_GEOCODE_WORKERS", "4"))
+GEOCODE_RATE = float(os.environ.get("CRIME_APP_GEOCODE_RATE", "1.0"))
+GEOCODE_RETRIES = int(os.environ.get("CRIME_APP_GEOCODE_RETRIES", "3"))
+GEOCODE_BACKOFF = float(os.environ.get("CRIME_APP_GEOCODE_BACKOFF", "1.0"))
+
+ADDRESS_COLUMNS = ['MUNICÍPIO', 'LOGRADOURO', 'NÚMERO DO LOGRADOURO', 'BAIRRO']
+
+# Resultados negativos mais antigos que este prazo são consultados novamente
+NEGATIVE_TTL_DAYS = float(os.environ.get("CRIME_APP_GEOCODE_NEGATIVE_TTL_DAYS", "30"))
+
+# Níveis de fallback, do endereço mais completo ao mais genérico
+LEVELS = {
+    1: ('logradouro', 'numero', 'bairro', 'municipio'),
+    2: ('logradouro', 'bairro', 'municipio'),
+    3: ('bairro', 'municipio'),
+    4: ('municipio',),
+}
+
+EXPORT_COLUMNS = ['key', 'level', 'query', 'lat', 'lon', 'found', 'updated_at']
+
+# Marcador de resultado negativo (endereço consultado e não encontrado)
+NOT_FOUND = "not_found"
+
+
+class GeocoderError(Exception):
+    # Falha do geocodificador (erro do serviço, consulta recusada etc.): o
+    # endereço fica sem coordenadas nesta execução, sem resultado negativo no cache
+    pass
+
+
+class GeocoderTransientError(GeocoderError):
+    # Falha temporária do geocodificador (timeout, serviço indisponível ou
+    # limite de requisições), que vale a pena tentar novamente; retry_after é a
+    # espera pedida pelo serviço, em segundos (quando informada)
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# Função para normalizar uma parte do endereço (sem acentos, minúsculas,
+# espaços simples)
+def normalize_part(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    text = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+# Função para montar as consultas de cada nível de fallback do endereço,
+# na ordem em que devem ser tentadas: lista de (nível, chave, texto da consulta)
+def address_levels(municipio, logradouro, numero, bairro):
+    raw = {'municipio': municipio, 'logradouro': logradouro, 'numero': numero, 'bairro': bairro}
+    parts = {name: normalize_part(value) for name, value in raw.items()}
+    text = {name: "" if value is None else str(value) for name, value in raw.items()}
+
+    levels = []
+    for level, fields in LEVELS.items():
+        key = f"{level}|" + "|".join(parts[field] for field in fields)
+        query = ", ".join([text[field] for field in fields] + ["Brasil"])
+        levels.append((level, key, query))
+    return levels
+
+
+class GeocodeStore:
+    def __init__(self, path=GEOCODE_DB, negative_ttl_days=NEGATIVE_TTL_DAYS):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.negative_ttl = negative_ttl_days * 86400
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " key TEXT PRIMARY KEY,"
+                " level INTEGER NOT NULL,"
+                " query TEXT,"
+                " lat REAL,"
+                " lon REAL,"
+                " found INTEGER NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    # Função para interpretar uma linha do banco: coordenadas, NOT_FOUND ou None
+    # (resultado negativo expirado conta como ausente)
+    def _decode(self, row):
+        lat, lon, found, updated_at = row
+        if found:
+            return (lat, lon)
+        if time.time() - updated_at > self.negative_ttl:
+            return None
+        return NOT_FOUND
+
+    # Função para consultar uma chave
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT lat, lon, found, updated_at FROM geocode WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else self._decode(row)
+
+    # Função para consultar várias chaves de uma vez (chaves ausentes ficam de fora)
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, lat, lon, found, updated_at FROM geocode WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, *row in rows:
+                    value = self._decode(row)
+                    if value is not None:
+                        found[key] = value
+        return found
+
+    # Função para gravar um resultado (coords=None grava um resultado negativo)
+    def put(self, key, level, query, coords):
+        self.put_many([(key, level, query, coords)])
+
+    # Função para gravar vários resultados: lista de (chave, nível, consulta, coords)
+    def put_many(self, results):
+        now = time.time()
+        rows = [
+            (key, level, query,
+             coords[0] if coords else None,
+             coords[1] if coords else None,
+             1 if coords else 0,
+             now)
+            for key, level, query, coords in results
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO geocode (key, level, query, lat, lon, found, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    # Função para contar as entradas (total, encontradas e negativas)
+    def stats(self):
+        with self._lock:
+            total, found = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(found), 0) FROM geocode"
+            ).fetchone()
+        return {'total': total, 'found': found, 'not_found': total - found}
+
+    # Função para exportar todo o cache em CSV (bytes)
+    def export_csv(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(EXPORT_COLUMNS)} FROM geocode ORDER BY key"
+            ).fetchall()
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(EXPORT_COLUMNS)
+        writer.writerows(rows)
+        return output.getvalue().encode('utf-8')
+
+    # Função para importar um CSV para o cache. Aceita o formato exportado
+    # (key, level, query, lat, lon, found) ou uma lista de endereços com
+    # MUNICÍPIO, LOGRADOURO, NÚMERO DO LOGRADOURO, BAIRRO, lat e lon
+    def import_csv(self, source):
+        df = pd.read_csv(source, dtype=str, keep_default_na=False)
+
+        results = []
+        if 'key' in df.columns:
+            for row in df.to_dict('records'):
+                coords = _parse_coords(row.get('lat'), row.get('lon'))
+                if str(row.get('found', '1')) == '0':
+                    coords = None
+                results.append((row['key'], int(row.get('level') or row['key'].split('|', 1)[0]),
+                                row.get('query', ''), coords))
+        else:
+            for row in df.to_dict('records'):
+                coords = _parse_coords(row.get('lat'), row.get('lon'))
+                if coords is None:
+                    continue
+                level, key, query = address_levels(
+                    row.get('MUNICÍPIO', ''), row.get('LOGRADOURO', ''),
+                    row.get('NÚMERO DO LOGRADOURO', ''), row.get('BAIRRO', '')
+                )[0]
+                results.append((key, level, query, coords))
+
+        self.put_many(results)
+        return len(results)
+
+
+# Função para converter lat/lon de texto em coordenadas (None se inválidas)
+def _parse_coords(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if pd.isna(lat) or pd.isna(lon):
+        return None
+    return (lat, lon)
+
+
+class RateLimiter:
+    # Limitador de taxa compartilhado entre threads: cada chamada reserva o
+    # próximo horário livre e espera fora da trava até ele chegar
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            slot = max(time.monotonic(), self._next_slot)
+            self._next_slot = slot + self.interval
+        wait = slot - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class NominatimProvider:
+    # Geocodificador Nominatim (OpenStreetMap), limitado a `rate` requisições por segundo
+    def __init__(self, user_agent="crime_analysis_app", timeout=10, rate=GEOCODE_RATE):
+        from geopy.geocoders import Nominatim
+
+        self._geolocator = Nominatim(user_agent=user_agent)
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(rate)
+
+    def geocode(self, query):
+        from geopy.exc import GeocoderRateLimited, GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable
+
+        self.rate_limiter.acquire()
+        try:
+            location = self._geolocator.geocode(query, timeout=self.timeout)
+        except GeocoderRateLimited as e:
+            raise GeocoderTransientError(str(e), e.retry_after) from e
+        except (GeocoderTimedOut, GeocoderUnavailable) as e:
+            raise GeocoderTransientError(str(e)) from e
+        except GeocoderServiceError as e:
+            # Demais erros do serviço (consulta recusada, autenticação, cota etc.)
+            raise GeocoderError(str(e)) from e
+
+        if location is None:
+            return None
+        return (location.latitude, location.longitude)
+
+
+class LocalProvider:
+    # Geocodificador local: resolve consultas a partir de uma tabela fixa
+    # (texto da consulta normalizado -> coordenadas), sem acesso à rede
+    def __init__(self, table=None):
+        self.table = {normalize_part(query): coords for query, coords in (table or {}).items()}
+
+    # Função para criar o geocodificador a partir de um CSV com query, lat e lon
+    @classmethod
+    def from_csv(cls, source):
+        df = pd.read_csv(source, dtype=str, keep_default_na=False)
+        table = {}
+        for query, lat, lon in zip(df['query'], df['lat'], df['lon']):
+            coords = _parse_coords(lat, lon)
+            if coords is not None:
+                table[query] = coords
+        return cls(table)
+
+    def geocode(self, query):
+        return self.table.get(normalize_part(query))
+
+
+# Função para criar o geocodificador configurado (None no modo offline)
+def make_provider(spec=GEOCODER):
+    if spec == "offline":
+        return None
+    if spec.startswith("local:"):
+        return LocalProvider.from_csv(spec.split(":", 1)[1])
+    return NominatimProvider()
+
+
+# Função para resolver um endereço, tentando os níveis de fallback em ordem.
+# Cada nível consulta primeiro o cache; só vai ao geocodificador em caso de
+# ausência (provider=None significa modo offline). Falhas do geocodificador
+# não são gravadas como negativas: são propagadas com raise_transient=True ou
+# o endereço fica sem coordenadas nesta execução
+def resolve_address(store, provider, municipio, logradouro, numero, bairro, raise_transient=False):
+    for level, key, query in address_levels(municipio, logradouro, numero, bairro):
+        cached = store.get(key)
+        if cached == NOT_FOUND:
+            continue
+        if cached is not None:
+            return cached
+        if provider is None:
+            continue
+
+        try:
+            coords = provider.geocode(query)
+        except GeocoderError:
+            if raise_transient:
+                raise
+            return None
+
+        store.put(key, level, query, coords)
+        if coords:
+            return coords
+
+    return None
+
+
+# Função para consultar o geocodificador com novas tentativas após falhas
+# temporárias, dobrando a espera a cada tentativa (com variação aleatória) ou
+# esperando o tempo pedido pelo serviço, se for maior. As demais falhas
+# (GeocoderError) são propagadas sem novas tentativas
+def geocode_with_retry(provider, query, retries=GEOCODE_RETRIES, backoff=GEOCODE_BACKOFF):
+    for attempt in range(retries + 1):
+        try:
+            return provider.geocode(query)
+        except GeocoderTransientError as e:
+            if attempt == retries:
+                raise
+            time.sleep(max(backoff * (2 ** attempt) * random.uniform(0.5, 1.0), e.retry_after or 0))
+    return None
+
+
+# Função para reduzir as linhas a endereços únicos normalizados.
+# Retorna o código do endereço de cada linha (-1 para endereços insuficientes)
+# e, para cada endereço único, os textos originais de uma linha representante
+def unique_addresses(df):
+    raw_parts = []
+    normalized_parts = []
+
+    for column in ADDRESS_COLUMNS:
+        codes, uniques = pd.factorize(df[column])
+        # A última posição atende os valores ausentes (código -1)
+        raw = np.array([str(value) for value in uniques] + [""], dtype=object)
+        normalized = np.array([normalize_part(value) for value in uniques] + [""], dtype=object)
+        raw_parts.append(raw[codes])
+        normalized_parts.append(pd.Series(normalized[codes], index=df.index))
+
+    municipio, logradouro, numero, bairro = normalized_parts
+
+    # Pular endereços sem informações suficientes
+    valid = ((municipio != "") & ((logradouro != "") | (bairro != ""))).to_numpy()
+
+    keys = municipio + "|" + logradouro + "|" + numero + "|" + bairro
+    address_codes, _ = pd.factorize(keys.where(valid))
+
+    first_rows = pd.Series(np.arange(len(df)))[address_codes >= 0].groupby(
+        address_codes[address_codes >= 0]
+    ).first().to_numpy()
+    addresses = [tuple(part[row] for part in raw_parts) for row in first_rows]
+    return address_codes, addresses
+
+
+# Função para geocodificar um DataFrame em lote: as linhas são reduzidas a
+# endereços únicos, o cache é consultado de uma vez e as ausências são
+# resolvidas por um conjunto limitado de threads (provider=None: modo offline).
+# As coordenadas são devolvidas para todas as linhas (colunas lat e lon,
+# NaN quando não resolvidas), junto com estatísticas da execução. Endereços
+# com falha do geocodificador contam em stats['failed'] (sem resultado negativo
+# no cache) e não interrompem o lote.
+# progress(concluídos, total) é chamado na thread que invocou a função
+def geocode_batch(df, store, provider, max_workers=GEOCODE_WORKERS, retries=GEOCODE_RETRIES,
+                  backoff=GEOCODE_BACKOFF, progress=None):
+    address_codes, addresses = unique_addresses(df)
+    levels = [address_levels(*address) for address in addresses]
+
+    # Consulta em lote ao cache, para todos os níveis de todos os endereços
+    known = store.get_many([key for candidates in levels for _, key, _ in candidates])
+
+    results = [None] * len(addresses)
+    pending = []
+    for i, candidates in enumerate(levels):
+        for _, key, _ in candidates:
+            value = known.get(key)
+            if value == NOT_FOUND:
+                continue
+            if value is None:
+                # Nível ainda não consultado: resolver pelo geocodificador
+                if provider is not None:
+                    pending.append(i)
+                break
+            results[i] = value
+            break
+
+    stats = {
+        'rows': len(df),
+        'addresses': len(addresses),
+        'from_cache': sum(result is not None for result in results),
+        'looked_up': len(pending),
+        'failed': 0,
+    }
+
+    # Consultas repetidas do mesmo nível (ex.: mesmo bairro) entre endereços
+    # diferentes são feitas uma única vez
+    in_flight = {}
+    in_flight_lock = threading.Lock()
+
+    def lookup(level, key, query):
+        with in_flight_lock:
+            future = in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                in_flight[key] = future
+        if owner:
+            try:
+                coords = geocode_with_retry(provider, query, retries, backoff)
+                store.put(key, level, query, coords)
+                future.set_result(coords)
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def resolve(i):
+        for level, key, query in levels[i]:
+            value = known.get(key)
+            if value == NOT_FOUND:
+                continue
+            if value is None:
+                value = lookup(level, key, query)
+            if value:
+                return value
+        return None
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {executor.submit(resolve, i): i for i in pending}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    results[futures[future]] = future.result()
+                except GeocoderError:
+                    stats['failed'] += 1
+                if progress is not None:
+                    progress(done, len(pending))
+
+    # Devolver as coordenadas de cada endereço único para todas as suas linhas
+    lat = np.array([result[0] if result else np.nan for result in results] + [np.nan])
+    lon = np.array([result[1] if result else np.nan for result in results] + [np.nan])
+    coords = pd.DataFrame({'lat': lat[address_codes], 'lon': lon[address_codes]}, index=df.index)
+    return coords, stats
@@ -0,0 +1,325 @@
+# Detecção de hotspots sobre as coordenadas das ocorrências.
+# Os pontos são projetados em metros (projeção equirretangular local) e
+# indexados em uma grade regular: cada ocorrência recebe a linha e a coluna da
+# sua célula, e todas as análises trabalham sobre as contagens por célula.
+# - Densidade por kernel: as contagens são suavizadas por um kernel gaussiano
+#   separável e as células mais densas são ranqueadas (opcionalmente por
+#   grupo, ex.: tipo de crime e mês).
+# - Agrupamento: aproximação do DBSCAN em grade. Com células de lado eps/√2,
+#   pontos da mesma célula estão a menos de eps entre si; células com pelo
+#   menos min_points ocorrências são núcleos, núcleos vizinhos formam o mesmo
+#   agrupamento e células vizinhas não densas entram como borda.
+# Pontos fora da área esperada (ex.: coordenadas (0, 0) de endereços não
+# localizados) são descartados antes de montar a grade, para que um único
+# ponto distante não estique a grade.
+# Os resultados trazem polígonos em [lat, lon], prontos para o mapa folium, e
+# em attrs o lado efetivo da célula ('cell_m') e os pontos descartados ('outside').
+import os
+
+import numpy as np
+import pandas as pd
+
+# Tamanho da célula e raio de suavização (metros) da densidade por kernel
+HOTSPOT_CELL_METERS = float(os.environ.get("CRIME_APP_HOTSPOT_CELL_M", "200"))
+HOTSPOT_BANDWIDTH_METERS = float(os.environ.get("CRIME_APP_HOTSPOT_BANDWIDTH_M", "400"))
+
+# Número máximo de células da grade densa da densidade por kernel; acima
+# disso a célula é dobrada (o lado efetivo vai em attrs['cell_m'] do resultado)
+HOTSPOT_MAX_GRID_CELLS = int(os.environ.get("CRIME_APP_HOTSPOT_MAX_CELLS", "4000000"))
+
+# Área esperada das coordenadas: "lat_min,lon_min,lat_max,lon_max" (ex.: Mato
+# Grosso do Sul: "-24.1,-58.2,-17.1,-50.9"). Vazio (padrão) aceita qualquer
+# coordenada válida; os pontos fora da área informada são contados em
+# attrs['outside'] do resultado
+HOTSPOT_BOUNDS = os.environ.get("CRIME_APP_HOTSPOT_BOUNDS", "")
+
+# Grupos ranqueados separadamente (os de mais ocorrências)
+HOTSPOT_MAX_GROUPS = 12
+
+# Parâmetros padrão do agrupamento (distância em metros e mínimo de ocorrências)
+CLUSTER_EPS_METERS = 300.0
+CLUSTER_MIN_POINTS = 10
+
+# Métodos disponíveis (chave -> rótulo exibido)
+METHODS = {
+    'kde': "Densidade por kernel (células mais densas)",
+    'dbscan': "Agrupamento (DBSCAN em grade)",
+}
+
+_METERS_PER_DEGREE = 111320.0
+
+
+# Função para converter o texto da área esperada em (lat_min, lon_min, lat_max, lon_max)
+def parse_bounds(text):
+    if not text or not text.strip():
+        return None
+    lat_min, lon_min, lat_max, lon_max = (float(value) for value in text.split(","))
+    return lat_min, lon_min, lat_max, lon_max
+
+
+# Função para obter a máscara dos pontos dentro da área esperada
+def within_bounds(lat, lon, bounds=HOTSPOT_BOUNDS):
+    bounds = parse_bounds(bounds) if isinstance(bounds, str) else bounds
+    if bounds is None:
+        return np.ones(len(lat), dtype=bool)
+    lat_min, lon_min, lat_max, lon_max = bounds
+    return (lat >= lat_min) & (lat <= lat_max) & (lon >= lon_min) & (lon <= lon_max)
+
+# Vizinhos de uma célula (8 direções) e metade deles, para ligar pares uma única vez
+_NEIGHBORS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+_FORWARD_NEIGHBORS = [(0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+class Grid:
+    def __init__(self, lat0, lon0, lon_scale, cell_m, rows, cols, shape):
+        # Origem (canto inferior esquerdo), metros por grau de longitude, lado
+        # da célula e célula (linha, coluna) de cada ponto
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.lon_scale = lon_scale
+        self.cell_m = cell_m
+        self.rows = rows
+        self.cols = cols
+        self.shape = shape
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Função para indexar os pontos; com max_cells, a célula é dobrada até que
+    # a grade densa caiba no limite (max_cells None mantém o lado pedido, para
+    # quem usa apenas os índices esparsos das células)
+    @classmethod
+    def build(cls, lat, lon, cell_m=HOTSPOT_CELL_METERS, max_cells=HOTSPOT_MAX_GRID_CELLS):
+        lat0, lon0 = float(lat.min()), float(lon.min())
+        lon_scale = _METERS_PER_DEGREE * max(np.cos(np.radians((lat0 + float(lat.max())) / 2)), 0.1)
+        y = (lat - lat0) * _METERS_PER_DEGREE
+        x = (lon - lon0) * lon_scale
+
+        while True:
+            rows = np.floor(y / cell_m).astype(np.int64)
+            cols = np.floor(x / cell_m).astype(np.int64)
+            shape = (int(rows.max()) + 1, int(cols.max()) + 1)
+            if max_cells is None or shape[0] * shape[1] <= max_cells:
+                break
+            cell_m *= 2
+
+        return cls(lat0, lon0, lon_scale, cell_m, rows, cols, shape)
+
+    # Função para obter o índice linear da célula de cada ponto
+    def flat(self):
+        return self.rows * self.shape[1] + self.cols
+
+    # Função para contar as ocorrências por célula (matriz linhas x colunas);
+    # mask restringe os pontos contados
+    def counts(self, mask=None):
+        flat = self.flat() if mask is None else self.flat()[mask]
+        return np.bincount(flat, minlength=self.shape[0] * self.shape[1]).reshape(self.shape)
+
+    # Função para converter posições da grade (em células) para [lat, lon]
+    def to_latlon(self, row, col):
+        return (
+            self.lat0 + np.asarray(row, dtype=np.float64) * self.cell_m / _METERS_PER_DEGREE,
+            self.lon0 + np.asarray(col, dtype=np.float64) * self.cell_m / self.lon_scale,
+        )
+
+    # Função para obter o polígono ([lat, lon]) de uma célula
+    def cell_polygon(self, row, col):
+        corners = [(row, col), (row, col + 1), (row + 1, col + 1), (row + 1, col)]
+        return [list(map(float, self.to_latlon(r, c))) for r, c in corners]
+
+    # Função para obter a área de uma célula em km²
+    def cell_area_km2(self):
+        return (self.cell_m / 1000.0) ** 2
+
+
+# Função para suavizar a matriz de contagens com um kernel gaussiano
+# separável (soma de deslocamentos, sem dependências além do numpy);
+# o resultado é a densidade em ocorrências por km²
+def kernel_density(grid, counts, bandwidth_m=HOTSPOT_BANDWIDTH_METERS):
+    sigma = max(bandwidth_m / grid.cell_m, 1e-6)
+    radius = int(np.ceil(3 * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    weights = np.exp(-0.5 * (offsets / sigma) ** 2)
+    weights /= weights.sum()
+
+    density = counts.astype(np.float64)
+    for axis in (0, 1):
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (radius, radius)
+        padded = np.pad(density, pad)
+        size = density.shape[axis]
+        smoothed = np.zeros_like(density)
+        for k, weight in enumerate(weights):
+            smoothed += weight * (padded[k:k + size] if axis == 0 else padded[:, k:k + size])
+        density = smoothed
+
+    return density / grid.cell_area_km2()
+
+
+# Função para ranquear as células mais densas. labels (um rótulo por ponto)
+# separa o ranking por grupo; cada grupo usa a mesma grade
+def top_hotspots(lat, lon, n=10, labels=None, cell_m=HOTSPOT_CELL_METERS,
+                 bandwidth_m=HOTSPOT_BANDWIDTH_METERS, max_groups=HOTSPOT_MAX_GROUPS,
+                 bounds=HOTSPOT_BOUNDS):
+    columns = ['Grupo', 'Posição', 'Ocorrências', 'Densidade (ocorr./km²)', 'lat', 'lon', 'polygon']
+    inside = within_bounds(lat, lon, bounds)
+    lat, lon = lat[inside], lon[inside]
+    if labels is not None:
+        labels = np.asarray(labels)[inside]
+    if len(lat) == 0:
+        return _with_attrs(pd.DataFrame(columns=columns), cell_m, inside)
+
+    grid = Grid.build(lat, lon, cell_m)
+    if labels is None:
+        groups = [(None, None)]
+    else:
+        codes, values = pd.factorize(pd.Series(labels), sort=False)
+        sizes = np.bincount(codes[codes >= 0], minlength=len(values))
+        largest = np.argsort(-sizes, kind='stable')[:max_groups]
+        groups = [(str(values[code]), codes == code) for code in largest if sizes[code] > 0]
+
+    records = []
+    for group, mask in groups:
+        counts = grid.counts(mask)
+        density = kernel_density(grid, counts, bandwidth_m)
+
+        # Apenas células com ocorrências são candidatas a hotspot
+        occupied = np.flatnonzero(counts.ravel())
+        ranked = occupied[np.argsort(-density.ravel()[occupied], kind='stable')[:n]]
+        for position, cell in enumerate(ranked, start=1):
+            row, col = divmod(int(cell), grid.shape[1])
+            center_lat, center_lon = grid.to_latlon(row + 0.5, col + 0.5)
+            records.append({
+                'Grupo': group,
+                'Posição': position,
+                'Ocorrências': int(counts[row, col]),
+                'Densidade (ocorr./km²)': round(float(density[row, col]), 1),
+                'lat': float(center_lat),
+                'lon': float(center_lon),
+                'polygon': grid.cell_polygon(row, col),
+            })
+
+    return _with_attrs(pd.DataFrame(records, columns=columns), grid.cell_m, inside)
+
+
+# Função para registrar no resultado o lado efetivo da célula e o número de
+# pontos descartados por estarem fora da área esperada
+def _with_attrs(result, cell_m, inside):
+    result.attrs['cell_m'] = float(cell_m)
+    result.attrs['outside'] = int(len(inside) - inside.sum())
+    return result
+
+
+# Função para o fecho convexo de pontos (x, y) pela cadeia monótona
+def convex_hull(points):
+    points = sorted(set(map(tuple, points)))
+    if len(points) <= 2:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for point in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], point) <= 0:
+            lower.pop()
+        lower.append(point)
+    for point in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], point) <= 0:
+            upper.pop()
+        upper.append(point)
+    return lower[:-1] + upper[:-1]
+
+
+# Função para rotular componentes conexos de um grafo (union-find vetorizado
+# por propagação do menor rótulo e salto de ponteiros)
+def _components(n_nodes, first, second):
+    labels = np.arange(n_nodes)
+    while True:
+        smallest = np.minimum(labels[first], labels[second])
+        updated = labels.copy()
+        np.minimum.at(updated, first, smallest)
+        np.minimum.at(updated, second, smallest)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+# Função para o agrupamento por densidade (aproximação do DBSCAN em grade).
+# Retorna o agrupamento de cada ponto (-1 para ruído ou fora da área esperada)
+# e a tabela de agrupamentos, do maior para o menor, com o polígono de cada um.
+# A célula precisa ter exatamente eps/√2 de lado: a grade não tem limite de
+# células, pois apenas os índices das células ocupadas são usados
+def grid_dbscan(lat, lon, eps_m=CLUSTER_EPS_METERS, min_points=CLUSTER_MIN_POINTS, bounds=HOTSPOT_BOUNDS):
+    columns = ['Agrupamento', 'Ocorrências', 'Células', 'lat', 'lon', 'polygon']
+    cell_m = eps_m / np.sqrt(2)
+    inside = within_bounds(lat, lon, bounds)
+    point_labels = np.full(len(lat), -1, dtype=np.int64)
+    lat, lon = lat[inside], lon[inside]
+    if len(lat) == 0:
+        return point_labels, _with_attrs(pd.DataFrame(columns=columns), cell_m, inside)
+
+    grid = Grid.build(lat, lon, cell_m, max_cells=None)
+    width = grid.shape[1]
+    cells, point_cell, cell_counts = np.unique(grid.flat(), return_inverse=True, return_counts=True)
+    cell_rows, cell_cols = cells // width, cells % width
+
+    core = np.flatnonzero(cell_counts >= min_points)
+    core_keys = cells[core]
+    cell_labels = np.full(len(cells), -1, dtype=np.int64)
+
+    # Função para localizar, entre os núcleos, as células deslocadas de (dr, dc);
+    # retorna quais células têm vizinho núcleo e a posição dele em core
+    def find_core(selected, dr, dc):
+        rows, cols = cell_rows[selected] + dr, cell_cols[selected] + dc
+        keys = rows * width + cols
+        found = np.minimum(np.searchsorted(core_keys, keys), len(core_keys) - 1)
+        linked = (rows >= 0) & (cols >= 0) & (cols < width) & (core_keys[found] == keys)
+        return linked, found[linked]
+
+    if len(core):
+        # Ligar células núcleo vizinhas
+        first, second = [], []
+        for dr, dc in _FORWARD_NEIGHBORS:
+            linked, found = find_core(core, dr, dc)
+            first.append(np.flatnonzero(linked))
+            second.append(found)
+        core_labels = _components(len(core), np.concatenate(first), np.concatenate(second))
+        cell_labels[core] = core_labels
+
+        # Células não densas vizinhas de um núcleo entram como borda
+        for dr, dc in _NEIGHBORS:
+            pending = np.flatnonzero((cell_labels < 0) & (cell_counts < min_points))
+            linked, found = find_core(pending, dr, dc)
+            cell_labels[pending[linked]] = core_labels[found]
+
+    # Renumerar os agrupamentos do maior para o menor
+    clustered = cell_labels >= 0
+    roots, cell_cluster = np.unique(cell_labels[clustered], return_inverse=True)
+    sizes = np.bincount(cell_cluster, weights=cell_counts[clustered], minlength=len(roots))
+    order = np.argsort(-sizes, kind='stable')
+    rank = np.empty(len(roots), dtype=np.int64)
+    rank[order] = np.arange(len(roots))
+    cell_labels[clustered] = rank[cell_cluster]
+
+    records = []
+    for cluster in range(len(roots)):
+        members = np.flatnonzero(cell_labels == cluster)
+        rows, cols, weights = cell_rows[members], cell_cols[members], cell_counts[members]
+        corners = [(r + dr, c + dc) for r, c in zip(rows.tolist(), cols.tolist()) for dr in (0, 1) for dc in (0, 1)]
+        hull = convex_hull(corners)
+        center_lat, center_lon = grid.to_latlon(
+            np.average(rows + 0.5, weights=weights), np.average(cols + 0.5, weights=weights)
+        )
+        records.append({
+            'Agrupamento': cluster + 1,
+            'Ocorrências': int(weights.sum()),
+            'Células': len(members),
+            'lat': float(center_lat),
+            'lon': float(center_lon),
+            'polygon': [list(map(float, grid.to_latlon(r, c))) for r, c in hull],
+        })
+
+    point_labels[inside] = cell_labels[point_cell]
+    return point_labels, _with_attrs(pd.DataFrame(records, columns=columns), grid.cell_m, inside)
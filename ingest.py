@@ -0,0 +1,407 @@
+# Camada de ingestão das planilhas mensais.
+# Cada planilha é convertida uma única vez em um snapshot colunar (Parquet),
+# identificado pelo hash do conteúdo, e reaproveitada entre sessões e reinícios.
+import datetime
+import hashlib
+import io
+import os
+import uuid
+
+import pandas as pd
+
+from schema import apply_schema
+
+# Diretório e limites do cache de snapshots (configuráveis por variável de ambiente)
+CACHE_DIR = os.environ.get("CRIME_APP_CACHE_DIR", os.path.join(".cache", "ingest"))
+CACHE_MAX_BYTES = int(float(os.environ.get("CRIME_APP_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+CACHE_MAX_ENTRIES = int(os.environ.get("CRIME_APP_CACHE_MAX_ENTRIES", "200"))
+
+# Leitura em blocos: quantidade de linhas por bloco e tamanho mínimo do arquivo
+# a partir do qual a leitura em blocos é usada automaticamente
+STREAMING_CHUNK_ROWS = int(os.environ.get("CRIME_APP_CHUNK_ROWS", "20000"))
+STREAMING_MIN_BYTES = int(float(os.environ.get("CRIME_APP_STREAMING_MIN_MB", "20")) * 1024 * 1024)
+
+# Tamanho dos blocos lidos para calcular o hash do conteúdo
+HASH_BLOCK_BYTES = 1024 * 1024
+
+# Colunas convertidas para número durante a leitura em blocos
+NUMERIC_COLUMNS = ['ID', 'COORDENADA X', 'COORDENADA y']
+
+# Incrementar sempre que o formato do snapshot mudar, invalidando os antigos
+# (3: DATA_HORA dos snapshots em blocos a partir das células de data do Excel)
+SNAPSHOT_VERSION = 3
+SNAPSHOT_SUFFIX = ".parquet"
+
+
+# Função para abrir um arquivo enviado, caminho ou bytes como arquivo binário
+# posicionado no início; retorna o arquivo e se ele deve ser fechado depois
+def open_source(file):
+    if isinstance(file, (bytes, bytearray)):
+        return io.BytesIO(file), True
+    if isinstance(file, (str, os.PathLike)):
+        return open(file, "rb"), True
+    file.seek(0)
+    return file, False
+
+
+# Função para calcular o hash do conteúdo lendo a origem em blocos, sem
+# carregá-la inteira; retorna (hash, tamanho em bytes) e volta ao início
+def source_digest(fh, block_bytes=HASH_BLOCK_BYTES):
+    digest = hashlib.sha256()
+    size = 0
+    fh.seek(0)
+    for block in iter(lambda: fh.read(block_bytes), b""):
+        digest.update(block)
+        size += len(block)
+    fh.seek(0)
+    return digest.hexdigest(), size
+
+
+# Função para gerar a chave do snapshot a partir do hash do conteúdo e do mês
+def dataset_key(digest, month_name=None):
+    month_hash = hashlib.sha256((month_name or "").encode("utf-8")).hexdigest()[:8]
+    return f"v{SNAPSHOT_VERSION}-{digest[:32]}-{month_hash}"
+
+
+# Função para ler a planilha e preparar as colunas derivadas
+def parse_excel(source, month_name=None):
+    return prepare_frame(pd.read_excel(source), month_name)
+
+
+# Função para preparar as colunas derivadas de um DataFrame lido da planilha
+def prepare_frame(df, month_name=None):
+    # Converter colunas de data e hora para datetime
+    df['DATA_HORA'] = parse_date_time(
+        df['DATA DE INÍCIO DO ATENDIMENTO'],
+        df['HORA DE INÍCIO DO ATENDIMENTO']
+    )
+
+    # Adicionar coluna com o nome do mês para identificação
+    if month_name:
+        df['MES_REFERENCIA'] = month_name
+
+    return normalize_object_columns(df)
+
+
+# Função para combinar data (DD/MM/AAAA) e hora (HH:MM:SS) em datetime,
+# convertendo cada parte separadamente em vez de concatenar os textos
+def parse_date_time(dates, times):
+    dates = pd.Series(dates)
+    times = pd.Series(times, index=dates.index)
+
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        date_part = dates.dt.normalize()
+    else:
+        date_part = pd.to_datetime(_as_text(dates, _date_text), format='%d/%m/%Y', errors='coerce')
+
+    if pd.api.types.is_datetime64_any_dtype(times):
+        time_part = times - times.dt.normalize()
+    elif pd.api.types.is_timedelta64_dtype(times):
+        time_part = times
+    else:
+        time_part = pd.to_timedelta(_as_text(times, _time_text), errors='coerce')
+
+    # Horas fora do intervalo de um dia são inválidas, como no formato original
+    time_part = time_part.where((time_part >= pd.Timedelta(0)) & (time_part < pd.Timedelta(days=1)))
+
+    return date_part + time_part
+
+
+# Função para converter em texto só as colunas que têm células de data/hora
+# tipadas pelo Excel; colunas só de texto seguem direto para a conversão vetorizada
+def _as_text(values, to_text):
+    if values.dtype != object or pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        return values
+    return values.map(to_text)
+
+
+# Funções auxiliares para aceitar células de data/hora já tipadas pelo Excel
+# (células vazias em colunas de data chegam como NaT, que não tem strftime)
+def _date_text(value):
+    if value is pd.NaT:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime('%d/%m/%Y')
+    return value
+
+
+def _time_text(value):
+    if value is pd.NaT:
+        return None
+    if isinstance(value, datetime.datetime):
+        value = value.time()
+    if isinstance(value, datetime.time):
+        return value.strftime('%H:%M:%S')
+    return value
+
+
+# Função para ler a planilha em blocos de tamanho fixo (modo somente leitura),
+# de forma que a memória usada na leitura dependa do bloco, e não do arquivo
+def iter_excel_chunks(source, chunk_rows=STREAMING_CHUNK_ROWS, month_name=None):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        columns = [
+            str(name) if name is not None else f"Unnamed: {i}"
+            for i, name in enumerate(header)
+        ]
+        buffer = []
+
+        for row in rows:
+            # Ignorar linhas totalmente vazias
+            if all(value is None for value in row):
+                continue
+            buffer.append(row[:len(columns)])
+
+            if len(buffer) >= chunk_rows:
+                yield _prepare_chunk(buffer, columns, month_name)
+                buffer = []
+
+        if buffer:
+            yield _prepare_chunk(buffer, columns, month_name)
+    finally:
+        wb.close()
+
+
+# Função para converter um bloco de linhas em DataFrame já com os tipos finais.
+# O esquema é fixo (colunas numéricas conhecidas e texto nas demais) para que
+# todos os blocos tenham os mesmos tipos. DATA_HORA é calculada antes da
+# conversão para texto, a partir das células originais (datas e horas já
+# tipadas pelo Excel), como na leitura completa
+def _prepare_chunk(rows, columns, month_name):
+    chunk = pd.DataFrame.from_records(rows, columns=columns)
+
+    date_time = parse_date_time(
+        chunk['DATA DE INÍCIO DO ATENDIMENTO'],
+        chunk['HORA DE INÍCIO DO ATENDIMENTO']
+    )
+
+    for column in chunk.columns:
+        if column in NUMERIC_COLUMNS:
+            chunk[column] = pd.to_numeric(chunk[column], errors='coerce').astype('float64')
+        else:
+            chunk[column] = chunk[column].map(
+                lambda value: None if pd.isna(value) else str(value)
+            ).astype(object)
+
+    chunk['DATA_HORA'] = date_time
+
+    if month_name:
+        chunk['MES_REFERENCIA'] = month_name
+
+    return chunk
+
+
+# Função para uniformizar colunas de texto com tipos mistos (ex.: números e textos
+# na mesma coluna), que não podem ser gravadas em formato colunar
+def normalize_object_columns(df):
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        inferred = pd.api.types.infer_dtype(df[column], skipna=True)
+        if inferred not in ("string", "empty"):
+            df[column] = df[column].map(lambda value: value if pd.isna(value) else str(value))
+    return df
+
+
+# Função para obter o caminho de um arquivo do cache
+def cache_path(key, suffix=SNAPSHOT_SUFFIX):
+    return os.path.join(CACHE_DIR, key + suffix)
+
+
+# Função para carregar um snapshot existente (retorna None se não houver)
+def load_snapshot(key):
+    path = cache_path(key)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        df = pd.read_parquet(path)
+    except (OSError, ValueError):
+        # Snapshot corrompido ou incompleto: descartar e reprocessar a planilha
+        remove_entry(key)
+        return None
+
+    # Atualizar a data de acesso para a política de remoção (LRU)
+    touch_entry(key)
+    return df
+
+
+# Função para gravar um snapshot de forma atômica
+def save_snapshot(df, key):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(key)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    evict_cache(protect=key)
+
+
+# Função para marcar todos os arquivos de uma entrada como acessados agora
+def touch_entry(key):
+    for name in _entry_files(key):
+        try:
+            os.utime(os.path.join(CACHE_DIR, name))
+        except OSError:
+            pass
+
+
+# Função para remover todos os arquivos de uma entrada do cache
+def remove_entry(key):
+    for name in _entry_files(key):
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+        except OSError:
+            pass
+
+
+# Função para listar os arquivos pertencentes a uma entrada (snapshot e anexos)
+def _entry_files(key):
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    return [name for name in os.listdir(CACHE_DIR) if name.split(".", 1)[0] == key]
+
+
+# Função para listar as entradas do cache com tamanho total e último acesso
+def cache_entries():
+    if not os.path.isdir(CACHE_DIR):
+        return []
+
+    entries = {}
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".tmp"):
+            continue
+        try:
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+        except OSError:
+            continue
+        key = name.split(".", 1)[0]
+        size, last_access = entries.get(key, (0, 0.0))
+        entries[key] = (size + stat.st_size, max(last_access, stat.st_mtime))
+
+    return [(key, size, last_access) for key, (size, last_access) in entries.items()]
+
+
+# Função para aplicar o limite de tamanho e de entradas do cache,
+# removendo primeiro as entradas usadas há mais tempo (LRU)
+def evict_cache(max_bytes=None, max_entries=None, protect=None):
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+
+    entries = sorted(cache_entries(), key=lambda entry: entry[2])
+    total_bytes = sum(size for _, size, _ in entries)
+    total_entries = len(entries)
+
+    removed = []
+    for key, size, _ in entries:
+        if total_bytes <= max_bytes and total_entries <= max_entries:
+            break
+        if key == protect:
+            continue
+        remove_entry(key)
+        removed.append(key)
+        total_bytes -= size
+        total_entries -= 1
+
+    return removed
+
+
+# Função para gravar o snapshot bloco a bloco, sem montar a planilha inteira
+# em memória durante a leitura. Retorna o DataFrame montado a partir das
+# tabelas Arrow dos blocos já gravados (sem ler o snapshot de volta), ou None
+# se a planilha não tiver linhas
+def save_snapshot_streaming(source, key, month_name=None, chunk_rows=STREAMING_CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = cache_path(key)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    writer = None
+    schema = None
+    tables = []
+
+    try:
+        for chunk in iter_excel_chunks(source, chunk_rows, month_name):
+            if schema is None:
+                schema = pa.schema([
+                    (column, _arrow_type(pa, chunk[column])) for column in chunk.columns
+                ])
+                writer = pq.ParquetWriter(tmp_path, schema)
+            table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            writer.write_table(table)
+            tables.append(table)
+
+        if writer is None:
+            return None
+
+        writer.close()
+        writer = None
+        os.replace(tmp_path, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    evict_cache(protect=key)
+
+    # Os buffers Arrow são liberados à medida que as colunas são convertidas
+    table = pa.concat_tables(tables)
+    del tables
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+# Função para definir o tipo Arrow de cada coluna a partir do primeiro bloco
+def _arrow_type(pa, series):
+    if series.name == 'DATA_HORA':
+        return pa.timestamp('ns')
+    if series.dtype == 'float64':
+        return pa.float64()
+    return pa.string()
+
+
+# Função principal de ingestão: usa o snapshot se existir, senão lê a planilha.
+# O conteúdo é lido em blocos para o hash e a planilha é lida direto da origem
+# (sem cópia intermediária em memória). Com streaming=None, a leitura em blocos
+# é escolhida pelo tamanho do arquivo.
+# O esquema de tipos compactos é aplicado em todos os caminhos (no modo em
+# blocos o snapshot guarda texto e as categorias são criadas na carga), e a
+# chave do snapshot fica registrada em df.attrs['dataset_key']
+def ingest(file, month_name=None, streaming=None):
+    fh, owned = open_source(file)
+    try:
+        digest, size = source_digest(fh)
+        key = dataset_key(digest, month_name)
+
+        df = load_snapshot(key)
+        if df is None:
+            if streaming is None:
+                streaming = size >= STREAMING_MIN_BYTES
+
+            if streaming:
+                df = save_snapshot_streaming(fh, key, month_name)
+            if df is None:
+                fh.seek(0)
+                df = apply_schema(parse_excel(fh, month_name))
+                save_snapshot(df, key)
+    finally:
+        if owned:
+            fh.close()
+
+    # A chave permite localizar os arquivos anexos ao snapshot (ex.: índice de texto)
+    df = apply_schema(df)
+    df.attrs['dataset_key'] = key
+    return df
@@ -0,0 +1,177 @@
+# Instrumentação leve das execuções do aplicativo.
+# Cada execução do script abre um perfil (start_run) e cada etapa nomeada é
+# medida com `with stage("nome") as s:` (as etapas podem ser aninhadas e
+# registrar o número de linhas em s.rows). Os caches contam acertos e falhas
+# (cache_event, track_cache para os caches do Streamlit). Ao final da execução
+# (finish_run) o perfil é gravado como uma linha JSON no logger
+# "crime_app.perf" e pode ser exibido no painel de depuração.
+# Sem perfil ativo, stage() devolve um objeto fixo que não mede nada e
+# cache_event() retorna logo após consultar a variável de contexto.
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Ativa o perfil em todas as execuções (além das sessões abertas com ?debug=1)
+PROFILE_ENABLED = os.environ.get("CRIME_APP_PROFILE", "0") == "1"
+
+# Arquivo dos registros JSON (sem o arquivo, os registros vão para o stderr)
+PROFILE_LOG = os.environ.get("CRIME_APP_PROFILE_LOG")
+
+logger = logging.getLogger("crime_app.perf")
+
+_current = contextvars.ContextVar("crime_app_profile", default=None)
+
+
+# Função para configurar a saída dos registros de desempenho (uma vez por processo)
+def _configure_logger():
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(PROFILE_LOG, encoding='utf-8') if PROFILE_LOG else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Stage:
+    # Etapa medida: nome, nível de aninhamento, início e duração (ms, relativos
+    # ao início da execução) e o número de linhas processadas (opcional)
+    __slots__ = ('name', 'depth', 'start_ms', 'duration_ms', 'rows', '_profile', '_started')
+
+    def __init__(self, profile, name, rows=None):
+        self._profile = profile
+        self.name = name
+        self.rows = rows
+        self.depth = 0
+        self.start_ms = 0.0
+        self.duration_ms = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.depth = len(self._profile.open_stages)
+        self.start_ms = (self._started - self._profile.started) * 1000
+        self._profile.open_stages.append(self)
+        self._profile.stages.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        self._profile.open_stages.pop()
+        return False
+
+
+class _NullStage:
+    # Etapa usada sem perfil ativo: não mede nada
+    __slots__ = ('rows',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profile:
+    def __init__(self, session=None):
+        self.session = session
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.total_ms = None
+        self.stages = []
+        self.open_stages = []
+        # Nome do cache -> [acertos, falhas]
+        self.caches = {}
+
+    def records(self):
+        return [
+            {'stage': s.name, 'depth': s.depth, 'start_ms': round(s.start_ms, 2),
+             'duration_ms': None if s.duration_ms is None else round(s.duration_ms, 2), 'rows': s.rows}
+            for s in self.stages
+        ]
+
+    def to_dict(self):
+        return {
+            'event': 'rerun',
+            'session': self.session,
+            'timestamp': round(self.timestamp, 3),
+            'total_ms': None if self.total_ms is None else round(self.total_ms, 2),
+            'stages': self.records(),
+            'caches': {name: {'hits': hits, 'misses': misses} for name, (hits, misses) in self.caches.items()},
+        }
+
+
+# Função para iniciar o perfil da execução atual (None quando desativado);
+# session identifica a sessão nos registros
+def start_run(enabled=PROFILE_ENABLED, session=None):
+    profile = Profile(session) if enabled else None
+    _current.set(profile)
+    return profile
+
+
+# Função para encerrar o perfil da execução atual e gravar o registro JSON;
+# retorna o perfil (ou None)
+def finish_run():
+    profile = _current.get()
+    _current.set(None)
+    if profile is None:
+        return None
+
+    profile.total_ms = (time.perf_counter() - profile.started) * 1000
+    _configure_logger()
+    logger.info(json.dumps(profile.to_dict(), ensure_ascii=False, default=str))
+    return profile
+
+
+# Função para medir uma etapa nomeada da execução atual
+def stage(name, rows=None):
+    profile = _current.get()
+    if profile is None:
+        return _NULL_STAGE
+    return Stage(profile, name, rows)
+
+
+# Função para registrar um acerto ou uma falha de cache na execução atual
+def cache_event(name, hit):
+    profile = _current.get()
+    if profile is None:
+        return
+    counts = profile.caches.setdefault(name, [0, 0])
+    counts[0 if hit else 1] += 1
+
+
+# Decorador para contar acertos e falhas de um cache do Streamlit
+# (st.cache_data/st.cache_resource já configurado). A função original só é
+# executada na falha; a chamada externa verifica se ela foi executada.
+# Ex.: @track_cache("unit_index", st.cache_resource(max_entries=8))
+def track_cache(name, cache):
+    def decorate(func):
+        state = threading.local()
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            state.missed = True
+            return func(*args, **kwargs)
+
+        cached = cache(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return cached(*args, **kwargs)
+            state.missed = False
+            with stage(name):
+                result = cached(*args, **kwargs)
+            cache_event(name, hit=not state.missed)
+            return result
+
+        wrapper.clear = cached.clear
+        return wrapper
+
+    return decorate
@@ -0,0 +1,128 @@
+# Camadas do mapa pré-agregadas no servidor.
+# - Densidade por nível de zoom: para cada faixa de zoom os pontos são
+#   agregados uma única vez em células do tamanho adequado (com limite de
+#   células por faixa) e cada faixa vira uma camada de calor; um pequeno script
+#   mostra apenas a camada da faixa do zoom atual, sem novas consultas ao servidor.
+# - Agrupamento de marcadores: as ocorrências são agregadas em células finas
+#   e agrupadas no navegador (Leaflet.markercluster); a contagem de cada grupo
+#   soma o peso das células, de forma que o total continue correto.
+# O HTML do mapa é gerado uma vez por estado dos filtros; como o texto é
+# idêntico entre execuções, o Streamlit reaproveita a mensagem já enviada.
+import os
+
+import folium
+from folium.plugins import FastMarkerCluster, HeatMap
+from folium.template import Template
+
+from spatial import MAP_MODES, aggregate_points, heat_data
+
+# Zoom inicial de cada faixa; cada faixa vai até o zoom anterior à seguinte
+TILE_ZOOMS = [0, 8, 10, 12, 14, 16]
+MAX_ZOOM = 19
+
+# Número máximo de células por faixa de zoom e de marcadores agrupados
+TILE_MAX_CELLS = int(os.environ.get("CRIME_APP_TILE_MAX_CELLS", "5000"))
+CLUSTER_MAX_POINTS = int(os.environ.get("CRIME_APP_CLUSTER_MAX_POINTS", "20000"))
+
+# Zoom cuja resolução é usada para as células dos marcadores agrupados
+CLUSTER_ZOOM = 17
+
+# Marcador de uma célula, com o número de ocorrências guardado nas opções
+_CLUSTER_CALLBACK = """
+function (row) {
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {
+        radius: 5, color: '#1E3A8A', fillOpacity: 0.7, count: row[2]
+    });
+    marker.bindTooltip(row[2] + ' ocorrência(s)');
+    return marker;
+};
+"""
+
+# Ícone do grupo com a soma das ocorrências das células agrupadas
+_CLUSTER_ICON = """
+function (cluster) {
+    var total = 0;
+    cluster.getAllChildMarkers().forEach(function (marker) { total += marker.options.count || 1; });
+    var size = total < 100 ? 'small' : (total < 1000 ? 'medium' : 'large');
+    return L.divIcon({
+        html: '<div><span>' + total + '</span></div>',
+        className: 'marker-cluster marker-cluster-' + size,
+        iconSize: new L.Point(40, 40)
+    });
+}
+"""
+
+
+class ZoomLayerSwitch(folium.MacroElement):
+    # Mostra no mapa apenas a camada cuja faixa contém o zoom atual
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var map = {{ this._parent.get_name() }};
+            var bands = [
+                {%- for layer, min_zoom, max_zoom in this.bands %}
+                [{{ layer.get_name() }}, {{ min_zoom }}, {{ max_zoom }}]{% if not loop.last %},{% endif %}
+                {%- endfor %}
+            ];
+            function update() {
+                var zoom = map.getZoom();
+                bands.forEach(function (band) {
+                    var visible = zoom >= band[1] && zoom <= band[2];
+                    if (visible && !map.hasLayer(band[0])) { map.addLayer(band[0]); }
+                    if (!visible && map.hasLayer(band[0])) { map.removeLayer(band[0]); }
+                });
+            }
+            map.on('zoomend', update);
+            update();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, bands):
+        super().__init__()
+        self._name = 'ZoomLayerSwitch'
+        self.bands = bands
+
+
+# Função para agregar os pontos uma vez por faixa de zoom; retorna
+# (zoom mínimo, zoom máximo, dados do HeatMap) para cada faixa
+def density_tiles(lat, lon, zooms=TILE_ZOOMS, max_cells=TILE_MAX_CELLS):
+    tiles = []
+    for i, min_zoom in enumerate(zooms):
+        max_zoom = zooms[i + 1] - 1 if i + 1 < len(zooms) else MAX_ZOOM
+        cell_lat, cell_lon, weights = aggregate_points(lat, lon, 'grid', min_zoom, max_cells)
+        tiles.append((min_zoom, max_zoom, heat_data(cell_lat, cell_lon, weights)))
+    return tiles
+
+
+# Função para adicionar ao mapa as camadas de densidade por faixa de zoom
+def add_density_tiles(m, lat, lon):
+    bands = []
+    for min_zoom, max_zoom, data in density_tiles(lat, lon):
+        layer = HeatMap(data, name=f"Zoom {min_zoom}–{max_zoom}", control=False, show=False)
+        layer.add_to(m)
+        bands.append((layer, min_zoom, max_zoom))
+    ZoomLayerSwitch(bands).add_to(m)
+    return len(bands)
+
+
+# Função para adicionar ao mapa os marcadores agrupados (células finas com
+# o número de ocorrências de cada uma); retorna o número de marcadores
+def add_marker_clusters(m, lat, lon, max_points=CLUSTER_MAX_POINTS):
+    cell_lat, cell_lon, weights = aggregate_points(lat, lon, 'grid', CLUSTER_ZOOM, max_points)
+    data = [[round(float(a), 6), round(float(b), 6), int(w)] for a, b, w in zip(cell_lat, cell_lon, weights)]
+    FastMarkerCluster(
+        data,
+        callback=_CLUSTER_CALLBACK,
+        icon_create_function=_CLUSTER_ICON,
+        name="Ocorrências",
+        control=False
+    ).add_to(m)
+    return len(data)
+
+
+# Função para gerar o HTML completo do mapa, com altura fixa
+def map_html(m, height=700):
+    figure = folium.Figure(height=height)
+    figure.add_child(m)
+    return figure.render()
@@ -0,0 +1,237 @@
+# Relatório em lote, sem o Streamlit.
+# Lê todas as planilhas mensais (.xlsx) de um diretório, aplica os mesmos
+# filtros do aplicativo, gera os gráficos e grava as exportações em Excel e
+# PowerPoint. Cada mês é ingerido e filtrado em um processo separado; os
+# resultados filtrados são combinados no processo principal.
+#
+# Uso:
+#   python report.py planilhas/ --output relatorio/ --filters filtros.json
+#   python report.py planilhas/ --crime FURTO --crime ROUBO --start 2024-01-01
+#   python report.py planilhas/ --sectors setores.geojson --sector "Setor 1"
+#
+# O arquivo de filtros (JSON) aceita as chaves start_date, end_date (AAAA-MM-DD),
+# crime_type, location, unit, sector (listas), keywords (texto) e months
+# (lista de meses a incluir); as opções da linha de comando têm prioridade.
+# As palavras-chave usam a mesma sintaxe de busca do aplicativo (índice de
+# texto) e o filtro de setores exige os limites dos setores (--sectors).
+import argparse
+import datetime
+import json
+import os
+import re
+import sys
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis import (
+    create_bar_chart, create_comparative_bar_chart, create_crime_analysis, create_pie_chart,
+    filter_data, set_message_handlers
+)
+from combined import CombinedView
+from cube import CountCube
+from exports import excel_bytes, ppt_bytes
+from ingest import cache_path, ingest
+from schema import MESES
+from sectors import SECTOR_COLUMN, SectorMap
+from text_index import TEXT_INDEX_SUFFIX, MultiTextIndex, load_or_build
+
+# Processos usados para ingerir e filtrar os meses
+REPORT_WORKERS = int(os.environ.get("CRIME_APP_REPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+FILTER_KEYS = ['start_date', 'end_date', 'crime_type', 'location', 'unit', 'keywords', 'sector', 'months']
+
+
+# Função para remover acentos e padronizar um texto para comparação
+def _normalize(text):
+    text = unicodedata.normalize('NFKD', str(text))
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+# Função para identificar o mês de referência pelo nome do arquivo: nome do
+# mês (ex.: "ocorrencias_marco.xlsx") ou ano-mês (ex.: "2024-03.xlsx")
+def month_from_filename(path):
+    name = _normalize(os.path.splitext(os.path.basename(path))[0])
+    for month in MESES:
+        if re.search(rf"(?<![a-z]){_normalize(month)}(?![a-z])", name):
+            return month
+
+    match = re.search(r"(?<!\d)(?:\d{4}[-_.](0?[1-9]|1[0-2])|(0?[1-9]|1[0-2])[-_.]\d{4})(?!\d)", name)
+    if match:
+        return MESES[int(match.group(1) or match.group(2)) - 1]
+    return None
+
+
+# Função para listar as planilhas do diretório com o mês de cada uma
+def find_spreadsheets(directory):
+    spreadsheets = {}
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.lower().endswith('.xlsx') or file_name.startswith('~$'):
+            continue
+        path = os.path.join(directory, file_name)
+        month = month_from_filename(path)
+        if month is None:
+            print(f"Ignorando {file_name}: mês de referência não identificado no nome.", file=sys.stderr)
+        elif month in spreadsheets:
+            print(f"Ignorando {file_name}: já existe uma planilha para {month}.", file=sys.stderr)
+        else:
+            spreadsheets[month] = path
+    # Ordem do calendário, como no aplicativo
+    return {month: spreadsheets[month] for month in MESES if month in spreadsheets}
+
+
+# Função para montar os filtros a partir do arquivo JSON e dos argumentos
+def load_filters(args):
+    filters = {}
+    if args.filters:
+        with open(args.filters, encoding='utf-8') as fh:
+            filters = json.load(fh)
+        unknown = sorted(set(filters) - set(FILTER_KEYS))
+        if unknown:
+            raise ValueError(f"Chaves de filtro desconhecidas: {', '.join(unknown)}")
+
+    overrides = {
+        'start_date': args.start, 'end_date': args.end, 'crime_type': args.crime,
+        'location': args.location, 'unit': args.unit, 'keywords': args.keywords,
+        'sector': args.sector, 'months': args.month,
+    }
+    filters.update({key: value for key, value in overrides.items() if value})
+
+    for key in ('start_date', 'end_date'):
+        if filters.get(key):
+            filters[key] = datetime.date.fromisoformat(str(filters[key]))
+    return filters
+
+
+# Função para ler os limites dos setores (GeoJSON)
+def load_sector_map(path):
+    with open(path, 'rb') as fh:
+        return SectorMap.from_geojson(fh.read())
+
+
+# Função executada em cada processo: ingere e filtra um mês. O índice de texto
+# é salvo ao lado do snapshot do mês, como no aplicativo, e os setores são
+# atribuídos quando os limites foram informados
+def process_month(month, path, filters, sector_map=None):
+    df = ingest(path, month)
+    text_index = None
+    if filters.get('keywords'):
+        # MultiTextIndex confere as frases entre aspas no texto, como no aplicativo
+        text_index = MultiTextIndex([
+            (load_or_build(df, cache_path(df.attrs['dataset_key'], TEXT_INDEX_SUFFIX)), df)
+        ])
+    if sector_map is not None:
+        df[SECTOR_COLUMN] = sector_map.categorical(sector_map.sector_codes(df))
+
+    filtered = filter_data(
+        df,
+        filters.get('start_date'),
+        filters.get('end_date'),
+        filters.get('crime_type'),
+        filters.get('location'),
+        filters.get('unit'),
+        filters.get('keywords'),
+        text_index=text_index,
+        sector=filters.get('sector'),
+    )
+    return month, len(df), filtered
+
+
+# Função para processar os meses em paralelo; retorna os DataFrames filtrados
+# na ordem dos meses e o total de registros lidos
+def process_months(spreadsheets, filters, workers=REPORT_WORKERS, sector_map=None):
+    results = {}
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(spreadsheets)))) as pool:
+        futures = [
+            pool.submit(process_month, month, path, filters, sector_map) for month, path in spreadsheets.items()
+        ]
+        for future in futures:
+            month, rows, filtered = future.result()
+            print(f"{month}: {len(filtered)} de {rows} registros após os filtros.", file=sys.stderr)
+            results[month] = filtered
+            total_rows += rows
+    return {month: results[month] for month in spreadsheets}, total_rows
+
+
+# Função para gerar o relatório completo; retorna os caminhos dos arquivos gravados
+def build_report(directory, output, filters, workers=REPORT_WORKERS, excel=True, ppt=True, sector_map=None):
+    if filters.get('sector') and sector_map is None:
+        raise ValueError("O filtro de setores exige o arquivo de limites dos setores (--sectors).")
+
+    spreadsheets = find_spreadsheets(directory)
+    if filters.get('months'):
+        spreadsheets = {month: path for month, path in spreadsheets.items() if month in filters['months']}
+    if not spreadsheets:
+        raise ValueError(f"Nenhuma planilha mensal encontrada em {directory}.")
+
+    frames, total_rows = process_months(spreadsheets, filters, workers, sector_map)
+    df = CombinedView.build(frames).df
+    print(f"Total: {len(df)} de {total_rows} registros após os filtros.", file=sys.stderr)
+
+    os.makedirs(output, exist_ok=True)
+    written = []
+
+    if excel:
+        path = os.path.join(output, "analise_criminal.xlsx")
+        with open(path, "wb") as fh:
+            fh.write(excel_bytes(df).getvalue())
+        written.append(path)
+
+    if ppt and not df.empty:
+        bar_fig = create_bar_chart(df, 'EVENTO', "Ocorrências por Tipo de Crime")
+        pie_fig = create_pie_chart(df, 'EVENTO', "Proporção por Tipo de Crime")
+        analysis_fig = create_crime_analysis(df)
+        comparative_fig = (
+            create_comparative_bar_chart(CountCube.build(df), 'EVENTO') if len(frames) > 1 else None
+        )
+
+        path = os.path.join(output, "apresentacao_criminal.pptx")
+        with open(path, "wb") as fh:
+            fh.write(ppt_bytes(df, bar_fig, pie_fig, analysis_fig, comparative_fig).getvalue())
+        written.append(path)
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera o relatório mensal de ocorrências sem a interface.")
+    parser.add_argument("directory", help="diretório com as planilhas mensais (.xlsx)")
+    parser.add_argument("--output", default="relatorio", help="diretório de saída (padrão: relatorio)")
+    parser.add_argument("--filters", help="arquivo JSON com os filtros")
+    parser.add_argument("--start", help="data inicial (AAAA-MM-DD)")
+    parser.add_argument("--end", help="data final (AAAA-MM-DD)")
+    parser.add_argument("--crime", action="append", help="tipo de crime (pode repetir)")
+    parser.add_argument("--location", action="append", help="área urbana (pode repetir)")
+    parser.add_argument("--unit", action="append", help="unidade responsável (pode repetir)")
+    parser.add_argument("--keywords", help="palavras-chave nos históricos e evoluções")
+    parser.add_argument("--sectors", help="limites dos setores de policiamento (GeoJSON)")
+    parser.add_argument("--sector", action="append", help="setor de policiamento (pode repetir)")
+    parser.add_argument("--month", action="append", choices=MESES, help="mês a incluir (pode repetir)")
+    parser.add_argument("--workers", type=int, default=REPORT_WORKERS, help="processos para os meses")
+    parser.add_argument("--no-excel", action="store_true", help="não gerar a planilha Excel")
+    parser.add_argument("--no-ppt", action="store_true", help="não gerar a apresentação PowerPoint")
+    args = parser.parse_args(argv)
+
+    set_message_handlers(
+        warning=lambda message: print(f"Aviso: {message}", file=sys.stderr),
+        error=lambda message: print(f"Erro: {message}", file=sys.stderr),
+    )
+
+    try:
+        filters = load_filters(args)
+        sector_map = load_sector_map(args.sectors) if args.sectors else None
+        written = build_report(
+            args.directory, args.output, filters, args.workers,
+            excel=not args.no_excel, ppt=not args.no_ppt, sector_map=sector_map
+        )
+    except (OSError, ValueError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+
+    for path in written:
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# Esquema de tipos compactos do DataFrame de ocorrências.
+# Colunas repetitivas viram categorias, números são reduzidos ao menor tipo
+# possível e as coordenadas usam float32.
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Meses do ano (também usados como dicionário fixo de MES_REFERENCIA)
+MESES = [
+    "Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+    "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"
+]
+
+# Colunas armazenadas como categorias
+CATEGORICAL_COLUMNS = [
+    'EVENTO',
+    'ÁREA URBANA',
+    'MUNICÍPIO',
+    'BAIRRO',
+    'LOGRADOURO',
+    'UNIDADE DA VIATURA',
+    'CIRCUNSTÂNCIA',
+    'DATA DE INÍCIO DO ATENDIMENTO',
+    'HORA DE INÍCIO DO ATENDIMENTO',
+    'MES_REFERENCIA',
+]
+
+# Colunas inteiras reduzidas ao menor tipo que comporta os valores
+INTEGER_COLUMNS = ['ID']
+
+# Coordenadas em float32 (precisão de ~1 m, suficiente para os mapas)
+FLOAT32_COLUMNS = ['COORDENADA X', 'COORDENADA y']
+
+# Colunas auxiliares calculadas na carga (não existem na planilha original e
+# não são exportadas)
+HELPER_COLUMNS = ['HORA', 'DIA_SEMANA']
+
+
+# Função para aplicar o esquema a um DataFrame (pode ser chamada mais de uma vez)
+def apply_schema(df):
+    for column in CATEGORICAL_COLUMNS:
+        if column not in df.columns or isinstance(df[column].dtype, pd.CategoricalDtype):
+            continue
+        if column == 'MES_REFERENCIA':
+            # Dicionário fixo de meses, idêntico em todas as planilhas
+            extra = sorted(set(df[column].dropna().astype(str)) - set(MESES))
+            df[column] = pd.Categorical(df[column], categories=MESES + extra)
+        else:
+            df[column] = df[column].astype('category')
+
+    for column in INTEGER_COLUMNS:
+        if column in df.columns:
+            df[column] = _downcast_integer(df[column])
+
+    for column in FLOAT32_COLUMNS:
+        if column in df.columns and df[column].dtype != 'float32':
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float32')
+
+    add_time_codes(df)
+    return df
+
+
+# Função para pré-calcular a hora e o dia da semana de cada ocorrência como
+# códigos int8 (-1 quando não há data/hora), usados pela análise temporal
+def add_time_codes(df):
+    if 'DATA_HORA' not in df.columns:
+        return df
+    if 'HORA' not in df.columns:
+        df['HORA'] = df['DATA_HORA'].dt.hour.fillna(-1).astype('int8')
+    if 'DIA_SEMANA' not in df.columns:
+        df['DIA_SEMANA'] = df['DATA_HORA'].dt.dayofweek.fillna(-1).astype('int8')
+    return df
+
+
+# Função para reduzir uma coluna inteira (ou float sem casas decimais) ao menor tipo
+def _downcast_integer(series):
+    numeric = pd.to_numeric(series, errors='coerce')
+    if numeric.isna().any() or not (numeric == numeric.round()).all():
+        return numeric
+    return pd.to_numeric(numeric.astype('int64'), downcast='integer')
+
+
+# Função para unificar os dicionários das colunas categóricas entre os meses
+# carregados, de forma que a concatenação mantenha o tipo categórico
+def align_categories(dataframes):
+    frames = [df for df in dataframes.values() if not df.empty]
+
+    for column in CATEGORICAL_COLUMNS:
+        categoricals = [
+            df[column] for df in frames
+            if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype)
+        ]
+        if len(categoricals) < 2:
+            continue
+
+        first = categoricals[0].cat.categories
+        if all(first.equals(series.cat.categories) for series in categoricals[1:]):
+            continue
+
+        categories = union_categoricals(categoricals, ignore_order=True).categories
+        if column != 'MES_REFERENCIA':
+            categories = categories.sort_values()
+
+        for df in frames:
+            if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].cat.set_categories(categories)
+
+    return dataframes
+
+
+# Função para contar valores de uma coluna, ignorando categorias sem ocorrências
+def count_values(series):
+    counts = series.value_counts()
+    return counts[counts > 0]
+
+
+# Função para gerar o relatório de memória por coluna de um DataFrame
+def memory_report(df):
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'Coluna': [f"{column} (auxiliar)" if column in HELPER_COLUMNS else column for column in usage.index],
+        'Tipo': [str(df[column].dtype) for column in usage.index],
+        'Memória (MB)': (usage.values / (1024 * 1024)).round(2),
+    })
+    return report.sort_values('Memória (MB)', ascending=False).reset_index(drop=True)
+
+
+# Função para obter a memória total de um DataFrame em MB
+def memory_mb(df):
+    return df.memory_usage(deep=True, index=True).sum() / (1024 * 1024)
@@ -0,0 +1,154 @@
+# Setores de policiamento a partir de limites em GeoJSON.
+# Cada polígono (ou parte de um MultiPolygon) guarda seus anéis e o retângulo
+# envolvente. Para atribuir os setores, os pontos são ordenados uma única vez
+# pela longitude (índice de retângulos envolventes): cada polígono consulta
+# apenas a faixa de pontos dentro do seu retângulo por busca binária e testa
+# esses candidatos com o algoritmo de raio (regra par-ímpar, que também trata
+# os buracos), de forma vetorizada por aresta.
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from spatial import extract_points
+
+# Coluna com o setor atribuído a cada ocorrência
+SECTOR_COLUMN = 'SETOR'
+
+# Propriedades do GeoJSON procuradas, em ordem, para o nome do setor
+NAME_PROPERTIES = ['SETOR', 'setor', 'Setor', 'NOME', 'nome', 'Nome', 'NAME', 'name', 'Name', 'id']
+
+
+# Função para obter o nome do setor a partir das propriedades de uma feição
+def _feature_name(feature, position):
+    properties = feature.get('properties') or {}
+    for name in NAME_PROPERTIES:
+        value = properties.get(name)
+        if value not in (None, ''):
+            return str(value)
+    if feature.get('id') not in (None, ''):
+        return str(feature['id'])
+    return f"Setor {position + 1}"
+
+
+# Função para listar os polígonos de uma geometria (cada um é uma lista de
+# anéis [lon, lat]: o contorno externo seguido dos buracos)
+def _geometry_polygons(geometry):
+    if not geometry:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return list(geometry['coordinates'])
+    if geometry['type'] == 'GeometryCollection':
+        return [polygon for part in geometry['geometries'] for polygon in _geometry_polygons(part)]
+    return []
+
+
+class SectorMap:
+    def __init__(self, names, parts, key):
+        # Nomes dos setores, partes (setor, anéis, retângulo envolvente) e a
+        # chave do conteúdo do arquivo (identifica o mapa nos caches)
+        self.names = names
+        self.parts = parts
+        self.key = key
+
+    def __len__(self):
+        return len(self.names)
+
+    # Função para ler os setores de um arquivo GeoJSON (bytes, texto ou dicionário)
+    @classmethod
+    def from_geojson(cls, source):
+        if isinstance(source, dict):
+            content = json.dumps(source, sort_keys=True).encode('utf-8')
+            data = source
+        else:
+            content = source.encode('utf-8') if isinstance(source, str) else bytes(source)
+            data = json.loads(content)
+
+        if data.get('type') == 'FeatureCollection':
+            features = data.get('features') or []
+        elif data.get('type') == 'Feature':
+            features = [data]
+        else:
+            features = [{'type': 'Feature', 'geometry': data, 'properties': {}}]
+
+        names = []
+        positions = {}
+        parts = []
+        for position, feature in enumerate(features):
+            polygons = _geometry_polygons(feature.get('geometry'))
+            if not polygons:
+                continue
+
+            # Feições com o mesmo nome formam um único setor
+            name = _feature_name(feature, position)
+            if name not in positions:
+                positions[name] = len(names)
+                names.append(name)
+
+            for polygon in polygons:
+                rings = [np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon if len(ring) >= 3]
+                if not rings:
+                    continue
+                outer = rings[0]
+                bbox = (outer[:, 0].min(), outer[:, 1].min(), outer[:, 0].max(), outer[:, 1].max())
+                parts.append((positions[name], rings, bbox))
+
+        if not parts:
+            raise ValueError("O arquivo não contém polígonos de setores.")
+
+        return cls(names, parts, hashlib.sha256(content).hexdigest()[:32])
+
+    # Função para atribuir o setor de cada ponto (-1 fora de todos os setores;
+    # em sobreposições vale o primeiro setor do arquivo)
+    def assign(self, lat, lon):
+        codes = np.full(len(lat), -1, dtype=np.int32)
+        if len(lat) == 0:
+            return codes
+
+        order = np.argsort(lon, kind='stable')
+        sorted_lon = lon[order]
+
+        for sector, rings, (min_lon, min_lat, max_lon, max_lat) in self.parts:
+            start = np.searchsorted(sorted_lon, min_lon, side='left')
+            stop = np.searchsorted(sorted_lon, max_lon, side='right')
+            candidates = order[start:stop]
+            candidates = candidates[
+                (codes[candidates] < 0) & (lat[candidates] >= min_lat) & (lat[candidates] <= max_lat)
+            ]
+            if len(candidates) == 0:
+                continue
+
+            inside = points_in_rings(lon[candidates], lat[candidates], rings)
+            codes[candidates[inside]] = sector
+
+        return codes
+
+    # Função para obter a coluna de setores (categórica) de um DataFrame de ocorrências
+    def sector_codes(self, df):
+        lat, lon, valid = extract_points(df, with_mask=True)
+        codes = np.full(len(df), -1, dtype=np.int32)
+        codes[valid] = self.assign(lat, lon)
+        return codes
+
+    # Função para converter códigos de setor em coluna categórica
+    def categorical(self, codes):
+        return pd.Categorical.from_codes(codes, categories=self.names)
+
+
+# Função para testar quais pontos estão dentro de um polígono com buracos
+# (regra par-ímpar sobre todos os anéis, vetorizada sobre os pontos)
+def points_in_rings(x, y, rings):
+    inside = np.zeros(len(x), dtype=bool)
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        for ax, ay, bx, by in zip(x1, y1, x2, y2):
+            if ay == by:
+                continue
+            crosses = (ay > y) != (by > y)
+            x_cross = ax + (y - ay) * (bx - ax) / (by - ay)
+            inside ^= crosses & (x < x_cross)
+    return inside
@@ -0,0 +1,131 @@
+# Preparação dos pontos do mapa de calor.
+# As coordenadas são extraídas de forma vetorizada (sem alterar o DataFrame de
+# origem) e podem ser agregadas no servidor em células de grade ou hexágonos,
+# com peso igual ao número de ocorrências. O tamanho da célula acompanha o
+# nível de zoom e é aumentado até que o número de células fique dentro do
+# limite, de modo que o HTML enviado ao navegador tenha tamanho limitado.
+import os
+
+import numpy as np
+import pandas as pd
+
+# Número máximo de pontos enviados ao mapa de calor
+MAX_HEAT_POINTS = int(os.environ.get("CRIME_APP_MAX_HEAT_POINTS", "20000"))
+
+# Largura aproximada da célula em pixels de tela no zoom escolhido
+CELL_PIXELS = 6
+
+# Modos de agregação disponíveis
+AGGREGATIONS = ['points', 'grid', 'hex']
+
+# Modos do mapa (chave -> rótulo exibido); as camadas ficam em map_tiles
+MAP_MODES = {
+    'heat': "Mapa de calor",
+    'tiles': "Densidade por nível de zoom",
+    'cluster': "Agrupamento de marcadores",
+}
+
+_SQRT3 = np.sqrt(3.0)
+
+
+# Função para contar os pontos por célula a partir dos índices inteiros das
+# células (combinados em uma única chave para um np.unique unidimensional)
+def _count_cells(first, second):
+    first_min, second_min = first.min(), second.min()
+    width = second.max() - second_min + 1
+    keys, weights = np.unique((first - first_min) * width + (second - second_min), return_counts=True)
+    return keys // width + first_min, keys % width + second_min, weights
+
+
+# Função para extrair latitude e longitude válidas de um DataFrame
+# (com with_mask, retorna também a máscara das linhas com coordenadas válidas)
+def extract_points(df, x_column='COORDENADA X', y_column='COORDENADA y', with_mask=False):
+    lon = pd.to_numeric(df[x_column], errors='coerce').to_numpy(dtype=np.float64)
+    lat = pd.to_numeric(df[y_column], errors='coerce').to_numpy(dtype=np.float64)
+
+    valid = (
+        np.isfinite(lat) & np.isfinite(lon) &
+        (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+    )
+    if with_mask:
+        return lat[valid], lon[valid], valid
+    return lat[valid], lon[valid]
+
+
+# Função para calcular o tamanho da célula (em graus de longitude) para um zoom
+def cell_size_for_zoom(zoom, cell_pixels=CELL_PIXELS):
+    return cell_pixels * 360.0 / (256 * 2 ** zoom)
+
+
+# Função para estimar o nível de zoom que enquadra todos os pontos
+def zoom_for_points(lat, lon, min_zoom=3, max_zoom=16):
+    if len(lat) == 0:
+        return 12
+    span = max(np.ptp(lon), np.ptp(lat) / max(np.cos(np.radians(np.mean(lat))), 0.1), 1e-6)
+    zoom = int(np.floor(np.log2(360.0 / span)))
+    return int(np.clip(zoom, min_zoom, max_zoom))
+
+
+# Função para agregar os pontos em uma grade regular
+def grid_bin(lat, lon, cell_size):
+    # Na projeção do mapa um grau de latitude ocupa mais pixels fora do equador
+    lat_size = cell_size * max(np.cos(np.radians(np.mean(lat))), 0.1)
+    row = np.floor(lat / lat_size).astype(np.int64)
+    col = np.floor(lon / cell_size).astype(np.int64)
+
+    row, col, weights = _count_cells(row, col)
+    return (row + 0.5) * lat_size, (col + 0.5) * cell_size, weights
+
+
+# Função para agregar os pontos em hexágonos (coordenadas axiais, topo pontudo)
+def hex_bin(lat, lon, cell_size):
+    scale = max(np.cos(np.radians(np.mean(lat))), 0.1)
+    size = cell_size / _SQRT3
+    x = lon / size
+    y = lat / (size * scale)
+
+    q = (_SQRT3 / 3 * x - y / 3)
+    r = (2.0 / 3 * y)
+
+    # Arredondamento para o hexágono mais próximo em coordenadas cúbicas
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+
+    rq, rr, weights = _count_cells(rq.astype(np.int64), rr.astype(np.int64))
+    center_x = size * (_SQRT3 * rq + _SQRT3 / 2 * rr)
+    center_y = size * scale * (1.5 * rr)
+    return center_y, center_x, weights
+
+
+# Função para reduzir os pontos ao modo de agregação escolhido, aumentando a
+# célula até que o número de pontos respeite o limite
+def aggregate_points(lat, lon, method='points', zoom=12, max_points=MAX_HEAT_POINTS):
+    if method not in AGGREGATIONS:
+        raise ValueError(f"Modo de agregação desconhecido: {method}")
+
+    if method == 'points' and len(lat) <= max_points:
+        return lat, lon, np.ones(len(lat), dtype=np.int64)
+    if len(lat) == 0:
+        return lat, lon, np.zeros(0, dtype=np.int64)
+
+    binner = hex_bin if method == 'hex' else grid_bin
+    cell_size = cell_size_for_zoom(zoom)
+    while True:
+        cell_lat, cell_lon, weights = binner(lat, lon, cell_size)
+        if len(weights) <= max_points:
+            return cell_lat, cell_lon, weights
+        cell_size *= 2
+
+
+# Função para montar os dados do HeatMap ([lat, lon, intensidade]); os pesos
+# são comprimidos em escala logarítmica para que células pequenas continuem visíveis
+def heat_data(lat, lon, weights):
+    if len(weights) == 0:
+        return []
+    intensity = np.log1p(weights) / np.log1p(weights.max())
+    return np.column_stack([lat, lon, intensity]).round(6).tolist()
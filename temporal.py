@@ -0,0 +1,129 @@
+# Análise temporal das ocorrências.
+# A hora e o dia da semana de cada ocorrência são guardados como códigos
+# inteiros na carga (colunas HORA e DIA_SEMANA, -1 quando não há data/hora),
+# e todas as tabelas são obtidas por contagem vetorizada (np.bincount) sobre
+# esses códigos: matriz hora x dia da semana, séries diárias/semanais e
+# distribuição por turno de serviço para tipos de crime e unidades.
+# A matriz e os turnos também aceitam as células do cubo temporal (ver
+# cube.TEMPORAL_DIMENSIONS), com a contagem de cada célula como peso.
+import numpy as np
+import pandas as pd
+
+from unit_index import extract_units
+
+# Dias da semana na ordem de DATA_HORA.dt.dayofweek (segunda = 0)
+WEEKDAYS = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+# Turnos de serviço: nome, hora inicial e hora final (exclusiva)
+SHIFTS = [('Madrugada', 0, 6), ('Manhã', 6, 12), ('Tarde', 12, 18), ('Noite', 18, 24)]
+
+# Código do turno de cada hora do dia
+SHIFT_OF_HOUR = np.zeros(24, dtype=np.int8)
+for _code, (_name, _start, _end) in enumerate(SHIFTS):
+    SHIFT_OF_HOUR[_start:_end] = _code
+
+# Agregações das séries temporais (chave -> rótulo exibido)
+FREQUENCIES = {'D': "Diária", 'W': "Semanal"}
+
+
+# Função para obter os códigos de hora e dia da semana (usa as colunas
+# pré-calculadas na carga e, na falta delas, deriva de DATA_HORA)
+def time_codes(df):
+    if 'HORA' in df.columns and 'DIA_SEMANA' in df.columns:
+        return df['HORA'].to_numpy(), df['DIA_SEMANA'].to_numpy()
+    dates = df['DATA_HORA']
+    return (
+        dates.dt.hour.fillna(-1).to_numpy(dtype=np.int8),
+        dates.dt.dayofweek.fillna(-1).to_numpy(dtype=np.int8),
+    )
+
+
+# Função para contar códigos com np.bincount, com pesos opcionais (contagens
+# das células de um cubo) apenas nas posições válidas
+def _bincount(codes, valid, minlength, weights=None):
+    if weights is None:
+        return np.bincount(codes, minlength=minlength)
+    weights = np.asarray(weights, dtype=np.int64)[valid]
+    return np.bincount(codes, weights=weights, minlength=minlength).astype(np.int64)
+
+
+# Função para a matriz de ocorrências por dia da semana (linhas) e hora
+# (colunas); weights é a contagem de cada linha quando df são células de um cubo
+def hour_weekday_matrix(df, weights=None):
+    hours, weekdays = time_codes(df)
+    valid = (hours >= 0) & (weekdays >= 0)
+    cells = weekdays[valid].astype(np.int64) * 24 + hours[valid]
+    counts = _bincount(cells, valid, 7 * 24, weights).reshape(7, 24)
+    return pd.DataFrame(counts, index=pd.Index(WEEKDAYS, name='Dia da semana'),
+                        columns=pd.Index(range(24), name='Hora'))
+
+
+# Função para obter o código do turno de cada ocorrência (-1 sem data/hora)
+def shift_codes(df):
+    hours, _ = time_codes(df)
+    return np.where(hours >= 0, SHIFT_OF_HOUR[np.clip(hours, 0, 23)], -1)
+
+
+# Função para a tabela de ocorrências por categoria de uma coluna (linhas) e
+# turno (colunas). Na coluna de unidades, cada texto com várias unidades conta
+# para todas elas. weights funciona como em hour_weekday_matrix
+def shift_table(df, column, weights=None):
+    shifts = shift_codes(df)
+    series = df[column]
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy().astype(np.int64)
+        values = series.cat.categories
+    else:
+        codes, values = pd.factorize(series)
+        codes = codes.astype(np.int64)
+
+    valid = (codes >= 0) & (shifts >= 0)
+    n_shifts = len(SHIFTS)
+    counts = _bincount(
+        codes[valid] * n_shifts + shifts[valid], valid, len(values) * n_shifts, weights
+    ).reshape(len(values), n_shifts)
+
+    present = counts.sum(axis=1) > 0
+    table = pd.DataFrame(counts[present], index=pd.Index(values[present]).astype(str),
+                         columns=[name for name, _, _ in SHIFTS])
+
+    if column == 'UNIDADE DA VIATURA':
+        # Somar os textos de viatura por unidade individual
+        units = table.index.map(lambda text: [unit for unit in extract_units(text) if unit])
+        table = table.assign(_unit=units).explode('_unit').groupby('_unit').sum()
+
+    table.index.name = column
+    order = table.sum(axis=1).sort_values(ascending=False, kind='stable').index
+    return table.loc[order]
+
+
+# Função para a série de ocorrências por dia ou semana (semanas iniciando na
+# segunda-feira), com zeros nos intervalos sem ocorrências. Com column, a
+# série é separada pelas categorias informadas (colunas da tabela)
+def time_series(df, freq='D', column=None, categories=None):
+    days = df['DATA_HORA'].to_numpy(dtype='datetime64[ns]').astype('datetime64[D]')
+    valid = ~np.isnat(days)
+    day_numbers = days[valid].astype(np.int64)
+    if freq == 'W':
+        # 01/01/1970 foi uma quinta-feira: +3 alinha as semanas na segunda-feira
+        day_numbers = day_numbers - (day_numbers + 3) % 7
+    step = 7 if freq == 'W' else 1
+
+    if len(day_numbers) == 0:
+        return pd.DataFrame()
+
+    first = day_numbers.min()
+    buckets = (day_numbers - first) // step
+    n_buckets = int(buckets.max()) + 1
+    index = pd.DatetimeIndex(
+        (first + np.arange(n_buckets) * step).astype('datetime64[D]'), name='Data'
+    )
+
+    if column is None:
+        return pd.DataFrame({'Contagem': np.bincount(buckets, minlength=n_buckets)}, index=index)
+
+    labels = df[column].to_numpy()[valid]
+    series = {}
+    for category in categories if categories is not None else pd.unique(labels):
+        series[str(category)] = np.bincount(buckets[labels == category], minlength=n_buckets)
+    return pd.DataFrame(series, index=index)
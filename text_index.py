@@ -0,0 +1,283 @@
+# Índice invertido para busca por palavras-chave em HISTÓRICOS / EVOLUÇÕES.
+# O texto é normalizado (sem acentos, minúsculo) e dividido em termos; cada
+# termo aponta para as linhas em que aparece. A busca aceita:
+#   - termos separados por espaço (todos devem aparecer: E)
+#   - OR ou | entre grupos de termos (qualquer grupo: OU)
+#   - "frases entre aspas" (termos consecutivos)
+#   - prefixos terminados em * (ex.: furt*)
+# A busca é por palavras inteiras: partes de palavras exigem o * (furt* encontra
+# "furto" e "furtado"). Termos com mais de MAX_TOKEN_LENGTH caracteres não são
+# indexados; buscas sem nenhum termo (ex.: apenas pontuação) ou com termos
+# longos demais não usam o índice (ver is_indexable).
+import os
+import re
+import unicodedata
+import uuid
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+TEXT_COLUMNS = ['HISTÓRICOS', 'EVOLUÇÕES']
+
+# Arquivo salvo ao lado do snapshot do mês (mesma chave do cache de ingestão)
+TEXT_INDEX_SUFFIX = ".textidx.npz"
+
+# Incrementar sempre que a normalização ou o formato do índice mudar
+TEXT_INDEX_VERSION = 1
+
+# Linhas processadas por bloco durante a construção e tamanho máximo de termo
+BUILD_CHUNK_ROWS = 20000
+MAX_TOKEN_LENGTH = 40
+
+TOKEN_PATTERN = r'[0-9a-z]+'
+_TOKEN_RE = re.compile(TOKEN_PATTERN)
+_QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+_OR_RE = re.compile(r'\s+OR\s+|\|')
+
+
+# Função para normalizar uma coluna de texto (sem acentos e em minúsculas)
+def fold_series(series):
+    return (
+        series.astype(object).where(series.notna(), '').astype(str)
+        .str.normalize('NFKD')
+        .str.encode('ascii', 'ignore')
+        .str.decode('ascii')
+        .str.lower()
+    )
+
+
+# Função para normalizar um texto avulso (termos da busca)
+def fold_text(text):
+    text = unicodedata.normalize('NFKD', str(text))
+    return text.encode('ascii', 'ignore').decode('ascii').lower()
+
+
+class TextIndex:
+    def __init__(self, vocabulary, offsets, postings, n_rows):
+        # Termos em ordem alfabética; as linhas do termo i ficam em
+        # postings[offsets[i]:offsets[i + 1]], em ordem crescente
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.postings = postings
+        self.n_rows = n_rows
+
+    def __len__(self):
+        return self.n_rows
+
+    # Função para construir o índice a partir das colunas de texto livre
+    @classmethod
+    def build(cls, df, columns=TEXT_COLUMNS, chunk_rows=BUILD_CHUNK_ROWS):
+        columns = [column for column in columns if column in df.columns]
+        n_rows = len(df)
+        vocabulary = {}
+        keys = []
+
+        for start in range(0, n_rows, chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            text = None
+            for column in columns:
+                folded = fold_series(chunk[column])
+                text = folded if text is None else text + ' ' + folded
+            if text is None:
+                break
+
+            tokens = text.str.findall(TOKEN_PATTERN)
+            counts = tokens.str.len().to_numpy()
+            flat = list(chain.from_iterable(tokens))
+            if not flat:
+                continue
+
+            # Converter os termos do bloco em identificadores globais
+            local_codes, uniques = pd.factorize(pd.Series(flat, dtype=object))
+            global_ids = np.array(
+                [vocabulary.setdefault(term, len(vocabulary)) for term in uniques],
+                dtype=np.int64
+            )
+            rows = np.repeat(np.arange(start, start + len(chunk), dtype=np.int64), counts)
+            keys.append(np.unique(global_ids[local_codes] * n_rows + rows))
+
+        terms = np.array(list(vocabulary), dtype=object)
+        keep = np.array([len(term) <= MAX_TOKEN_LENGTH for term in terms], dtype=bool)
+
+        # Renumerar os termos em ordem alfabética para permitir busca por prefixo
+        order = np.argsort(terms.astype(str), kind='stable')
+        rank = np.full(len(terms), -1, dtype=np.int64)
+        kept_order = order[keep[order]]
+        rank[kept_order] = np.arange(len(kept_order))
+
+        if keys:
+            keys = np.concatenate(keys)
+            term_ids = rank[keys // n_rows]
+            rows = (keys % n_rows).astype(np.int32)
+            valid = term_ids >= 0
+            term_ids, rows = term_ids[valid], rows[valid]
+            sort = np.lexsort((rows, term_ids))
+            postings = rows[sort]
+            counts = np.bincount(term_ids, minlength=len(kept_order))
+        else:
+            postings = np.empty(0, dtype=np.int32)
+            counts = np.zeros(len(kept_order), dtype=np.int64)
+
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        vocabulary = terms[kept_order].astype(str) if len(kept_order) else np.empty(0, dtype=str)
+        return cls(vocabulary, offsets, postings, n_rows)
+
+    # Função para gravar o índice em disco (de forma atômica)
+    def save(self, path):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, 'wb') as fh:
+                np.savez(
+                    fh,
+                    version=np.array(TEXT_INDEX_VERSION),
+                    vocabulary=self.vocabulary,
+                    offsets=self.offsets,
+                    postings=self.postings,
+                    n_rows=np.array(self.n_rows)
+                )
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # Função para carregar um índice salvo (retorna None se inválido ou desatualizado)
+    @classmethod
+    def load(cls, path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data['version']) != TEXT_INDEX_VERSION:
+                    return None
+                return cls(data['vocabulary'], data['offsets'], data['postings'], int(data['n_rows']))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    # Função para obter as linhas de um termo exato
+    def term_rows(self, term):
+        position = np.searchsorted(self.vocabulary, term)
+        if position >= len(self.vocabulary) or self.vocabulary[position] != term:
+            return np.empty(0, dtype=np.int32)
+        return self.postings[self.offsets[position]:self.offsets[position + 1]]
+
+    # Função para obter a máscara das linhas com algum termo iniciado pelo prefixo
+    def prefix_mask(self, prefix):
+        start = np.searchsorted(self.vocabulary, prefix, side='left')
+        end = np.searchsorted(self.vocabulary, prefix + '\uffff', side='left')
+        mask = np.zeros(self.n_rows, dtype=bool)
+        if end > start:
+            mask[self.postings[self.offsets[start]:self.offsets[end]]] = True
+        return mask
+
+    # Função para obter a máscara das linhas que contêm todos os termos
+    def terms_mask(self, terms):
+        mask = np.ones(self.n_rows, dtype=bool)
+        for term in terms:
+            term_mask = np.zeros(self.n_rows, dtype=bool)
+            term_mask[self.term_rows(term)] = True
+            mask &= term_mask
+        return mask
+
+    # Função para avaliar uma busca e devolver a máscara das linhas encontradas.
+    # Com df informado, as frases são confirmadas no texto das linhas candidatas;
+    # sem df, equivalem a todos os seus termos
+    def query(self, text, df=None):
+        result = np.zeros(self.n_rows, dtype=bool)
+
+        for group in _OR_RE.split(text):
+            clauses = parse_clauses(group)
+            if not clauses:
+                continue
+
+            mask = np.ones(self.n_rows, dtype=bool)
+            for kind, terms in clauses:
+                if kind == 'prefix':
+                    mask &= self.prefix_mask(terms[0])
+                else:
+                    mask &= self.terms_mask(terms)
+                    if kind == 'phrase' and len(terms) > 1 and df is not None:
+                        mask = _verify_phrase(mask, terms, df)
+                if not mask.any():
+                    break
+
+            result |= mask
+
+        return result
+
+
+# Função para interpretar um grupo da busca em cláusulas (termo, prefixo ou frase)
+def parse_clauses(group):
+    clauses = []
+    for phrase, word in _QUERY_RE.findall(group):
+        raw = phrase if phrase else word
+        is_prefix = not phrase and raw.endswith('*')
+        terms = _TOKEN_RE.findall(fold_text(raw))
+        if not terms:
+            continue
+        if is_prefix and len(terms) == 1:
+            clauses.append(('prefix', terms))
+        elif len(terms) == 1:
+            clauses.append(('term', terms))
+        else:
+            # Palavras compostas (ex.: "mão-armada") são tratadas como frase
+            clauses.append(('phrase', terms))
+    return clauses
+
+
+# Função para verificar se o índice pode responder à busca: ela precisa ter
+# algum termo (buscas só com pontuação, ex.: "-", não têm) e nenhum termo mais
+# longo que MAX_TOKEN_LENGTH (esses termos não entram no índice)
+def is_indexable(text):
+    groups = [parse_clauses(group) for group in _OR_RE.split(text)]
+    terms = [term for clauses in groups for _, clause_terms in clauses for term in clause_terms]
+    return bool(terms) and all(len(term) <= MAX_TOKEN_LENGTH for term in terms)
+
+
+# Função para confirmar uma frase nas linhas candidatas (termos consecutivos
+# na mesma coluna)
+def _verify_phrase(mask, terms, df):
+    candidates = np.flatnonzero(mask)
+    if len(candidates) == 0:
+        return mask
+
+    pattern = r'(?<![0-9a-z])' + r'[^0-9a-z]+'.join(map(re.escape, terms)) + r'(?![0-9a-z])'
+    found = np.zeros(len(candidates), dtype=bool)
+    for column in TEXT_COLUMNS:
+        if column in df.columns:
+            folded = fold_series(df[column].iloc[candidates])
+            found |= folded.str.contains(pattern, regex=True).to_numpy()
+
+    verified = np.zeros(len(mask), dtype=bool)
+    verified[candidates[found]] = True
+    return verified
+
+
+# Função para carregar o índice salvo em path ou construí-lo (e salvá-lo)
+def load_or_build(df, path=None):
+    if path is not None and os.path.exists(path):
+        index = TextIndex.load(path)
+        if index is not None and len(index) == len(df):
+            return index
+
+    index = TextIndex.build(df)
+    if path is not None:
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            index.save(path)
+        except OSError:
+            pass
+    return index
+
+
+class MultiTextIndex:
+    def __init__(self, parts):
+        # Lista de (TextIndex, DataFrame do mês), na ordem de combinação
+        self.parts = parts
+
+    def __len__(self):
+        return sum(len(index) for index, _ in self.parts)
+
+    # Função para avaliar a busca em cada mês e juntar as máscaras
+    def query(self, text):
+        if not self.parts:
+            return np.zeros(0, dtype=bool)
+        return np.concatenate([index.query(text, df) for index, df in self.parts])
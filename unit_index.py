@@ -0,0 +1,85 @@
+# Índice de unidades responsáveis.
+# A coluna UNIDADE DA VIATURA pode conter várias unidades separadas por ";".
+# Em vez de separar o texto linha a linha a cada filtro, cada texto distinto é
+# separado uma única vez e cada unidade aponta para os códigos dos textos que a
+# contêm; o filtro vira uma consulta vetorizada sobre os códigos das linhas.
+import numpy as np
+import pandas as pd
+
+
+# Função para extrair unidades individuais de uma string com múltiplas unidades
+def extract_units(unit_string):
+    if pd.isna(unit_string):
+        return []
+
+    # Dividir por ponto e vírgula para separar múltiplas unidades
+    units = [unit.strip() for unit in str(unit_string).split(';')]
+    return units
+
+
+class UnitIndex:
+    def __init__(self, codes, n_values, unit_codes):
+        # Código do texto de unidade de cada linha (-1 para valores ausentes)
+        self.codes = codes
+        self.n_values = n_values
+        # Unidade -> códigos dos textos que contêm a unidade
+        self.unit_codes = unit_codes
+        self.units = sorted(unit_codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    # Função para construir o índice a partir da coluna de unidades
+    @classmethod
+    def build(cls, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy().astype(np.int32)
+            values = series.cat.categories
+        else:
+            codes, values = pd.factorize(series)
+            codes = codes.astype(np.int32)
+
+        # Considerar apenas os textos presentes nas linhas (as categorias podem
+        # ter sido unificadas com outros meses)
+        present = np.bincount(codes[codes >= 0], minlength=len(values)) > 0
+
+        unit_codes = {}
+        for code in np.flatnonzero(present):
+            for unit in extract_units(values[code]):
+                if unit:
+                    unit_codes.setdefault(unit, []).append(code)
+
+        unit_codes = {unit: np.asarray(found, dtype=np.int32) for unit, found in unit_codes.items()}
+        return cls(codes, len(values), unit_codes)
+
+    # Função para juntar índices de vários meses na ordem em que os DataFrames
+    # são concatenados, deslocando os códigos de cada mês
+    @classmethod
+    def concat(cls, indexes):
+        codes = []
+        unit_codes = {}
+        offset = 0
+
+        for index in indexes:
+            codes.append(np.where(index.codes >= 0, index.codes + offset, -1).astype(np.int32))
+            for unit, found in index.unit_codes.items():
+                unit_codes.setdefault(unit, []).append(found + offset)
+            offset += index.n_values
+
+        unit_codes = {unit: np.concatenate(found) for unit, found in unit_codes.items()}
+        codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int32)
+        return cls(codes, offset, unit_codes)
+
+    # Função para obter a máscara das linhas que contêm qualquer uma das unidades
+    def mask(self, selected_units):
+        # Tabela de consulta por código; a última posição atende os códigos -1
+        lookup = np.zeros(self.n_values + 1, dtype=bool)
+        for unit in selected_units:
+            found = self.unit_codes.get(unit)
+            if found is not None:
+                lookup[found] = True
+        return lookup[self.codes]
+
+    # Função para obter as posições das linhas que contêm uma unidade
+    def positions(self, unit):
+        return np.flatnonzero(self.mask([unit]))